@@ -0,0 +1,143 @@
+import random
+import sys
+import threading
+import time
+import types
+
+import pandas as pd
+
+from benchmark.synthetic import make_ohlcv, make_adjust_factors
+
+
+class FakeProvider:
+    """
+    本地假数据源：每次请求先等待 latency 秒（±jitter 比例的抖动），再以 failure_rate 的概率抛出连接错误
+    """
+
+    def __init__(self, name, latency=0.0, jitter=0.2, failure_rate=0.0, bars=2000, gap_rate=0.0, seed=0):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.bars = bars
+        self.gap_rate = gap_rate
+        self.seed = seed
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._frames = {}
+
+    def request(self):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise ConnectionError(f"{self.name} 模拟请求失败")
+
+    def history(self, symbol, market):
+        # 生成一次后缓存，同一只股票的多次请求返回同一段历史
+        key = (market, symbol)
+        if key not in self._frames:
+            self._frames[key] = make_ohlcv(symbol, market, self.bars, self.gap_rate, self.seed)
+        return self._frames[key]
+
+    def stats(self):
+        return {"requests": self.requests, "failures": self.failures}
+
+
+def _since(df, start_date):
+    return df[pd.to_datetime(df["日期"]) >= pd.Timestamp(start_date)].reset_index(drop=True)
+
+
+def fake_akshare(provider: FakeProvider, universe=50):
+    """
+    代替 akshare：只实现本项目用到的接口；全市场列表每个市场 universe 只股票
+    """
+    ak = types.ModuleType("akshare")
+
+    def stock_zh_a_spot_em():
+        provider.request()
+        codes = [f"{prefix}{i:04d}" for i, prefix in zip(range(universe), ["60", "00", "30"] * universe)]
+        return pd.DataFrame({"代码": codes, "名称": [f"模拟{code}" for code in codes]})
+
+    def stock_hk_main_board_spot_em():
+        provider.request()
+        codes = [f"{i + 1:05d}" for i in range(universe)]
+        return pd.DataFrame({"代码": codes, "名称": [f"模拟港股{code}" for code in codes]})
+
+    def stock_individual_info_em(symbol):
+        provider.request()
+        # 与东方财富一样带有请求时的最新价和市值
+        price = provider.history(symbol, "A")["收盘"].iloc[-1]
+        return pd.DataFrame({"item": ["最新", "股票代码", "股票简称", "总股本", "流通股", "总市值", "流通市值", "行业"],
+                             "value": [price, symbol, f"模拟{symbol}", 1e9, 8e8, 1e9 * price, 8e8 * price, "模拟行业"]})
+
+    def stock_zh_a_hist(symbol, period="daily", start_date="19700101", end_date="22220101", adjust=""):
+        provider.request()
+        return _since(provider.history(symbol, "A"), start_date)
+
+    def stock_zh_a_daily(symbol, adjust=""):
+        provider.request()
+        return make_adjust_factors(symbol, provider.bars, provider.seed)
+
+    def stock_hk_security_profile_em(symbol):
+        provider.request()
+        return pd.DataFrame([{"证券代码": symbol, "证券简称": f"模拟港股{symbol}", "上市日期": "2000-01-01"}])
+
+    def stock_hk_hist(symbol, period="daily", start_date="19700101", end_date="22220101", adjust=""):
+        provider.request()
+        return _since(provider.history(symbol, "HK"), start_date)
+
+    for func in (stock_zh_a_spot_em, stock_hk_main_board_spot_em, stock_individual_info_em, stock_zh_a_hist,
+                 stock_zh_a_daily, stock_hk_security_profile_em, stock_hk_hist):
+        setattr(ak, func.__name__, func)
+    return ak
+
+
+def fake_yfinance(provider: FakeProvider):
+    """
+    代替 yfinance：download 一次请求返回多只股票，Ticker / Tickers 的 info 每只股票一次请求
+    """
+    yf = types.ModuleType("yfinance")
+
+    def download(tickers, start=None, period=None, interval="1d", group_by="ticker", **kwargs):
+        provider.request()
+        symbols = [tickers] if isinstance(tickers, str) else list(tickers)
+        frames = {}
+        for symbol in symbols:
+            df = provider.history(symbol, "US")
+            frames[symbol] = df[df.index >= pd.Timestamp(start)] if start else df
+        # 与 yfinance 一样按日期升序合并各股票的交易日（随机停牌时各股票的日期不同）
+        return pd.concat(frames, axis=1, sort=True)
+
+    class Ticker:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        @property
+        def info(self):
+            provider.request()
+            return {"symbol": self.symbol, "displayName": f"Fake {self.symbol}", "sector": "Simulated"}
+
+    class Tickers:
+        def __init__(self, names):
+            self.tickers = {name: Ticker(name) for name in names.split()}
+
+    yf.download = download
+    yf.Ticker = Ticker
+    yf.Tickers = Tickers
+    return yf
+
+
+def install(eastmoney: FakeProvider, yahoo: FakeProvider):
+    """
+    在导入本项目模块之前调用，用假数据源替换 akshare / yfinance
+    """
+    sys.modules["akshare"] = fake_akshare(eastmoney)
+    sys.modules["yfinance"] = fake_yfinance(yahoo)
@@ -0,0 +1,118 @@
+"""
+启动开销检查：在全新的解释器中导入各入口模块，测量耗时并检查有没有提前加载重量级依赖；
+再用假的 akshare 跑一次只有 A 股 / 港股、输出 TXT 的流水线，确认 yfinance 和 openpyxl 始终没有被导入
+
+    python -m benchmark.imports
+
+超出预算或加载了不该加载的模块时以退出码 1 结束
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 需要检查的重量级模块
+HEAVY_MODULES = ("pandas", "numpy", "akshare", "yfinance", "openpyxl", "pybroker")
+
+# 入口模块：(导入耗时预算（秒）, 导入后不应出现的模块)
+# main 的预算包括 kivy 本身；没有安装 kivy 时跳过
+IMPORT_BUDGETS = {
+    "main": (1.0, HEAVY_MODULES),
+    "cli": (1.5, ("akshare", "yfinance", "openpyxl", "pybroker")),
+    "utils": (1.5, ("akshare", "yfinance", "openpyxl", "pybroker")),
+}
+
+# 只有 A 股、港股的 TXT 运行结束后不应出现的模块
+A_ONLY_FORBIDDEN = ("yfinance", "openpyxl", "pybroker")
+
+# 每个入口测量的次数，取最小值（第一次通常受磁盘缓存影响）
+REPEATS = 3
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started,
+                  "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+_PIPELINE_SCRIPT = """
+import asyncio, json, os, sys
+from benchmark.fakes import FakeProvider, fake_akshare
+
+sys.modules["akshare"] = fake_akshare(FakeProvider("eastmoney", bars=300))
+import utils
+
+if __name__ == "__main__":
+    os.chdir({workdir!r})
+    summary = asyncio.run(utils.runPipeline({codes!r}, lambda message: None, "txt", 2))
+    print(json.dumps({{"written": summary["written"],
+                      "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def runScript(script, cwd=REPO_ROOT):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE="1")
+    done = subprocess.run([sys.executable, "-c", script], cwd=cwd, env=env, capture_output=True, text=True)
+    if done.returncode != 0:
+        raise RuntimeError(done.stderr.strip().splitlines()[-1] if done.stderr.strip() else "子进程异常退出")
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def measureImport(module):
+    """
+    在全新的解释器中导入 module，返回 {"seconds": 最短耗时, "loaded": 导入后已加载的重量级模块}
+    """
+    runs = [runScript(_IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)) for _ in range(REPEATS)]
+    return {"seconds": min(run["seconds"] for run in runs), "loaded": runs[0]["loaded"]}
+
+
+def checkImports():
+    """
+    返回 (结果列表, 问题列表)；结果的格式与 benchmark.run 的其他条目一致
+    """
+    results = []
+    problems = []
+    for module, (budget, forbidden) in IMPORT_BUDGETS.items():
+        try:
+            measured = measureImport(module)
+        except RuntimeError as e:
+            # 如没有安装 kivy 的环境无法导入 main
+            print(f"跳过 {module}: {e}", file=sys.stderr)
+            continue
+        unexpected = [name for name in measured["loaded"] if name in forbidden]
+        results.append({"name": f"import_{module}", "symbols": 0, "seconds": round(measured["seconds"], 4),
+                        "budget": budget, "loaded": measured["loaded"]})
+        if measured["seconds"] > budget:
+            problems.append(f"导入 {module} 耗时 {measured['seconds']:.3f} 秒，超出预算 {budget} 秒")
+        if unexpected:
+            problems.append(f"导入 {module} 时提前加载了 {', '.join(unexpected)}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        codes = ["sh600000", "sz000001", "HK00700"]
+        run = runScript(_PIPELINE_SCRIPT.format(workdir=workdir, codes=codes, heavy=HEAVY_MODULES))
+    unexpected = [name for name in run["loaded"] if name in A_ONLY_FORBIDDEN]
+    results.append({"name": "a_only_run_modules", "symbols": len(codes), "seconds": 0.0,
+                    "written": run["written"], "loaded": run["loaded"]})
+    if run["written"] != len(codes):
+        problems.append(f"只有 A 股 / 港股的运行只生成了 {run['written']}/{len(codes)} 个文件")
+    if unexpected:
+        problems.append(f"只有 A 股 / 港股的 TXT 运行加载了 {', '.join(unexpected)}")
+    return results, problems
+
+
+def main():
+    results, problems = checkImports()
+    for item in results:
+        budget = f"（预算 {item['budget']} 秒）" if "budget" in item else ""
+        print(f"{item['name']:<22}{item['seconds']:>8.3f} 秒{budget}  已加载: {', '.join(item['loaded']) or '无'}")
+    for problem in problems:
+        print(f"问题: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+指标计算的内存检查：用 tracemalloc 测量单只股票完整历史计算的峰值内存（默认、低内存模式、低内存模式只算部分指标），
+并检查低内存模式相对 float64 结果的误差是否在 LEAN_ERROR_BOUND 以内
+
+    python -m benchmark.memory [--bars 5000]
+
+误差超出上限时以退出码 1 结束；实际运行时加 --lean，每只股票计算的峰值内存记入运行指标报告的 peak_bytes
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmark.synthetic import indicator_input
+
+# 低内存模式下只算部分指标时测量的指标
+SAMPLE_INDICATORS = ["MA5", "RSI6", "MACD", "OBV"]
+
+# 检查误差时使用的股票数（每个市场）
+ERROR_SYMBOLS = 20
+
+
+def measurePeak(func, *args, **kwargs):
+    """
+    返回 (峰值内存字节数, 耗时)；先调用一次预热（低内存模式的临时数组在这次分配后复用）
+    """
+    func(*args, **kwargs)
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        func(*args, **kwargs)
+        seconds = time.perf_counter() - started
+        return tracemalloc.get_traced_memory()[1], seconds
+    finally:
+        tracemalloc.stop()
+
+
+def leanError(market, bars, gap_rate):
+    """
+    低内存模式的最大误差：max|float32 - float64| / 该指标整段历史的 max|值|，取全部股票和指标的最大值
+    """
+    from compute_utils import LEAN_DTYPE, compute_indicator_arrays
+    from indicator_state import ohlcv_arrays
+
+    worst = 0.0
+    for i in range(ERROR_SYMBOLS):
+        _, high, low, close, volume = ohlcv_arrays(indicator_input(f"E{i}", market, bars, gap_rate), market)
+        exact = compute_indicator_arrays(close, high, low, volume, boll=market != "A")
+        lean = compute_indicator_arrays(close, high, low, volume, boll=market != "A", dtype=LEAN_DTYPE)
+        for name, values in exact.items():
+            valid = ~np.isnan(values)
+            scale = np.max(np.abs(values[valid])) if valid.any() else 0.0
+            if scale > 0:
+                worst = max(worst, float(np.max(np.abs(lean[name][valid] - values[valid])) / scale))
+    return worst
+
+
+def checkMemory(bars=5000, gap_rate=0.01):
+    """
+    返回 (结果列表, 问题列表)；结果的格式与 benchmark.run 的其他条目一致，peak_kb 为单只股票的峰值内存
+    """
+    from compute_utils import LEAN_ERROR_BOUND, compute_market_indicators
+    from rolling_kernels import thread_scratch
+
+    results = []
+    problems = []
+    for market in ("A", "HK", "US"):
+        df = indicator_input("M0", market, bars, gap_rate)
+        for name, kwargs in (("memory_full", {}),
+                             ("memory_lean", {"lean": True}),
+                             ("memory_lean_subset", {"lean": True, "indicators": SAMPLE_INDICATORS})):
+            peak, seconds = measurePeak(compute_market_indicators, df, "S", market, **kwargs)
+            results.append({"name": name, "market": market, "symbols": 1, "seconds": round(seconds, 4),
+                            "bars": bars, "peak_kb": round(peak / 1024, 1)})
+        error = leanError(market, bars, gap_rate)
+        results.append({"name": "lean_error", "market": market, "symbols": ERROR_SYMBOLS, "seconds": 0.0,
+                        "max_error": error, "bound": LEAN_ERROR_BOUND})
+        if error > LEAN_ERROR_BOUND:
+            problems.append(f"{market} 低内存模式误差 {error:.2e} 超出上限 {LEAN_ERROR_BOUND:.0e}")
+    results.append({"name": "lean_scratch", "symbols": 0, "seconds": 0.0,
+                    "scratch_kb": round(thread_scratch().nbytes / 1024, 1)})
+    return results, problems
+
+
+def describe(item):
+    if "peak_kb" in item:
+        return f"峰值 {item['peak_kb']:.1f} KB/只"
+    if "max_error" in item:
+        return f"最大误差 {item['max_error']:.2e}（上限 {item['bound']:.0e}）"
+    return f"复用的临时数组 {item['scratch_kb']:.1f} KB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="指标计算的峰值内存和低内存模式误差")
+    parser.add_argument("--bars", type=int, default=5000, help="每只股票的 K 线数")
+    parser.add_argument("--gap-rate", type=float, default=0.01, help="随机停牌（缺失交易日）的比例")
+    args = parser.parse_args(argv)
+    results, problems = checkMemory(args.bars, args.gap_rate)
+    for item in results:
+        print(f"{item['name']:<22}{item.get('market', ''):<4}{describe(item)}")
+    for problem in problems:
+        print(f"问题: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+离线性能基准：用合成行情和本地假数据源测量指标计算、完整流水线和两种文件输出的耗时，结果写入 JSON
+另外检查各入口模块的导入耗时预算（见 benchmark/imports.py），以及单只股票计算的峰值内存和低内存模式的误差（见 benchmark/memory.py）
+
+    python -m benchmark.run [--sizes 10 1000 10000] [--output benchmark_results.json] [--baseline 旧结果.json]
+
+--baseline 指定上一版本的结果时逐项对比，变慢超过 --tolerance 倍的项目会列出并以退出码 1 结束；
+导入检查、内存检查发现问题时同样以退出码 1 结束
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmark.fakes import FakeProvider, install
+from benchmark.imports import checkImports
+from benchmark.memory import checkMemory, describe
+from benchmark.synthetic import indicator_input
+
+# 流水线基准使用的数据源限制：放宽限速，测的是本项目自身的吞吐而不是限速器
+BENCH_LIMITS = {
+    "eastmoney": {"concurrency": 32, "rate": 10000.0, "burst": 10000},
+    "yahoo": {"concurrency": 32, "rate": 10000.0, "burst": 10000},
+}
+BENCH_RETRY_POLICY = {"max_retries": 10, "base_delay": 0.05, "max_delay": 0.5, "max_total_delay": 5.0}
+BENCH_BREAKER_POLICY = {"failure_threshold": 5, "reset_timeout": 1.0, "max_trips": 3}
+
+# 自选列表中各市场的比例
+MARKET_MIX = (("A", 0.6), ("HK", 0.2), ("US", 0.2))
+
+# 指标计算基准中循环使用的不同股票数（生成合成数据本身也要时间）
+DISTINCT_FRAMES = 100
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="离线性能基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000], help="股票数量")
+    parser.add_argument("--only", nargs="+", choices=["imports", "memory", "compute", "pipeline", "writers"],
+                        default=["imports", "memory", "compute", "pipeline", "writers"])
+    parser.add_argument("--bars", type=int, default=2000, help="每只股票的 K 线数")
+    parser.add_argument("--gap-rate", type=float, default=0.01, help="随机停牌（缺失交易日）的比例")
+    parser.add_argument("--latency", type=float, default=0.05, help="东方财富假数据源每次请求的延迟（秒）")
+    parser.add_argument("--yahoo-latency", type=float, default=0.2, help="Yahoo 假数据源每次请求的延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="假数据源请求失败的概率")
+    parser.add_argument("--concurrency", type=int, default=32, help="流水线抓取线程数")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="上一版本的结果文件")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="相对基线允许的耗时倍数")
+    return parser.parse_args(argv)
+
+
+def watchlist(size):
+    codes = []
+    for market, share in MARKET_MIX:
+        count = max(1, round(size * share)) if size >= len(MARKET_MIX) else (1 if market == "A" else 0)
+        for i in range(count):
+            if market == "A":
+                codes.append(f"sh{600000 + i:06d}")
+            elif market == "HK":
+                codes.append(f"HK{i:05d}")
+            else:
+                codes.append(f"USS{i}")
+    return codes[:size]
+
+
+def entry(name, symbols, seconds, **extra):
+    return {"name": name, "symbols": symbols, "seconds": round(seconds, 4),
+            "per_symbol_ms": round(seconds / max(symbols, 1) * 1000, 4), **extra}
+
+
+def benchCompute(size, args):
+    from compute_utils import compute_market_indicators, latest_window
+    from indicator_state import ohlcv_arrays
+    from panel import PANEL_MARKETS, Panel, panel_tail
+
+    results = []
+    for market, _ in MARKET_MIX:
+        frames = [indicator_input(f"S{i}", market, args.bars, args.gap_rate)
+                  for i in range(min(size, DISTINCT_FRAMES))]
+        for latest_only in (False, True):
+            start = time.perf_counter()
+            for i in range(size):
+                compute_market_indicators(frames[i % len(frames)], "S", market, latest_only=latest_only)
+            name = "compute_indicators_latest" if latest_only else "compute_indicators"
+            results.append(entry(name, size, time.perf_counter() - start, market=market, bars=args.bars))
+        if market in PANEL_MARKETS:
+            # 全市场模式：size 只股票拼成一个矩阵一起计算最新值，对比上面逐只计算的 latest
+            window = latest_window(market)
+            tails = [panel_tail(*ohlcv_arrays(frame, market), window) for frame in frames]
+            rows = [(f"S{i}", "", tails[i % len(tails)]) for i in range(size)]
+            start = time.perf_counter()
+            Panel.from_tails(market, rows, window).latest()
+            results.append(entry("compute_panel_latest", size, time.perf_counter() - start, market=market,
+                                 bars=args.bars))
+    return results
+
+
+def benchPipeline(size, args, providers):
+    import utils
+    from compute_pool import ComputePool
+    from fetch_engine import AsyncFetchEngine
+
+    codes = watchlist(size)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            # 自选列表数据库在临时目录中，写回名称的开销与真实运行一致
+            utils.WATCHLIST.add_all(codes)
+
+            async def run():
+                engine = AsyncFetchEngine(args.concurrency, BENCH_LIMITS, BENCH_RETRY_POLICY, BENCH_BREAKER_POLICY)
+                pool = ComputePool()
+                try:
+                    # 第一次为冷启动（没有本地历史、指标状态和股票信息缓存），第二次走增量路径
+                    for name in ("pipeline_cold", "pipeline_warm"):
+                        before = {provider.name: provider.stats() for provider in providers}
+                        start = time.perf_counter()
+                        summary = await utils.runPipeline(codes, lambda message: None, "txt", args.concurrency,
+                                                          engine, pool)
+                        seconds = time.perf_counter() - start
+                        requests = {provider.name: provider.stats()["requests"] - before[provider.name]["requests"]
+                                    for provider in providers}
+                        results.append(entry(name, len(codes), seconds, written=summary["written"],
+                                             errors=len(summary["errors"]), requests=requests,
+                                             first_output=summary["seconds"]["first_output"],
+                                             retries=summary["fetch"]["retries"], stages=summary["stages"]))
+                finally:
+                    engine.shutdown()
+                    pool.shutdown()
+
+            asyncio.run(run())
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def syntheticResults(size):
+    from compute_utils import MARKET_INDICATORS
+    from stock_result import StockResult
+
+    rng = np.random.default_rng(0)
+    results = []
+    for i, code in enumerate(watchlist(size)):
+        market = "A" if code.startswith("sh") else code[:2]
+        info = {"股票代码": code, "股票简称": f"模拟{i}", "行业": "模拟行业"}
+        overview = {"日期": "2024-12-31T00:00:00.000", "开盘": 10.0, "收盘": 10.5, "最高": 10.8, "最低": 9.9,
+                    "成交量": 123456} if market != "HK" else None
+        values = rng.normal(50, 20, len(MARKET_INDICATORS[market]))
+        results.append((code, f"模拟{i}", StockResult(code, market, info, overview, values, 123456)))
+    return results
+
+
+def benchWriters(size, args):
+    import excel
+    import series_store
+    from compute_utils import compute_indicator_arrays
+    from indicator_state import ohlcv_arrays
+
+    results = []
+    items = syntheticResults(size)
+    with tempfile.TemporaryDirectory() as workdir:
+        excel.RESULT_DIR = os.path.join(workdir, "result")
+        try:
+            for name, writer in (("write_txt", excel.generateTxt), ("write_excel", excel.generateExcel)):
+                start = time.perf_counter()
+                for code, stockName, result in items:
+                    writer(stockName, code, print, result)
+                results.append(entry(name, size, time.perf_counter() - start))
+
+            start = time.perf_counter()
+            book = excel.WorkbookWriter()
+            for code, stockName, result in items:
+                book.add(stockName, code, print, result)
+            book.save(print)
+            results.append(entry("write_workbook", size, time.perf_counter() - start,
+                                 bytes=os.path.getsize(book.path)))
+
+            if importlib.util.find_spec("pyarrow") is not None:
+                # 完整时间序列：指标数组已由计算得到，这里只计写文件的开销
+                frames = [ohlcv_arrays(indicator_input(f"S{i}", "A", args.bars, args.gap_rate), "A")
+                          for i in range(min(size, DISTINCT_FRAMES))]
+                computed = [(dates.astype("datetime64[D]"), high, low, close,
+                             compute_indicator_arrays(close, high, low, volume))
+                            for dates, high, low, close, volume in frames]
+                for fmt in series_store.SERIES_FORMATS:
+                    start = time.perf_counter()
+                    total = 0
+                    for i in range(size):
+                        total += series_store.write_series(os.path.join(workdir, "series", f"S{i}.{fmt}"),
+                                                           *computed[i % len(computed)], "A")
+                    results.append(entry(f"write_series_{fmt}", size, time.perf_counter() - start,
+                                         bars=args.bars, bytes=total))
+        finally:
+            excel.RESULT_DIR = "result"
+    return results
+
+
+def gitVersion():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return None
+
+
+def compareBaseline(results, baselinePath, tolerance):
+    with open(baselinePath, "r", encoding="utf-8") as f:
+        baseline = {(item["name"], item["symbols"], item.get("market")): item for item in json.load(f)["results"]}
+    regressions = []
+    for item in results:
+        old = baseline.get((item["name"], item["symbols"], item.get("market")))
+        if old is None or old["seconds"] <= 0:
+            continue
+        item["baseline_ratio"] = round(item["seconds"] / old["seconds"], 3)
+        if item["baseline_ratio"] > tolerance:
+            regressions.append(item)
+    return regressions
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    # 导入检查在子进程中进行，须在本进程替换数据源之前运行（结果与股票数量无关，只运行一次）
+    results, problems = checkImports() if "imports" in args.only else ([], [])
+    for item in results:
+        print(f"{item['name']:<28}{'':<4}{'':>7}     {item['seconds']:>10.3f} 秒  已加载: {', '.join(item['loaded'])}")
+    if "memory" in args.only:
+        # 单只股票的峰值内存和低内存模式的误差（与股票数量无关，只运行一次）
+        memory, memoryProblems = checkMemory(args.bars, args.gap_rate)
+        for item in memory:
+            print(f"{item['name']:<28}{item.get('market', ''):<4}{'':>7}     {describe(item)}")
+        results += memory
+        problems += memoryProblems
+
+    eastmoney = FakeProvider("eastmoney", args.latency, failure_rate=args.failure_rate, bars=args.bars,
+                             gap_rate=args.gap_rate)
+    yahoo = FakeProvider("yahoo", args.yahoo_latency, failure_rate=args.failure_rate, bars=args.bars,
+                         gap_rate=args.gap_rate, seed=1)
+    # 须在导入本项目模块之前替换数据源
+    install(eastmoney, yahoo)
+
+    for size in args.sizes:
+        first = len(results)
+        # 各阶段自己的输出（保存文件提示等）不混进基准结果
+        with contextlib.redirect_stdout(sys.stderr):
+            if "compute" in args.only:
+                results += benchCompute(size, args)
+            if "pipeline" in args.only:
+                results += benchPipeline(size, args, (eastmoney, yahoo))
+            if "writers" in args.only:
+                results += benchWriters(size, args)
+        for item in results[first:]:
+            print(f"{item['name']:<28}{item.get('market', ''):<4}{item['symbols']:>7} 只  "
+                  f"{item['seconds']:>10.3f} 秒  {item['per_symbol_ms']:>9.3f} 毫秒/只")
+
+    regressions = compareBaseline(results, args.baseline, args.tolerance) if args.baseline else []
+    report = {
+        "version": gitVersion(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {args.output}")
+
+    for item in regressions:
+        print(f"变慢: {item['name']} {item.get('market', '')} {item['symbols']} 只 x{item['baseline_ratio']}")
+    for problem in problems:
+        print(f"问题: {problem}")
+    return 1 if regressions or problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
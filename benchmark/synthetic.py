@@ -0,0 +1,93 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# 合成数据的最后一个交易日固定，冷启动和增量两次运行拿到的是同一段历史
+LAST_DATE = pd.Timestamp("2024-12-31")
+
+
+def symbol_seed(symbol, seed=0):
+    # 同一只股票每次生成的数据相同（不受 PYTHONHASHSEED 影响）
+    return zlib.crc32(f"{seed}:{symbol}".encode())
+
+
+def random_walk(n, rng, start=50.0):
+    """
+    几何随机游走的收盘价，以及围绕收盘价的开盘、最高、最低价和成交量
+    """
+    close = np.round(start * np.exp(np.cumsum(rng.normal(0, 0.02, n))), 2)
+    open_ = np.round(close * (1 + rng.normal(0, 0.005, n)), 2)
+    high = np.round(np.maximum(close, open_) * (1 + np.abs(rng.normal(0, 0.01, n))), 2)
+    low = np.round(np.minimum(close, open_) * (1 - np.abs(rng.normal(0, 0.01, n))), 2)
+    volume = rng.integers(1_000, 10_000_000, n)
+    return open_, high, low, close, volume
+
+
+def trading_days(bars, gap_rate, rng):
+    """
+    截止 LAST_DATE 的 bars 个工作日；gap_rate 为随机停牌（整天缺失）的比例
+    """
+    total = int(bars / (1 - gap_rate)) + 1 if gap_rate else bars
+    days = pd.bdate_range(end=LAST_DATE, periods=total)
+    if gap_rate:
+        keep = np.sort(rng.choice(total - 1, bars - 1, replace=False))
+        days = days[np.append(keep, total - 1)]
+    return days
+
+
+def make_ohlcv(symbol, market, bars=2000, gap_rate=0.0, seed=0):
+    """
+    生成一只股票的日线，列结构与对应数据源一致：
+    A / HK 为 akshare 的中文列（日期为 datetime.date），US 为 yfinance 的 Open/High/Low/Close/Adj Close/Volume（日期为索引）
+    """
+    rng = np.random.default_rng(symbol_seed(symbol, seed))
+    days = trading_days(bars, gap_rate, rng)
+    open_, high, low, close, volume = random_walk(len(days), rng, start=rng.uniform(5, 300))
+
+    if market == "US":
+        return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close,
+                             "Adj Close": close, "Volume": volume},
+                            index=pd.DatetimeIndex(days, name="Date"))
+
+    previous = np.concatenate([[close[0]], close[:-1]])
+    return pd.DataFrame({
+        "日期": days.date,
+        "股票代码": symbol,
+        "开盘": open_,
+        "收盘": close,
+        "最高": high,
+        "最低": low,
+        "成交量": volume,
+        "成交额": np.round(volume * close, 2),
+        "振幅": np.round((high - low) / previous * 100, 2),
+        "涨跌幅": np.round((close - previous) / previous * 100, 2),
+        "涨跌额": np.round(close - previous, 2),
+        "换手率": np.round(rng.uniform(0.1, 5, len(days)), 2),
+    })
+
+
+def make_adjust_factors(symbol, bars=2000, seed=0):
+    """
+    后复权因子：每年一次左右的除权除息，因子逐次放大
+    """
+    rng = np.random.default_rng(symbol_seed(symbol, seed) + 1)
+    days = pd.bdate_range(end=LAST_DATE, periods=bars)
+    events = np.sort(rng.choice(bars, max(bars // 250, 1), replace=False))
+    factors = np.cumprod(1 + rng.uniform(0.01, 0.1, len(events)))
+    return pd.DataFrame({"date": days[events].strftime("%Y-%m-%d"), "hfq_factor": factors.astype(str)})
+
+
+def indicator_input(symbol, market, bars=2000, gap_rate=0.0, seed=0):
+    """
+    compute_*_indicators 的输入：A / HK 为 akshare 中文列，US 为 pybroker 风格的小写列
+    """
+    df = make_ohlcv(symbol, market, bars, gap_rate, seed)
+    if market != "US":
+        return df
+    df = df.rename(columns={"Open": "open", "High": "high", "Low": "low", "Close": "close",
+                            "Adj Close": "adj_close", "Volume": "volume"})
+    df.index.name = "date"
+    df = df.reset_index()
+    df.insert(1, "symbol", symbol)
+    return df
@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import json
+import signal
+import sys
+import time
+
+import excel
+import panel
+import run_metrics
+import series_store
+import utils
+import watchlist
+from compute_pool import ComputePool
+from fetch_engine import AsyncFetchEngine
+
+# 退出码：全部成功 / 部分股票失败 / 没有任何结果（或参数、自选列表有误）
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_FAILED = 2
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="无界面运行：抓取自选股、计算指标并生成结果文件")
+    parser.add_argument("codes", nargs="*", help="股票代码（不填则读取自选列表文件）")
+    parser.add_argument("--watchlist", default=watchlist.WATCHLIST_DB,
+                        help="自选列表数据库，默认 watchlist.db（不存在时自动导入 stock_list.json）")
+    parser.add_argument("--format", choices=["txt", "excel", "workbook"], default="txt",
+                        help="输出格式：每只股票一个 TXT / Excel，或全部汇总到一个 Excel")
+    parser.add_argument("--panel", nargs="+", choices=panel.PANEL_MARKETS, metavar="MARKET",
+                        help="全市场模式：计算 A / HK 全部股票的最新指标，写入一张 CSV 快照表（忽略自选列表）")
+    parser.add_argument("--series", choices=series_store.SERIES_FORMATS,
+                        help="每只股票额外写出每根 K 线上的指标（完整时间序列，需要 pyarrow）")
+    parser.add_argument("--series-dir", default=series_store.SERIES_DIR, help="时间序列文件目录，默认 series")
+    parser.add_argument("--lean", action="store_true",
+                        help="低内存计算（float32，合成行情上误差不超过各指标量级的 5e-5），"
+                             "每只股票计算时的峰值内存记入运行统计")
+    parser.add_argument("--indicators", nargs="+", choices=excel.ALL_INDICATORS, metavar="NAME",
+                        help="只计算这些指标（如 MA5 RSI6 K），不填为全部")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="每只股票的结果额外写入 temp/<代码>.json 作为中间结果存档")
+    parser.add_argument("--concurrency", type=int, default=8, help="抓取线程数")
+    parser.add_argument("--output-dir", default=excel.RESULT_DIR, help="结果文件目录，默认 result")
+    parser.add_argument("--summary", help="运行统计 JSON 另外写入这个文件")
+    parser.add_argument("--metrics-dir", default=run_metrics.METRICS_DIR,
+                        help="各阶段耗时报告（JSON）和 Prometheus 文件的目录，默认 metrics")
+    parser.add_argument("--daemon", action="store_true", help="常驻运行，按 --interval 定时重复执行")
+    parser.add_argument("--interval", type=float, default=3600, help="常驻模式下两次运行开始的间隔（秒）")
+    parser.add_argument("--runs", type=int, default=0, help="常驻模式下最多运行的次数，0 表示不限")
+    return parser.parse_args(argv)
+
+
+def loadItems(args):
+    if args.codes:
+        return args.codes
+    return utils.WATCHLIST.items()
+
+
+def exitCode(summary):
+    # 全市场模式下连股票列表都没取到时 symbols 为 0
+    if summary["written"] == 0 and (summary["symbols"] > 0 or summary["errors"]):
+        return EXIT_FAILED
+    return EXIT_PARTIAL if summary["errors"] else EXIT_OK
+
+
+def emitSummary(summary, args):
+    # 统计以一行 JSON 输出到 stdout，运行过程中的日志都在 stderr
+    line = json.dumps(summary, ensure_ascii=False)
+    print(line, flush=True)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def onError(message):
+    print(message, file=sys.stderr)
+
+
+async def runOnce(args, engine=None, pool=None):
+    if args.panel:
+        summary = await utils.runPanel(args.panel, onError, args.concurrency, engine)
+    else:
+        items = loadItems(args)
+        summary = await utils.runPipeline(items, onError, args.format, args.concurrency, engine, pool)
+    summary["exit_code"] = exitCode(summary)
+    return summary
+
+
+async def runDaemon(args):
+    """
+    常驻模式：同一个事件循环、抓取线程池和计算进程池在多次运行之间复用，缓存也留在进程内
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError, RuntimeError):
+            loop.add_signal_handler(signum, stop.set)
+
+    engine = AsyncFetchEngine(args.concurrency)
+    pool = ComputePool()
+    code = EXIT_OK
+    runs = 0
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                summary = await runOnce(args, engine, pool)
+            except Exception as e:
+                # 自选列表读取失败等情况本轮跳过，下一轮再试
+                summary = {"error": str(e), "exit_code": EXIT_FAILED}
+            with contextlib.redirect_stdout(sys.__stdout__):
+                emitSummary(summary, args)
+            code = summary["exit_code"]
+            runs += 1
+            if args.runs and runs >= args.runs:
+                break
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), max(0.0, args.interval - (time.monotonic() - started)))
+    finally:
+        engine.shutdown()
+        pool.shutdown()
+    return code
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    excel.RESULT_DIR = args.output_dir
+    run_metrics.METRICS_DIR = args.metrics_dir
+    series_store.SERIES_DIR = args.series_dir
+    utils.SERIES_FORMAT = args.series
+    utils.LEAN_COMPUTE = args.lean
+    utils.INDICATORS = args.indicators
+    utils.SAVE_CHECKPOINT = args.checkpoint
+    if args.series and importlib.util.find_spec("pyarrow") is None:
+        print("--series 需要安装 pyarrow", file=sys.stderr)
+        return EXIT_FAILED
+    # 只有默认的数据库会自动导入旧版 stock_list.json
+    legacy = watchlist.LEGACY_JSON if args.watchlist == watchlist.WATCHLIST_DB else None
+    utils.WATCHLIST = watchlist.WatchlistStore(args.watchlist, legacy)
+    if not args.panel and not args.codes and not utils.WATCHLIST.items():
+        print(f"自选列表为空: {args.watchlist}", file=sys.stderr)
+        return EXIT_FAILED
+
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.daemon:
+            return asyncio.run(runDaemon(args))
+        summary = asyncio.run(runOnce(args))
+        utils.printRunSummary(summary)
+    emitSummary(summary, args)
+    return summary["exit_code"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
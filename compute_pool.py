@@ -0,0 +1,159 @@
+import asyncio
+import multiprocessing
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from compute_utils import MARKET_COLUMNS, LEAN_DTYPE, compute_indicator_arrays, indicator_values, sort_by_date, stored_float
+from rolling_kernels import thread_scratch
+from indicator_state import latest_with_state
+from series_store import write_series
+from run_metrics import METRICS
+
+# 共享内存块的行：日期（1970-01-01 起的天数）、high、low、close、volume，均为 float64
+OHLCV_ROWS = 5
+
+
+def _start_method():
+    # 抓取线程还在运行时 fork 不安全；forkserver 不可用（如 Windows）时用 spawn
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def pack_ohlcv(df: pd.DataFrame, market):
+    """
+    把按日期升序的日线写入一块新建的共享内存，返回 (SharedMemory, K 线数)；用完须由创建方 unlink
+    """
+    columns = MARKET_COLUMNS[market]
+    n = len(df)
+    shm = shared_memory.SharedMemory(create=True, size=max(OHLCV_ROWS * n * 8, 1))
+    block = np.ndarray((OHLCV_ROWS, n), dtype=np.float64, buffer=shm.buf)
+    days = pd.to_datetime(df[columns["date"]]).to_numpy(dtype="datetime64[D]")
+    block[0] = days.astype(np.int64)
+    for row, name in enumerate(("high", "low", "close", "volume"), start=1):
+        block[row] = df[columns[name]].to_numpy(dtype=np.float64)
+    del block
+    return shm, n
+
+
+def _traced(lean, func, *args):
+    """
+    调用 func，返回 (结果, 峰值内存字节数)；只在低内存模式下用 tracemalloc 测量（会拖慢计算），否则峰值为 None
+    计算进程中的 NumPy 数组分配都计入，映射的共享内存不计入
+    """
+    if not lean:
+        return func(*args), None
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _latest_from_shared(name, n, market, path, lean=False, indicators=None):
+    """
+    indicators 为 None 时用增量状态计算全部指标；否则只在尾部窗口上计算这些指标，
+    不读写增量状态（状态须包含全部指标才能继续增量更新）
+    返回 ({指标名: 值}, 峰值内存字节数或 None)
+    """
+    # 在计算进程中直接映射父进程写好的数组，不经过 DataFrame 的序列化
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        block = np.ndarray((OHLCV_ROWS, n), dtype=np.float64, buffer=shm.buf)
+        if indicators is None:
+            dates = np.datetime_as_string(block[0].astype(np.int64).astype("datetime64[D]"))
+            values, peak = _traced(lean, latest_with_state, dates, block[1], block[2], block[3], block[4], market,
+                                   path, lean)
+        else:
+            values, peak = _traced(lean, partial(indicator_values, latest_only=True, indicators=indicators,
+                                                 lean=lean), block[3], block[1], block[2], block[4], market)
+            values = {column: stored_float(value) for column, value in values.items()}
+        del block
+        return values, peak
+    finally:
+        shm.close()
+
+
+def _series_arrays(block, market, lean, indicators):
+    return compute_indicator_arrays(close=block[3], high=block[1], low=block[2], volume=block[4],
+                                    boll=market != "A", columns=indicators,
+                                    dtype=LEAN_DTYPE if lean else np.float64,
+                                    scratch=thread_scratch() if lean else None)
+
+
+def _series_from_shared(name, n, market, series_path, lean=False, indicators=None):
+    """
+    在完整历史上计算一次指标（indicators 不为 None 时只算这些）：整表写入 series_path，最后一行即最新指标，不再另算一遍
+    lean 为 True 时按低内存模式计算（float32，本进程的临时数组在各只股票之间复用）
+    返回 ({指标名: 值}, 写入耗时, 文件字节数, 计算的峰值内存字节数或 None)
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        block = np.ndarray((OHLCV_ROWS, n), dtype=np.float64, buffer=shm.buf)
+        arrays, peak = _traced(lean, _series_arrays, block, market, lean, indicators)
+        values = {column: stored_float(array[-1]) for column, array in arrays.items()}
+        started = time.perf_counter()
+        size = write_series(series_path, block[0].astype(np.int64).astype("datetime64[D]"),
+                            block[1], block[2], block[3], arrays, market)
+        seconds = time.perf_counter() - started
+        del block, arrays
+        return values, seconds, size, peak
+    finally:
+        shm.close()
+
+
+class ComputePool:
+    """
+    指标计算进程池：抓取线程拿到日线后交给这里计算，计算不再与网络线程争抢 GIL
+    须在事件循环中使用
+    """
+
+    def __init__(self, max_workers=None):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1,
+                                            mp_context=multiprocessing.get_context(_start_method()))
+
+    async def latest(self, df: pd.DataFrame, market, path, lean=False, indicators=None, symbol=None):
+        """
+        用增量状态计算最新指标，返回 (最后一根 K 线, {指标名: 值})
+        lean 为 True 时状态重建按低内存模式进行，计算进程中的峰值内存记入 run_metrics；
+        indicators 不为 None 时只计算这些指标（不使用增量状态）
+        """
+        df = sort_by_date(df, market)
+        shm, n = pack_ohlcv(df, market)
+        try:
+            loop = asyncio.get_running_loop()
+            values, peak = await loop.run_in_executor(self.executor, _latest_from_shared, shm.name, n, market, path,
+                                                      lean, indicators)
+        finally:
+            shm.close()
+            shm.unlink()
+        if peak is not None:
+            METRICS.observe_peak("compute", "compute_pool", peak, symbol)
+        return df.iloc[-1], values
+
+    async def series(self, df: pd.DataFrame, market, series_path, lean=False, indicators=None, symbol=None):
+        """
+        计算完整指标时间序列并写入 series_path，返回 (最后一根 K 线, {指标名: 值}, (写入耗时, 字节数))
+        lean、indicators 同 latest
+        """
+        df = sort_by_date(df, market)
+        shm, n = pack_ohlcv(df, market)
+        try:
+            loop = asyncio.get_running_loop()
+            values, seconds, size, peak = await loop.run_in_executor(self.executor, _series_from_shared, shm.name,
+                                                                     n, market, series_path, lean, indicators)
+        finally:
+            shm.close()
+            shm.unlink()
+        if peak is not None:
+            METRICS.observe_peak("compute", "compute_pool", peak, symbol)
+        return df.iloc[-1], values, (seconds, size)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -1,543 +1,367 @@
-import pandas
+import math
+from functools import lru_cache
 
-import pandas as pd
 import numpy as np
+import pandas as pd
 
-
-def compute_rsi(df, N, column='close'):
-    delta = df[column].diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
-
-    avg_gain = gain.ewm(alpha=1 / N, adjust=False).mean()
-    avg_loss = loss.ewm(alpha=1 / N, adjust=False).mean()
-
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
-
-def compute_indicators(df:pandas.DataFrame,symbol: str):
-
-
-    # 计算 MA5（5 日移动平均线），用收盘价计算
-    df['MA5'] = df['close'].rolling(window=5).mean()
-    df['MA10'] = df['close'].rolling(window=10).mean()
-    df['MA20'] = df['close'].rolling(window=20).mean()
-    df['MA30'] = df['close'].rolling(window=30).mean()
-    df['MA60'] = df['close'].rolling(window=60).mean()
-
-    df["VOL"] = df["volume"]
-    # 成交量的 MA5 和 MA10
-    df["VOL_MA5"] = df["volume"].rolling(window=5).mean()
-    df["VOL_MA10"] = df["volume"].rolling(window=10).mean()
-
-    # === RSI 参数 ===
-    df['RSI6'] = compute_rsi(df, 6)
-    df['RSI12'] = compute_rsi(df, 12)
-    df['RSI24'] = compute_rsi(df, 24)
-
-    # === KDJ 参数 ===
-    n = 9  # RSV周期，KDJ 通常用 9 日
-    low_min = df['low'].rolling(window=n).min()
-    high_max = df['high'].rolling(window=n).max()
-    rsv = (df['close'] - low_min) / (high_max - low_min) * 100
-
-    df['K'] = rsv.ewm(alpha=1 / 3, adjust=False).mean()
-    df['D'] = df['K'].ewm(alpha=1 / 3, adjust=False).mean()
-    df['J'] = 3 * df['K'] - 2 * df['D']
-
-    # === MACD 参数 ===
-    short = 12  # EMA短周期
-    long = 26  # EMA长周期
-    signal = 9  # DEA周期
-
-    # 计算 EMA
-    df['EMA12'] = df['close'].ewm(span=short, adjust=False).mean()
-    df['EMA26'] = df['close'].ewm(span=long, adjust=False).mean()
-
-    # 计算 DIF（快线）
-    df['DIF'] = df['EMA12'] - df['EMA26']
-
-    # 计算 DEA（慢线）
-    df['DEA'] = df['DIF'].ewm(span=signal, adjust=False).mean()
-
-    # 计算 MACD（柱状图）
-    df['MACD'] = 2 * (df['DIF'] - df['DEA'])
-
-    # === WR10 ===
-    n1 = 10
-    high_n1 = df['high'].rolling(window=n1).max()
-    low_n1 = df['low'].rolling(window=n1).min()
-    df['WR10'] = (high_n1 - df['close']) / (high_n1 - low_n1) * 100
-
-    # === WR6 ===
-    n2 = 6
-    high_n2 = df['high'].rolling(window=n2).max()
-    low_n2 = df['low'].rolling(window=n2).min()
-    df['WR6'] = (high_n2 - df['close']) / (high_n2 - low_n2) * 100
-
-    # === DMI 指标 ===
-    N = 14  # 常用周期
-    M = 6  # ADX 平滑周期
-    # 计算 TR（True Range）
-    df['H-L'] = df['high'] - df['low']
-    df['H-PC'] = abs(df['high'] - df['close'].shift(1))
-    df['L-PC'] = abs(df['low'] - df['close'].shift(1))
-    df['TR'] = df[['H-L', 'H-PC', 'L-PC']].max(axis=1)
-
-    # 计算 +DM 和 -DM
-    df['+DM'] = df['high'] - df['high'].shift(1)
-    df['-DM'] = df['low'].shift(1) - df['low']
-
-    df['+DM'] = df['+DM'].where((df['+DM'] > df['-DM']) & (df['+DM'] > 0), 0)
-    df['-DM'] = df['-DM'].where((df['-DM'] > df['+DM']) & (df['-DM'] > 0), 0)
-
-    # 对 TR、+DM、-DM 进行 N 日平滑
-    df['TR_sum'] = df['TR'].rolling(window=N).sum()
-    df['+DM_sum'] = df['+DM'].rolling(window=N).sum()
-    df['-DM_sum'] = df['-DM'].rolling(window=N).sum()
-
-    df['PDI'] = 100 * (df['+DM_sum'] / df['TR_sum'])
-    df['MDI'] = 100 * (df['-DM_sum'] / df['TR_sum'])
-
-    # 计算 DX（动向指数）
-    df['DX'] = 100 * (abs(df['PDI'] - df['MDI']) / (df['PDI'] + df['MDI']))
-
-    # 用Wilder平滑法计算ADX
-    df['ADX'] = df['DX'].rolling(window=M).mean()
-
-    # 计算 ADXR（平滑平均趋向指数）
-    df['ADXR'] = (df['ADX'] + df['ADX'].shift(M)) / 2
-
-    # === BIAS ===
-    df['MA6'] = df['close'].rolling(window=6).mean()
-    df['MA12'] = df['close'].rolling(window=12).mean()
-    df['MA24'] = df['close'].rolling(window=24).mean()
-
-    df['BIAS6'] = (df['close'] - df['MA6']) / df['MA6'] * 100
-    df['BIAS12'] = (df['close'] - df['MA12']) / df['MA12'] * 100
-    df['BIAS24'] = (df['close'] - df['MA24']) / df['MA24'] * 100
-
-    # === OBV ===
-    # 确保日期排序
-    df = df.sort_values("date").reset_index(drop=True)
-
-    # 计算 OBV
-    df["close_diff"] = df["close"].diff()
-    df["direction"] = np.where(df["close_diff"] > 0, 1, np.where(df["close_diff"] < 0, -1, 0))
-    df["obv_change"] = df["volume"] * df["direction"]
-    df["OBV"] = df["obv_change"].fillna(0).cumsum()
-    df['OBV_MA'] = df['OBV'].rolling(window=30).mean()
-    # 将 OBV_MA 转为非科学计数法，并保留两位小数
-    df['OBV_MA'] = df['OBV_MA'].apply(lambda x: f'{x:.2f}' if pd.notnull(x) else '')
-
-    # === CCI ===
-    N = 14  # 通常为 14 天
-
-    # 1. 计算典型价格 TP
-    df['TP'] = (df['high'] + df['low'] + df['close']) / 3
-
-    # 2. 计算 TP 的 N 日简单移动平均
-    df['TP_MA'] = df['TP'].rolling(window=N).mean()
-
-    # 3. 计算 TP 的 N 日平均绝对偏差
-    df['MD'] = df['TP'].rolling(window=N).apply(lambda x: np.mean(np.abs(x - x.mean())), raw=True)
-
-    # 4. 计算 CCI
-    df['CCI'] = (df['TP'] - df['TP_MA']) / (0.015 * df['MD'])
-
-    # === ROC ===
-    N = 12  # ROC 默认周期常用值为 12
-
-    # 1. 计算 ROC
-    df['ROC'] = (df['close'] - df['close'].shift(N)) / df['close'].shift(N) * 100
-
-    # 2. 计算 ROC 的均线（如 6 日简单移动平均）
-    df['ROC_MA'] = df['ROC'].rolling(window=6).mean()
-
-    # === CR ===
-    N = 26
-
-    # 1. 前一天的中间价 MID
-    df['MID'] = (df['high'] + df['low']) / 2
-    df['MID_yesterday'] = df['MID'].shift(1)
-
-    # 2. 计算 CR 指标
-    P1 = (df['high'] - df['MID_yesterday']).clip(lower=0)
-    P2 = (df['MID_yesterday'] - df['low']).clip(lower=0)
-
-    df['CR'] = P1.rolling(window=N).sum() / P2.rolling(window=N).sum() * 100
-
-    # 3. 计算 CR 均线 MA1~MA3
-    df['MA1'] = df['CR'].rolling(window=10).mean().shift(1 + int(10 / 2.5))
-    df['MA2'] = df['CR'].rolling(window=20).mean().shift(1 + int(20 / 2.5))
-    df['MA3'] = df['CR'].rolling(window=40).mean().shift(1 + int(40 / 2.5))
-
-    return df.iloc[[-1]].assign(symbol=symbol)
-
-def compute_hk_rsi(df, N, column='收盘'):
-    delta = df[column].diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
-
-    avg_gain = gain.ewm(alpha=1 / N, adjust=False).mean()
-    avg_loss = loss.ewm(alpha=1 / N, adjust=False).mean()
-
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
-
-
-def compute_hk_indicators(df:pandas.DataFrame,symbol: str):
-    # 计算 MA5（5 日移动平均线），用收盘价计算
-    df['MA5'] = df['收盘'].rolling(window=5).mean()
-    df['MA10'] = df['收盘'].rolling(window=10).mean()
-    df['MA20'] = df['收盘'].rolling(window=20).mean()
-    df['MA30'] = df['收盘'].rolling(window=30).mean()
-    df['MA60'] = df['收盘'].rolling(window=60).mean()
-
-    df["VOL"] = df["成交量"]
-    # 成交量的 MA5 和 MA10
-    df["VOL_MA5"] = df["成交量"].rolling(window=5).mean()
-    df["VOL_MA10"] = df["成交量"].rolling(window=10).mean()
-
-    # === RSI 参数 ===
-    df['RSI6'] = compute_hk_rsi(df, 6)
-    df['RSI12'] = compute_hk_rsi(df, 12)
-    df['RSI24'] = compute_hk_rsi(df, 24)
-
-    # === KDJ 参数 ===
-    n = 9  # RSV周期，KDJ 通常用 9 日
-    low_min = df['最低'].rolling(window=n).min()
-    high_max = df['最高'].rolling(window=n).max()
-    rsv = (df['收盘'] - low_min) / (high_max - low_min) * 100
-
-    df['K'] = rsv.ewm(alpha=1 / 3, adjust=False).mean()
-    df['D'] = df['K'].ewm(alpha=1 / 3, adjust=False).mean()
-    df['J'] = 3 * df['K'] - 2 * df['D']
-
-    # === MACD 参数 ===
-    short = 12  # EMA短周期
-    long = 26  # EMA长周期
-    signal = 9  # DEA周期
-
-    # 计算 EMA
-    df['EMA12'] = df['收盘'].ewm(span=short, adjust=False).mean()
-    df['EMA26'] = df['收盘'].ewm(span=long, adjust=False).mean()
-
-    # 计算 DIF（快线）
-    df['DIF'] = df['EMA12'] - df['EMA26']
-
-    # 计算 DEA（慢线）
-    df['DEA'] = df['DIF'].ewm(span=signal, adjust=False).mean()
-
-    # 计算 MACD（柱状图）
-    df['MACD'] = 2 * (df['DIF'] - df['DEA'])
-
-    # === WR10 ===
-    n1 = 10
-    high_n1 = df['最高'].rolling(window=n1).max()
-    low_n1 = df['最低'].rolling(window=n1).min()
-    df['WR10'] = (high_n1 - df['收盘']) / (high_n1 - low_n1) * 100
-
-    # === WR6 ===
-    n2 = 6
-    high_n2 = df['最高'].rolling(window=n2).max()
-    low_n2 = df['最低'].rolling(window=n2).min()
-    df['WR6'] = (high_n2 - df['收盘']) / (high_n2 - low_n2) * 100
-
-    # === DMI 指标 ===
-    N = 14  # 常用周期
-    M = 6  # ADX 平滑周期
-    # 计算 TR（True Range）
-    df['H-L'] = df['最高'] - df['最低']
-    df['H-PC'] = abs(df['最高'] - df['收盘'].shift(1))
-    df['L-PC'] = abs(df['最低'] - df['收盘'].shift(1))
-    df['TR'] = df[['H-L', 'H-PC', 'L-PC']].max(axis=1)
-
-    # 计算 +DM 和 -DM
-    df['+DM'] = df['最高'] - df['最高'].shift(1)
-    df['-DM'] = df['最低'].shift(1) - df['最低']
-
-    df['+DM'] = df['+DM'].where((df['+DM'] > df['-DM']) & (df['+DM'] > 0), 0)
-    df['-DM'] = df['-DM'].where((df['-DM'] > df['+DM']) & (df['-DM'] > 0), 0)
-
-    # 对 TR、+DM、-DM 进行 N 日平滑
-    df['TR_sum'] = df['TR'].rolling(window=N).sum()
-    df['+DM_sum'] = df['+DM'].rolling(window=N).sum()
-    df['-DM_sum'] = df['-DM'].rolling(window=N).sum()
-
-    df['PDI'] = 100 * (df['+DM_sum'] / df['TR_sum'])
-    df['MDI'] = 100 * (df['-DM_sum'] / df['TR_sum'])
-
-    # 计算 DX（动向指数）
-    df['DX'] = 100 * (abs(df['PDI'] - df['MDI']) / (df['PDI'] + df['MDI']))
-
-    # 用Wilder平滑法计算ADX
-    df['ADX'] = df['DX'].rolling(window=M).mean()
-
-    # 计算 ADXR（平滑平均趋向指数）
-    df['ADXR'] = (df['ADX'] + df['ADX'].shift(M)) / 2
-
-    #     # === BIAS ===
-    df['MA6'] = df['收盘'].rolling(window=6).mean()
-    df['MA12'] = df['收盘'].rolling(window=12).mean()
-    df['MA24'] = df['收盘'].rolling(window=24).mean()
-
-    df['BIAS6'] = (df['收盘'] - df['MA6']) / df['MA6'] * 100
-    df['BIAS12'] = (df['收盘'] - df['MA12']) / df['MA12'] * 100
-    df['BIAS24'] = (df['收盘'] - df['MA24']) / df['MA24'] * 100
-    # === OBV ===
-    # 确保日期排序
-    df = df.sort_values("日期").reset_index(drop=True)
-
-    # 计算 OBV
-    df["close_diff"] = df["收盘"].diff()
-    df["direction"] = np.where(df["close_diff"] > 0, 1, np.where(df["close_diff"] < 0, -1, 0))
-    df["obv_change"] = df["成交量"] * df["direction"]
-    df["OBV"] = df["obv_change"].fillna(0).cumsum()
-    df['OBV_MA'] = df['OBV'].rolling(window=30).mean()
-    # 将 OBV_MA 转为非科学计数法，并保留两位小数
-    df['OBV_MA'] = df['OBV_MA'].apply(lambda x: f'{x:.2f}' if pd.notnull(x) else '')
-
-    # === CCI ===
-    N = 14  # 通常为 14 天
-
-    # 1. 计算典型价格 TP
-    df['TP'] = (df['最高'] + df['最低'] + df['收盘']) / 3
-
-    # 2. 计算 TP 的 N 日简单移动平均
-    df['TP_MA'] = df['TP'].rolling(window=N).mean()
-
-    # 3. 计算 TP 的 N 日平均绝对偏差
-    df['MD'] = df['TP'].rolling(window=N).apply(lambda x: np.mean(np.abs(x - x.mean())), raw=True)
-
-    # 4. 计算 CCI
-    df['CCI'] = (df['TP'] - df['TP_MA']) / (0.015 * df['MD'])
-
-    # === ROC ===
-    N = 12  # ROC 默认周期常用值为 12
-
-    # 1. 计算 ROC
-    df['ROC'] = (df['收盘'] - df['收盘'].shift(N)) / df['收盘'].shift(N) * 100
-
-    # 2. 计算 ROC 的均线（如 6 日简单移动平均）
-    df['ROC_MA'] = df['ROC'].rolling(window=6).mean()
-
-    # === CR ===
-    N = 26
-
-    # 1. 前一天的中间价 MID
-    df['MID'] = (df['最高'] + df['最低']) / 2
-    df['MID_yesterday'] = df['MID'].shift(1)
-
-    # 2. 计算 CR 指标
-    P1 = (df['最高'] - df['MID_yesterday']).clip(lower=0)
-    P2 = (df['MID_yesterday'] - df['最低']).clip(lower=0)
-
-    df['CR'] = P1.rolling(window=N).sum() / P2.rolling(window=N).sum() * 100
-
-    # 3. 计算 CR 均线 MA1~MA3
-    df['MA1'] = df['CR'].rolling(window=10).mean().shift(1 + int(10 / 2.5))
-    df['MA2'] = df['CR'].rolling(window=20).mean().shift(1 + int(20 / 2.5))
-    df['MA3'] = df['CR'].rolling(window=40).mean().shift(1 + int(40 / 2.5))
-
-    # === BOLL ===
-    # 设置参数
-    N = 20  # 移动平均周期
-    K = 2  # 标准差倍数
-
-    # 计算布林带
-    df['BOLL_MID'] = df['收盘'].rolling(N).mean()  # 中轨
-    df['BOLL_STD'] = df['收盘'].rolling(N).std()  # 标准差
-    df['BOLL_UPPER'] = df['BOLL_MID'] + K * df['BOLL_STD']  # 上轨
-    df['BOLL_LOWER'] = df['BOLL_MID'] - K * df['BOLL_STD']  # 下轨
-
-    return df.iloc[[-1]].assign(symbol=symbol)
-
-
-
-
-
-
-def compute_us_rsi(df, N, column='close'):
-    delta = df[column].diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
-
-    avg_gain = gain.ewm(alpha=1 / N, adjust=False).mean()
-    avg_loss = loss.ewm(alpha=1 / N, adjust=False).mean()
+from rolling_kernels import (rolling_sum, rolling_mean, rolling_moments, rolling_mean_mad,
+                             rolling_min, rolling_max, ewm_mean, wilder_smooth, use_scratch, thread_scratch)
+
+# 各市场行情数据的列名映射（A股、港股为 akshare 原始中文列，美股来自 pybroker）
+MARKET_COLUMNS = {
+    "A": {"date": "日期", "high": "最高", "low": "最低", "close": "收盘", "volume": "成交量"},
+    "HK": {"date": "日期", "high": "最高", "low": "最低", "close": "收盘", "volume": "成交量"},
+    "US": {"date": "date", "high": "high", "low": "low", "close": "close", "volume": "volume"},
+}
+
+# 输出的指标列（顺序即结果文件中的顺序）
+INDICATOR_COLUMNS = [
+    'MA5', 'MA10', 'MA20', 'MA30', 'MA60',
+    'VOL', 'VOL_MA5', 'VOL_MA10',
+    'RSI6', 'RSI12', 'RSI24',
+    'K', 'D', 'J',
+    'DIF', 'DEA', 'MACD',
+    'WR10', 'WR6',
+    'PDI', 'MDI', 'ADX', 'ADXR',
+    'BIAS6', 'BIAS12', 'BIAS24',
+    'OBV', 'OBV_MA',
+    'CCI',
+    'ROC', 'ROC_MA',
+    'CR', 'MA1', 'MA2', 'MA3',
+]
+BOLL_COLUMNS = ['BOLL_MID', 'BOLL_STD', 'BOLL_UPPER', 'BOLL_LOWER']
+
+# 各市场输出的指标（港股、美股额外输出 BOLL）
+MARKET_INDICATORS = {
+    "A": INDICATOR_COLUMNS,
+    "HK": INDICATOR_COLUMNS + BOLL_COLUMNS,
+    "US": INDICATOR_COLUMNS + BOLL_COLUMNS,
+}
+
+
+# 最新值模式的默认容差：被截掉的历史在 EMA 类指标中残留权重的上限
+LATEST_TOLERANCE = 1e-10
+
+# 低内存模式的数值类型：行情和指标按 float32 保存（窗口累加、EMA 递推仍在 float64 中进行），OBV 保持 float64
+LEAN_DTYPE = np.float32
+
+# 低内存模式的误差上限：每个指标 max|float32 结果 - float64 结果| / 该指标整段历史的 max|值|
+# 合成行情上 300~20000 根 K 线实测最大约 6e-6（CCI），留出余量；0~100 的指标（RSI、KDJ、WR、DMI 等）
+# 相当于绝对误差不超过 0.005；python -m benchmark.memory 检查这一上限
+# 注意：这一上限只在 benchmark.synthetic 生成的随机游走行情上测量过，没有用真实历史验证；
+# 价格量级极端（如仙股、高价股）、长期停牌或成交量跨度很大的股票误差可能更大，对精度敏感时不要开启低内存模式
+LEAN_ERROR_BOUND = 5e-5
+
+
+# ===== 基础数组运算（第 0 维为时间轴，同时支持一维序列和二维矩阵） =====
+
+def _shift(x, n):
+    out = np.full_like(x, np.nan)
+    if n < len(x):
+        out[n:] = x[:len(x) - n]
+    return out
+
+
+def _diff(x):
+    return x - _shift(x, 1)
+
+
+def _obv_change(close, volume):
+    # 每根 K 线对 OBV 的贡献：收盘价上涨加成交量，下跌减成交量，首根为 0
+    close_diff = _diff(close)
+    direction = np.where(close_diff > 0, 1, np.where(close_diff < 0, -1, 0))
+    obv_change = volume * direction
+    return np.where(np.isnan(obv_change), 0.0, obv_change)
+
+
+def _rsi(close, N):
+    delta = _diff(close)
+    gain = np.where(delta < 0, 0.0, delta)
+    loss = -np.where(delta > 0, 0.0, delta)
+
+    # 涨幅、跌幅的 Wilder 平滑合并为一次调用
+    averages = wilder_smooth(np.stack([gain, loss], axis=-1), N)
+    avg_gain, avg_loss = averages[..., 0], averages[..., 1]
 
     rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
-
-def compute_us_indicators(df:pandas.DataFrame,symbol: str):
-    # 计算 MA5（5 日移动平均线），用收盘价计算
-    df['MA5'] = df['close'].rolling(window=5).mean()
-    df['MA10'] = df['close'].rolling(window=10).mean()
-    df['MA20'] = df['close'].rolling(window=20).mean()
-    df['MA30'] = df['close'].rolling(window=30).mean()
-    df['MA60'] = df['close'].rolling(window=60).mean()
-
-    df["VOL"] = df["volume"]
-    # 成交量的 MA5 和 MA10
-    df["VOL_MA5"] = df["volume"].rolling(window=5).mean()
-    df["VOL_MA10"] = df["volume"].rolling(window=10).mean()
-
-    # === RSI 参数 ===
-    df['RSI6'] = compute_us_rsi(df, 6)
-    df['RSI12'] = compute_us_rsi(df, 12)
-    df['RSI24'] = compute_us_rsi(df, 24)
-
-    # === KDJ 参数 ===
-    n = 9  # RSV周期，KDJ 通常用 9 日
-    low_min = df['low'].rolling(window=n).min()
-    high_max = df['high'].rolling(window=n).max()
-    rsv = (df['close'] - low_min) / (high_max - low_min) * 100
-
-    df['K'] = rsv.ewm(alpha=1 / 3, adjust=False).mean()
-    df['D'] = df['K'].ewm(alpha=1 / 3, adjust=False).mean()
-    df['J'] = 3 * df['K'] - 2 * df['D']
-
-    # === MACD 参数 ===
-    short = 12  # EMA短周期
-    long = 26  # EMA长周期
-    signal = 9  # DEA周期
-
-    # 计算 EMA
-    df['EMA12'] = df['close'].ewm(span=short, adjust=False).mean()
-    df['EMA26'] = df['close'].ewm(span=long, adjust=False).mean()
-
-    # 计算 DIF（快线）
-    df['DIF'] = df['EMA12'] - df['EMA26']
-
-    # 计算 DEA（慢线）
-    df['DEA'] = df['DIF'].ewm(span=signal, adjust=False).mean()
-
-    # 计算 MACD（柱状图）
-    df['MACD'] = 2 * (df['DIF'] - df['DEA'])
-
-    # === WR10 ===
-    n1 = 10
-    high_n1 = df['high'].rolling(window=n1).max()
-    low_n1 = df['low'].rolling(window=n1).min()
-    df['WR10'] = (high_n1 - df['close']) / (high_n1 - low_n1) * 100
-
-    # === WR6 ===
-    n2 = 6
-    high_n2 = df['high'].rolling(window=n2).max()
-    low_n2 = df['low'].rolling(window=n2).min()
-    df['WR6'] = (high_n2 - df['close']) / (high_n2 - low_n2) * 100
-
-    # === DMI 指标 ===
-    N = 14  # 常用周期
-    M = 6  # ADX 平滑周期
-    # 计算 TR（True Range）
-    df['H-L'] = df['high'] - df['low']
-    df['H-PC'] = abs(df['high'] - df['close'].shift(1))
-    df['L-PC'] = abs(df['low'] - df['close'].shift(1))
-    df['TR'] = df[['H-L', 'H-PC', 'L-PC']].max(axis=1)
-
-    # 计算 +DM 和 -DM
-    df['+DM'] = df['high'] - df['high'].shift(1)
-    df['-DM'] = df['low'].shift(1) - df['low']
-
-    df['+DM'] = df['+DM'].where((df['+DM'] > df['-DM']) & (df['+DM'] > 0), 0)
-    df['-DM'] = df['-DM'].where((df['-DM'] > df['+DM']) & (df['-DM'] > 0), 0)
-
-    # 对 TR、+DM、-DM 进行 N 日平滑
-    df['TR_sum'] = df['TR'].rolling(window=N).sum()
-    df['+DM_sum'] = df['+DM'].rolling(window=N).sum()
-    df['-DM_sum'] = df['-DM'].rolling(window=N).sum()
-
-    df['PDI'] = 100 * (df['+DM_sum'] / df['TR_sum'])
-    df['MDI'] = 100 * (df['-DM_sum'] / df['TR_sum'])
-
-    # 计算 DX（动向指数）
-    df['DX'] = 100 * (abs(df['PDI'] - df['MDI']) / (df['PDI'] + df['MDI']))
-
-    # 用Wilder平滑法计算ADX
-    df['ADX'] = df['DX'].rolling(window=M).mean()
-
-    # 计算 ADXR（平滑平均趋向指数）
-    df['ADXR'] = (df['ADX'] + df['ADX'].shift(M)) / 2
-
-    #     # === BIAS ===
-    df['MA6'] = df['close'].rolling(window=6).mean()
-    df['MA12'] = df['close'].rolling(window=12).mean()
-    df['MA24'] = df['close'].rolling(window=24).mean()
-
-    df['BIAS6'] = (df['close'] - df['MA6']) / df['MA6'] * 100
-    df['BIAS12'] = (df['close'] - df['MA12']) / df['MA12'] * 100
-    df['BIAS24'] = (df['close'] - df['MA24']) / df['MA24'] * 100
-    # === OBV ===
+    return 100 - (100 / (1 + rs))
+
+
+def compute_indicator_arrays(close, high, low, volume, boll=False, obv_base=0.0, columns=None, dtype=np.float64,
+                             scratch=None):
+    """
+    在原始 NumPy 数组上计算全部指标，返回 {指标名: 数组}，数组与输入等长
+    obv_base 为截至第一根 K 线（含）的累计 OBV，只截取尾部计算时用它接上完整历史
+    columns 不为 None 时只计算并返回这些指标；dtype 为 float32 时行情和指标都按 float32 保存（误差见 LEAN_ERROR_BOUND），
+    OBV 是成交量的累计值，始终为 float64；scratch（rolling_kernels.ScratchBuffers）提供可复用的临时数组
+    """
+    def want(*names):
+        return columns is None or any(name in columns for name in names)
+
+    # 相邻收盘价之差（RSI）、两条 EMA 之差（MACD）、+DM / -DM 的比较和 OBV 的累加对价格的舍入很敏感，
+    # 用原始精度的输入计算，结果再按 dtype 保存；dtype 为 float64 时这些都不复制
+    high64, low64, close64, volume64 = (np.asarray(values, dtype=np.float64) for values in (high, low, close, volume))
+    close, high, low, volume = (np.asarray(values, dtype=dtype) for values in (close, high, low, volume))
+
+    out = {}
+    with np.errstate(divide='ignore', invalid='ignore'), use_scratch(scratch):
+        # === MA ===
+        for n in (5, 10, 20, 30, 60):
+            if want(f'MA{n}'):
+                out[f'MA{n}'] = rolling_mean(close, n)
+
+        # === 成交量及其 MA5 / MA10 ===
+        if want('VOL', 'VOL_MA5', 'VOL_MA10'):
+            out['VOL'] = volume
+            out['VOL_MA5'] = rolling_mean(volume, 5)
+            out['VOL_MA10'] = rolling_mean(volume, 10)
+
+        # === RSI ===
+        for n in (6, 12, 24):
+            if want(f'RSI{n}'):
+                out[f'RSI{n}'] = _rsi(close64, n).astype(dtype, copy=False)
+
+        # === KDJ（RSV 周期 9 日） ===
+        if want('K', 'D', 'J'):
+            low_min = rolling_min(low, 9)
+            high_max = rolling_max(high, 9)
+            rsv = (close - low_min) / (high_max - low_min) * 100
+            k = ewm_mean(rsv, alpha=1 / 3)
+            d = ewm_mean(k, alpha=1 / 3)
+            out['K'] = k
+            out['D'] = d
+            out['J'] = 3 * k - 2 * d
+
+        # === MACD（12 / 26 / 9） ===
+        if want('DIF', 'DEA', 'MACD'):
+            dif = ewm_mean(close64, span=12) - ewm_mean(close64, span=26)
+            dea = ewm_mean(dif, span=9)
+            out['DIF'] = dif.astype(dtype, copy=False)
+            out['DEA'] = dea.astype(dtype, copy=False)
+            out['MACD'] = (2 * (dif - dea)).astype(dtype, copy=False)
+
+        # === WR10 / WR6 ===
+        for n in (10, 6):
+            if want(f'WR{n}'):
+                high_n = rolling_max(high, n)
+                low_n = rolling_min(low, n)
+                out[f'WR{n}'] = (high_n - close) / (high_n - low_n) * 100
+
+        # === DMI（N=14，ADX 平滑周期 M=6） ===
+        if want('PDI', 'MDI', 'ADX', 'ADXR'):
+            # 两位小数的价格上 +DM、-DM 经常恰好相等，float32 舍入会改变比较结果
+            prev_close = _shift(close64, 1)
+            tr = np.fmax(np.fmax(high64 - low64, np.abs(high64 - prev_close)), np.abs(low64 - prev_close))
+            plus_dm = _diff(high64)
+            minus_dm = _shift(low64, 1) - low64
+            plus_dm = np.where((plus_dm > minus_dm) & (plus_dm > 0), plus_dm, 0.0)
+            minus_dm = np.where((minus_dm > plus_dm) & (minus_dm > 0), minus_dm, 0.0)
+
+            # TR、+DM、-DM 的 14 日和一次滚动完成
+            sums = rolling_sum(np.stack([tr, plus_dm, minus_dm], axis=-1).astype(dtype, copy=False), 14)
+            tr_sum = sums[..., 0]
+            pdi = 100 * (sums[..., 1] / tr_sum)
+            mdi = 100 * (sums[..., 2] / tr_sum)
+            dx = 100 * (np.abs(pdi - mdi) / (pdi + mdi))
+            adx = rolling_mean(dx, 6)
+            out['PDI'] = pdi
+            out['MDI'] = mdi
+            out['ADX'] = adx
+            out['ADXR'] = (adx + _shift(adx, 6)) / 2
+
+        # === BIAS ===
+        for n in (6, 12, 24):
+            if want(f'BIAS{n}'):
+                ma = rolling_mean(close, n)
+                out[f'BIAS{n}'] = (close - ma) / ma * 100
+
+        # === OBV ===
+        if want('OBV', 'OBV_MA'):
+            obv_change = _obv_change(close64, volume64)
+            obv = obv_base + np.cumsum(obv_change, axis=0)
+            out['OBV'] = obv
+            out['OBV_MA'] = rolling_mean(obv, 30)
+
+        # === CCI（14 日） ===
+        if want('CCI'):
+            tp = (high + low + close) / 3
+            tp_ma, md = rolling_mean_mad(tp, 14)
+            out['CCI'] = (tp - tp_ma) / (0.015 * md)
+
+        # === ROC（12 日，均线 6 日） ===
+        if want('ROC', 'ROC_MA'):
+            close_n = _shift(close, 12)
+            roc = (close - close_n) / close_n * 100
+            out['ROC'] = roc
+            out['ROC_MA'] = rolling_mean(roc, 6)
+
+        # === CR（26 日，均线 MA1~MA3） ===
+        if want('CR', 'MA1', 'MA2', 'MA3'):
+            mid_yesterday = _shift((high + low) / 2, 1)
+            p1 = np.where(mid_yesterday > high, 0.0, high - mid_yesterday)
+            p2 = np.where(low > mid_yesterday, 0.0, mid_yesterday - low)
+            sums = rolling_sum(np.stack([p1, p2], axis=-1), 26)
+            cr = sums[..., 0] / sums[..., 1] * 100
+            out['CR'] = cr
+            for name, n in (('MA1', 10), ('MA2', 20), ('MA3', 40)):
+                out[name] = _shift(rolling_mean(cr, n), 1 + int(n / 2.5))
+
+        # === BOLL（20 日，2 倍标准差） ===
+        if boll and want(*BOLL_COLUMNS):
+            _, mid, std = rolling_moments(close, 20)
+            out['BOLL_MID'] = mid
+            out['BOLL_STD'] = std
+            out['BOLL_UPPER'] = mid + 2 * std
+            out['BOLL_LOWER'] = mid - 2 * std
+
+    if columns is not None:
+        # 同组一起算出的其他指标不返回
+        out = {name: values for name, values in out.items() if name in columns}
+    return out
+
+
+def _ema_bars(alpha, tolerance):
+    # EMA(adjust=False) 截断 k 个输入后，初始值的残留权重为 (1 - alpha) ** (k - 1)
+    return math.ceil(math.log(tolerance) / math.log(1 - alpha)) + 1
+
+
+@lru_cache(maxsize=None)
+def warmup_bars(tolerance=LATEST_TOLERANCE, boll=False):
+    """
+    各指标要与完整历史的计算结果一致（误差不超过 tolerance 倍初始偏差）所需的尾部 K 线数
+    固定窗口类指标需要的是精确的窗口长度，EMA 类指标按收敛界计算，串联的 EMA 逐级累加
+    OBV 是从第一根 K 线开始的累计值，不在此列，由 obv_base 单独接上
+    """
+    rsv = 9
+    k = rsv - 1 + _ema_bars(1 / 3, tolerance)
+    d = k + _ema_bars(1 / 3, tolerance) - 1
+    dif = max(_ema_bars(2 / 13, tolerance), _ema_bars(2 / 27, tolerance))
+    dea = dif + _ema_bars(2 / 10, tolerance) - 1
+    adx = 1 + 14 + 6 - 1
+    cr = 1 + 26
+
+    bars = {
+        'MA5': 5, 'MA10': 10, 'MA20': 20, 'MA30': 30, 'MA60': 60,
+        'VOL': 1, 'VOL_MA5': 5, 'VOL_MA10': 10,
+        'RSI6': 1 + _ema_bars(1 / 6, tolerance),
+        'RSI12': 1 + _ema_bars(1 / 12, tolerance),
+        'RSI24': 1 + _ema_bars(1 / 24, tolerance),
+        'K': k, 'D': d, 'J': d,
+        'DIF': dif, 'DEA': dea, 'MACD': dea,
+        'WR10': 10, 'WR6': 6,
+        'PDI': 1 + 14, 'MDI': 1 + 14, 'ADX': adx, 'ADXR': adx + 6,
+        'BIAS6': 6, 'BIAS12': 12, 'BIAS24': 24,
+        'OBV': 1, 'OBV_MA': 30,
+        'CCI': 14,
+        'ROC': 1 + 12, 'ROC_MA': 1 + 12 + 6 - 1,
+        'CR': cr,
+        'MA1': cr + 10 - 1 + 1 + int(10 / 2.5),
+        'MA2': cr + 20 - 1 + 1 + int(20 / 2.5),
+        'MA3': cr + 40 - 1 + 1 + int(40 / 2.5),
+    }
+    if boll:
+        bars.update({'BOLL_MID': 20, 'BOLL_STD': 20, 'BOLL_UPPER': 20, 'BOLL_LOWER': 20})
+    return bars
+
+
+def latest_window(market, tolerance=LATEST_TOLERANCE, indicators=None):
+    """
+    最新值模式下该市场需要截取的尾部 K 线数；indicators 不为 None 时只按这些指标计算
+    """
+    bars = warmup_bars(tolerance, boll=market != "A")
+    return max((bars[name] for name in MARKET_INDICATORS[market] if indicators is None or name in indicators), default=1)
+
+
+def stored_float(value):
+    """
+    数组中的一个值转换为 Python float；float32 取能还原该值的最短十进制（40.012 而不是 40.01200103759765625）
+    """
+    return float(str(value)) if isinstance(value, np.float32) else float(value)
+
+
+def sort_by_date(df: pd.DataFrame, market):
+    """
+    按日期升序、索引从 0 开始；已经有序时不复制数据（只重建索引）
+    """
+    if df[MARKET_COLUMNS[market]["date"]].is_monotonic_increasing:
+        return df.reset_index(drop=True)
+    return df.sort_values(MARKET_COLUMNS[market]["date"]).reset_index(drop=True)
+
+
+def compute_market_indicators(df: pd.DataFrame, symbol: str, market: str,
+                              latest_only=False, tolerance=LATEST_TOLERANCE, indicators=None, lean=False):
+    """
+    按市场列名映射计算指标，返回最后一根 K 线（含原始列、指标列和 symbol）组成的单行 DataFrame
+    latest_only 为 True 时只在满足 tolerance 的尾部窗口上计算
+    indicators 不为 None 时只计算并输出这些指标；lean 为 True 时为低内存模式（float32，临时数组复用，误差见 LEAN_ERROR_BOUND）
+    """
+    columns = MARKET_COLUMNS[market]
     # 确保日期排序
-    df = df.sort_values("date").reset_index(drop=True)
-
-    # 计算 OBV
-    df["close_diff"] = df["close"].diff()
-    df["direction"] = np.where(df["close_diff"] > 0, 1, np.where(df["close_diff"] < 0, -1, 0))
-    df["obv_change"] = df["volume"] * df["direction"]
-    df["OBV"] = df["obv_change"].fillna(0).cumsum()
-    df['OBV_MA'] = df['OBV'].rolling(window=30).mean()
+    df = sort_by_date(df, market)
+
+    values = indicator_values(
+        close=df[columns["close"]].to_numpy(dtype=np.float64),
+        high=df[columns["high"]].to_numpy(dtype=np.float64),
+        low=df[columns["low"]].to_numpy(dtype=np.float64),
+        volume=df[columns["volume"]].to_numpy(dtype=np.float64),
+        market=market, latest_only=latest_only, tolerance=tolerance, indicators=indicators, lean=lean,
+    )
+    return indicator_row(df.iloc[[-1]], values, symbol, market)
+
+
+def indicator_values(close, high, low, volume, market, latest_only=False, tolerance=LATEST_TOLERANCE, indicators=None,
+                     lean=False):
+    """
+    按日期升序的数组上计算指标，返回最后一根 K 线上的 {指标名: 值}；参数含义同 compute_market_indicators
+    latest_only 且只算部分指标时，尾部窗口只取这些指标需要的长度
+    """
+    start = 0
+    obv_base = 0.0
+    if latest_only:
+        start = max(len(close) - latest_window(market, tolerance, indicators), 0)
+        # 尾部第一根 K 线（含）之前的 OBV 只需一次前缀求和
+        obv_base = _obv_change(close[:start + 1], volume[:start + 1]).sum()
+
+    arrays = compute_indicator_arrays(
+        close=close[start:],
+        high=high[start:],
+        low=low[start:],
+        volume=volume[start:],
+        boll=market != "A",
+        obv_base=obv_base,
+        columns=indicators,
+        dtype=LEAN_DTYPE if lean else np.float64,
+        scratch=thread_scratch() if lean else None,
+    )
+    return {name: values[-1] for name, values in arrays.items()}
+
+
+def indicator_row(last: pd.DataFrame, values: dict, symbol: str, market: str):
+    """
+    把最后一根 K 线和该 K 线上的指标值拼成 compute_*_indicators 返回的单行 DataFrame
+    values 只含部分指标时只输出这些指标
+    """
+    columns = MARKET_COLUMNS[market]
+    values = {name: [values[name]] for name in MARKET_INDICATORS[market] if name in values}
+    # VOL 保留原始成交量的类型
+    if 'VOL' in values:
+        values['VOL'] = last[columns["volume"]].to_numpy()
     # 将 OBV_MA 转为非科学计数法，并保留两位小数
-    df['OBV_MA'] = df['OBV_MA'].apply(lambda x: f'{x:.2f}' if pd.notnull(x) else '')
-
-    # === CCI ===
-    N = 14  # 通常为 14 天
-
-    # 1. 计算典型价格 TP
-    df['TP'] = (df['high'] + df['low'] + df['close']) / 3
-
-    # 2. 计算 TP 的 N 日简单移动平均
-    df['TP_MA'] = df['TP'].rolling(window=N).mean()
-
-    # 3. 计算 TP 的 N 日平均绝对偏差
-    df['MD'] = df['TP'].rolling(window=N).apply(lambda x: np.mean(np.abs(x - x.mean())), raw=True)
-
-    # 4. 计算 CCI
-    df['CCI'] = (df['TP'] - df['TP_MA']) / (0.015 * df['MD'])
-
-    # === ROC ===
-    N = 12  # ROC 默认周期常用值为 12
-
-    # 1. 计算 ROC
-    df['ROC'] = (df['close'] - df['close'].shift(N)) / df['close'].shift(N) * 100
-
-    # 2. 计算 ROC 的均线（如 6 日简单移动平均）
-    df['ROC_MA'] = df['ROC'].rolling(window=6).mean()
-
-    # === CR ===
-    N = 26
+    if 'OBV_MA' in values:
+        obv_ma = values['OBV_MA'][0]
+        values['OBV_MA'] = [f'{obv_ma:.2f}' if pd.notnull(obv_ma) else '']
 
-    # 1. 前一天的中间价 MID
-    df['MID'] = (df['high'] + df['low']) / 2
-    df['MID_yesterday'] = df['MID'].shift(1)
+    row = pd.DataFrame(values, index=last.index)
+    return pd.concat([last.drop(columns=row.columns, errors='ignore'), row], axis=1).assign(symbol=symbol)
 
-    # 2. 计算 CR 指标
-    P1 = (df['high'] - df['MID_yesterday']).clip(lower=0)
-    P2 = (df['MID_yesterday'] - df['low']).clip(lower=0)
 
-    df['CR'] = P1.rolling(window=N).sum() / P2.rolling(window=N).sum() * 100
+def compute_indicators(df: pd.DataFrame, symbol: str, latest_only=False, indicators=None, lean=False):
+    return compute_market_indicators(df, symbol, "A", latest_only=latest_only, indicators=indicators, lean=lean)
 
-    # 3. 计算 CR 均线 MA1~MA3
-    df['MA1'] = df['CR'].rolling(window=10).mean().shift(1 + int(10 / 2.5))
-    df['MA2'] = df['CR'].rolling(window=20).mean().shift(1 + int(20 / 2.5))
-    df['MA3'] = df['CR'].rolling(window=40).mean().shift(1 + int(40 / 2.5))
 
-    # === BOLL ===
-    # 设置参数
-    N = 20  # 移动平均周期
-    K = 2  # 标准差倍数
+def compute_hk_indicators(df: pd.DataFrame, symbol: str, latest_only=False, indicators=None, lean=False):
+    return compute_market_indicators(df, symbol, "HK", latest_only=latest_only, indicators=indicators, lean=lean)
 
-    # 计算布林带
-    df['BOLL_MID'] = df['close'].rolling(N).mean()  # 中轨
-    df['BOLL_STD'] = df['close'].rolling(N).std()  # 标准差
-    df['BOLL_UPPER'] = df['BOLL_MID'] + K * df['BOLL_STD']  # 上轨
-    df['BOLL_LOWER'] = df['BOLL_MID'] - K * df['BOLL_STD']  # 下轨
 
-    return df.iloc[[-1]].assign(symbol=symbol)
\ No newline at end of file
+def compute_us_indicators(df: pd.DataFrame, symbol: str, latest_only=False, indicators=None, lean=False):
+    return compute_market_indicators(df, symbol, "US", latest_only=latest_only, indicators=indicators, lean=lean)
@@ -1,46 +1,58 @@
 import os
 import json
+import numbers
+import datetime
 import pandas as pd
-from openpyxl import load_workbook, Workbook
-from openpyxl.drawing.image import Image
-from openpyxl.utils import get_column_letter
 
+from compute_utils import INDICATOR_COLUMNS, BOLL_COLUMNS
+from stock_result import result_sections, format_txt
+from run_metrics import METRICS
 
-def generateTxt(name, code, onError):
+# 结果文件保存目录，每天一个子文件夹
+RESULT_DIR = "result"
+
+# 汇总 Excel 中【数据指标】的列
+ALL_INDICATORS = INDICATOR_COLUMNS + BOLL_COLUMNS
+
+
+def cellValue(value):
+    """
+    单元格的值：openpyxl 只接受数字、字符串、日期等标量，列表、字典等嵌套值（如美股 info 的 companyOfficers）转成 JSON 文本
+    """
+    if value is None or isinstance(value, (str, numbers.Number, datetime.date, datetime.time, datetime.timedelta)):
+        return value
+    if isinstance(value, (list, tuple, dict, set)):
+        return json.dumps(list(value) if isinstance(value, (tuple, set)) else value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+def loadResult(code):
+    with open(os.path.join("temp", code + ".json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def generateTxt(name, code, onError, result=None):
     try:
-        # 读取 JSON 文件
-        with open(os.path.join("temp", code + ".json"), "r", encoding="utf-8") as f:
-            jsonData = json.load(f)
+        # 没有传入结果时读取 temp 中保存的 JSON 文件
+        if result is None:
+            result = loadResult(code)
 
         # 当前时间与路径设置
         time = pd.Timestamp.now()
         formatTime = time.strftime('%Y-%m-%d')
-        dir_path = os.path.join("result", formatTime)
+        dir_path = os.path.join(RESULT_DIR, formatTime)
         os.makedirs(dir_path, exist_ok=True)
 
         txt_path = os.path.join(dir_path, f"{name}({code}) {formatTime}.txt")
 
-        with open(txt_path, "w", encoding="utf-8") as f_txt:
-
-            # 写入【股票信息】
-            if "股票信息" in jsonData:
-                f_txt.write("【股票信息】\n")
-                for key, value in jsonData["股票信息"].items():
-                    f_txt.write(f"{key}: {value}\n")
-                f_txt.write("\n")
-
-            # 写入【今日概览】（A股才有）
-            if "今日概览" in jsonData:
-                f_txt.write("【今日概览】\n")
-                for key, value in jsonData["今日概览"].items():
-                    f_txt.write(f"{key}: {value}\n")
-                f_txt.write("\n")
-
-            # 写入【数据指标】
-            if "数据指标" in jsonData:
-                f_txt.write("【数据指标】\n")
-                for key, value in jsonData["数据指标"].items():
-                    f_txt.write(f"{key}: {value}\n")
+        # 【股票信息】、【今日概览】（港股没有）、【数据指标】一次写入
+        with METRICS.timer("serialization", "txt", code) as timer:
+            text = format_txt(result_sections(result))
+            timer.rows = text.count("\n")
+        with METRICS.timer("file_write", "txt", code) as timer:
+            with open(txt_path, "w", encoding="utf-8") as f_txt:
+                f_txt.write(text)
+            timer.bytes = os.path.getsize(txt_path)
 
         print(f"✅ TXT 文件已保存到: {txt_path}")
 
@@ -51,16 +63,20 @@ def generateTxt(name, code, onError):
         onError(f"{code} 生成 TXT 失败")
 
 
-def generateExcel(name, code, onError):
+def generateExcel(name, code, onError, result=None):
+    # 用到时才导入 openpyxl，只输出 TXT 的运行不加载
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
     try:
-        # 读取 JSON 文件
-        with open(os.path.join("temp", code + ".json"), "r", encoding="utf-8") as f:
-            jsonData = json.load(f)
+        # 没有传入结果时读取 temp 中保存的 JSON 文件
+        if result is None:
+            result = loadResult(code)
 
         # 创建文件保存目录
         time = pd.Timestamp.now()
         formatTime = time.strftime('%Y-%m-%d')
-        dir_path = os.path.join("result", formatTime)
+        dir_path = os.path.join(RESULT_DIR, formatTime)
         os.makedirs(dir_path, exist_ok=True)
 
         excel_path = os.path.join(dir_path, f"{name}({code}) {formatTime}.xlsx")
@@ -72,32 +88,108 @@ def generateExcel(name, code, onError):
             ws = wb.create_sheet(title=sheet_name)
             for row_idx, (key, value) in enumerate(data_dict.items(), start=1):
                 ws.cell(row=row_idx, column=1, value=key)
-                ws.cell(row=row_idx, column=2, value=value)
+                ws.cell(row=row_idx, column=2, value=cellValue(value))
                 # 自动列宽（可选）
                 ws.column_dimensions[get_column_letter(1)].width = 20
                 ws.column_dimensions[get_column_letter(2)].width = 40
 
-        # 写入【股票信息】
-        if "股票信息" in jsonData:
-            write_dict_to_sheet("股票信息", jsonData["股票信息"])
-
-        # 写入【今日概览】（A 股特有）
-        if "今日概览" in jsonData:
-            write_dict_to_sheet("今日概览", jsonData["今日概览"])
-
-        # 写入【数据指标】
-        if "数据指标" in jsonData:
-            write_dict_to_sheet("数据指标", jsonData["数据指标"])
+        # 【股票信息】、【今日概览】（港股没有）、【数据指标】各一个 sheet
+        with METRICS.timer("serialization", "excel", code) as timer:
+            for sheet_name, data_dict in result_sections(result):
+                write_dict_to_sheet(sheet_name, data_dict)
+                timer.rows += len(data_dict)
 
-        # 删除默认的空 sheet
-        if "Sheet" in wb.sheetnames:
-            del wb["Sheet"]
+            # 删除默认的空 sheet
+            if "Sheet" in wb.sheetnames:
+                del wb["Sheet"]
 
         # 保存文件
-        wb.save(excel_path)
+        with METRICS.timer("file_write", "excel", code) as timer:
+            wb.save(excel_path)
+            timer.bytes = os.path.getsize(excel_path)
         print(f"✅ Excel 文件已保存到: {excel_path}")
 
     except Exception as e:
         with open("error.log", "a", encoding="utf-8") as f_log:
             f_log.write(f"{code} - {str(e)}\n")
-        onError(f"{code} 生成 Excel 失败")
\ No newline at end of file
+        onError(f"{code} 生成 Excel 失败")
+
+class WorkbookWriter:
+    """
+    汇总 Excel：整个自选列表写入同一个工作簿（openpyxl 只写模式，逐行写入磁盘，内存占用与股票数量无关）
+    【数据指标】每只股票一行、每个指标一列；【股票信息】【今日概览】各市场字段不同，每个字段一行
+    只能在同一个线程中使用
+    """
+
+    def __init__(self, formatTime=None):
+        from openpyxl import Workbook
+        from openpyxl.utils import get_column_letter
+
+        self.formatTime = formatTime or pd.Timestamp.now().strftime('%Y-%m-%d')
+        dir_path = os.path.join(RESULT_DIR, self.formatTime)
+        os.makedirs(dir_path, exist_ok=True)
+        self.path = os.path.join(dir_path, f"汇总({self.formatTime}).xlsx")
+        self.rows = 0
+
+        self.wb = Workbook(write_only=True)
+        self.sheets = {}
+        for sheet_name, header, widths in (
+                ("数据指标", ["股票代码", "股票名称"] + ALL_INDICATORS, [12, 16] + [14] * len(ALL_INDICATORS)),
+                ("股票信息", ["股票代码", "股票名称", "项目", "值"], [12, 16, 20, 40]),
+                ("今日概览", ["股票代码", "股票名称", "项目", "值"], [12, 16, 20, 40])):
+            ws = self.wb.create_sheet(title=sheet_name)
+            # 只写模式下列宽须在写入第一行之前设置
+            for column, width in enumerate(widths, start=1):
+                ws.column_dimensions[get_column_letter(column)].width = width
+            ws.freeze_panes = "C2"
+            ws.append(header)
+            self.sheets[sheet_name] = ws
+
+    def add(self, name, code, onError, result=None):
+        try:
+            # 没有传入结果时读取 temp 中保存的 JSON 文件
+            if result is None:
+                result = loadResult(code)
+
+            from openpyxl.cell import WriteOnlyCell
+
+            # 先在内存中生成这只股票的全部行（创建单元格时就会检查值），全部成功后再写入
+            # 只写模式下一行写到一半出错会留下残缺的 XML，整个工作簿都无法打开；这样出错时只跳过这只股票
+            with METRICS.timer("serialization", "workbook", code) as timer:
+                rows = []
+                for sheet_name, data_dict in result_sections(result):
+                    ws = self.sheets[sheet_name]
+                    if sheet_name == "数据指标":
+                        # 港股、美股才有 BOLL，A 股对应的列留空
+                        values = [[code, name] + [data_dict.get(column) for column in ALL_INDICATORS]]
+                    else:
+                        values = [[code, name, key, value] for key, value in data_dict.items()]
+                    for row in values:
+                        rows.append((ws, [WriteOnlyCell(ws, value=cellValue(value)) for value in row]))
+                for ws, cells in rows:
+                    ws.append(cells)
+                timer.rows += len(rows)
+            self.rows += 1
+
+        except Exception as e:
+            with open("error.log", "a", encoding="utf-8") as f_log:
+                f_log.write(f"{code} - {str(e)}\n")
+            onError(f"{code} 写入汇总 Excel 失败")
+
+    def save(self, onError):
+        try:
+            # 只写模式的行在 add 时已写入临时文件，这里是压缩打包成 xlsx
+            with METRICS.timer("file_write", "workbook") as timer:
+                self.wb.save(self.path)
+                timer.bytes = os.path.getsize(self.path)
+            print(f"✅ 汇总 Excel 文件已保存到: {self.path}（{self.rows} 只股票）")
+        except Exception as e:
+            with open("error.log", "a", encoding="utf-8") as f_log:
+                f_log.write(f"汇总 Excel - {str(e)}\n")
+            onError("生成汇总 Excel 失败")
+
+
+def panelSnapshotPath(markets, formatTime=None):
+    # 全市场模式的快照表，与其他结果文件放在同一个日期目录下
+    formatTime = formatTime or pd.Timestamp.now().strftime('%Y-%m-%d')
+    return os.path.join(RESULT_DIR, formatTime, f"全市场指标-{'-'.join(markets)}({formatTime}).csv")
@@ -0,0 +1,243 @@
+import asyncio
+import concurrent.futures
+import random
+import time
+from collections import Counter
+from functools import partial
+
+from run_metrics import METRICS
+
+# 各数据源的并发上限和令牌桶限速（rate：每秒补充的请求数，burst：桶容量）
+PROVIDER_LIMITS = {
+    "eastmoney": {"concurrency": 8, "rate": 8.0, "burst": 16},  # A股、港股（akshare 东方财富接口）
+    "yahoo": {"concurrency": 4, "rate": 2.0, "burst": 4},  # 美股（yfinance）
+}
+
+
+# 失败重试：指数退避加随机抖动（full jitter）；max_total_delay 为一个任务累计退避等待的上限（秒），用完即放弃
+RETRY_POLICY = {"max_retries": 10, "base_delay": 1.0, "max_delay": 60.0, "max_total_delay": 120.0}
+
+# 数据或解析错误（没有行情数据、返回的表格缺列、K 线不足等）：重试也不会成功，直接失败，不计入熔断
+DATA_ERRORS = (ValueError, LookupError, TypeError, AttributeError)
+
+# 不继承网络异常的限流异常，按类名识别（不为此导入 yfinance）
+RATE_LIMIT_ERRORS = ("YFRateLimitError",)
+
+# 熔断：连续失败 failure_threshold 次后暂停该市场 reset_timeout 秒，之后放一个试探请求；
+# 一次运行中熔断超过 max_trips 次视为数据源不可用，剩余任务直接失败
+BREAKER_POLICY = {"failure_threshold": 5, "reset_timeout": 30.0, "max_trips": 3}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_retryable(exc):
+    """
+    只有网络错误、超时、数据源 5xx（及 429 限流）值得重试；其余都是数据或解析错误
+    requests 的异常继承 OSError，其中 JSONDecodeError 同时继承 ValueError，按解析错误处理
+    """
+    if isinstance(exc, DATA_ERRORS):
+        return False
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return isinstance(exc, OSError) or type(exc).__name__ in RATE_LIMIT_ERRORS
+
+
+class CircuitBreaker:
+    """
+    单个市场的熔断器，只在事件循环线程中使用
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout, max_trips):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_trips = max_trips
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def before_call(self):
+        """
+        返回还需等待的秒数，0 表示可以发起请求；数据源已判定不可用时抛出 CircuitOpenError
+        """
+        if self.trips > self.max_trips:
+            raise CircuitOpenError(f"{self.name} 数据源熔断")
+        if self.state == "closed":
+            return 0.0
+        if self.state == "open":
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self.state = "half_open"
+        # 半开状态只放行一个试探请求
+        if self.probing:
+            return 1.0
+        self.probing = True
+        return 0.0
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trips += 1
+            self.failures = 0
+        self.probing = False
+
+    def report(self):
+        return {"state": self.state, "trips": self.trips, "gave_up": self.trips > self.max_trips}
+
+
+class TokenBucket:
+    """
+    令牌桶：按 rate 匀速补充令牌，最多攒 burst 个，取不到令牌时异步等待而不占用线程
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        tokens = min(tokens, self.burst)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class Provider:
+    def __init__(self, name, concurrency, rate, burst):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+
+
+class AsyncFetchEngine:
+    """
+    异步抓取引擎：每个数据源单独限制并发数和请求速率，
+    akshare / yfinance 的阻塞调用通过有界线程池执行，线程数与股票数量无关
+    须在事件循环中创建和使用
+    """
+
+    def __init__(self, max_workers, limits=None, retry_policy=None, breaker_policy=None):
+        limits = PROVIDER_LIMITS if limits is None else limits
+        self.retry_policy = RETRY_POLICY if retry_policy is None else retry_policy
+        self.breaker_policy = BREAKER_POLICY if breaker_policy is None else breaker_policy
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self.providers = {
+            name: Provider(name, min(limit["concurrency"], max(1, max_workers)), limit["rate"], limit["burst"])
+            for name, limit in limits.items()
+        }
+        self.breakers = {}
+        self.retries = Counter()
+        self.failures = Counter()
+
+    def start_run(self):
+        """
+        复用同一个引擎开始新一轮运行：清空统计，已判定不可用的数据源重新给一次机会
+        """
+        self.retries.clear()
+        self.failures.clear()
+        for name, breaker in list(self.breakers.items()):
+            if breaker.trips > breaker.max_trips:
+                del self.breakers[name]
+            else:
+                breaker.trips = 0
+
+    def breaker(self, name):
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name, **self.breaker_policy)
+        return self.breakers[name]
+
+    def retry_delay(self, attempt):
+        policy = self.retry_policy
+        return random.uniform(0, min(policy["max_delay"], policy["base_delay"] * 2 ** (attempt - 1)))
+
+    async def run(self, provider, func, *args, cost=1, **kwargs):
+        """
+        在线程池中执行阻塞函数 func；provider 为 None 时不受数据源限制（如只做本地计算的任务）
+        cost 为这次调用要向该数据源发出的请求数
+        """
+        loop = asyncio.get_running_loop()
+        call = partial(func, *args, **kwargs)
+        if provider is None:
+            return await loop.run_in_executor(self.executor, call)
+
+        limiter = self.providers[provider]
+        async with limiter.semaphore:
+            await limiter.bucket.acquire(cost)
+            return await loop.run_in_executor(self.executor, call)
+
+    async def run_with_retry(self, label, provider, breaker, func, *args, cost=1, **kwargs):
+        """
+        带重试和熔断的 run：网络类错误（见 is_retryable）按指数退避重新排队，等待期间不占用线程，
+        累计退避超过 max_total_delay 秒后放弃；数据错误直接抛出，不计入熔断
+        breaker 为熔断器名（按市场划分），熔断期间暂停该市场的请求
+        """
+        circuit = self.breaker(breaker)
+        attempt = 0
+        waited = 0.0
+        while True:
+            try:
+                wait = circuit.before_call()
+                while wait > 0:
+                    METRICS.observe("retry_wait", provider or breaker, wait, label)
+                    await asyncio.sleep(wait)
+                    wait = circuit.before_call()
+            except CircuitOpenError:
+                self.failures[breaker] += 1
+                raise
+            try:
+                result = await self.run(provider, func, *args, cost=cost, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # 数据源有响应，只是这只股票的数据有问题
+                    circuit.record_success()
+                    self.failures[breaker] += 1
+                    raise
+                circuit.record_failure()
+                attempt += 1
+                remaining = self.retry_policy["max_total_delay"] - waited
+                if attempt > self.retry_policy["max_retries"] or remaining <= 0:
+                    self.failures[breaker] += 1
+                    raise
+                self.retries[breaker] += 1
+                print(f"{label}:重试中 ({attempt}/{self.retry_policy['max_retries']})")
+                delay = min(self.retry_delay(attempt), remaining)
+                waited += delay
+                METRICS.observe("retry_wait", provider or breaker, delay, label)
+                await asyncio.sleep(delay)
+                continue
+            circuit.record_success()
+            return result
+
+    def report(self):
+        """
+        本次运行各市场的重试次数、最终失败数和熔断器状态
+        """
+        return {
+            "retries": dict(self.retries),
+            "failures": dict(self.failures),
+            "breakers": {name: breaker.report() for name, breaker in self.breakers.items()},
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
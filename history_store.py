@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# 本地行情数据目录：history/<市场>/<复权方式>/<代码>/，每列一个 .npy 文件，列名和类型记录在 meta.json
+HISTORY_DIR = "history"
+
+
+class HistoryStore:
+    """
+    按 (市场, 代码, 复权方式) 保存日线数据的本地列式存储
+    """
+
+    def __init__(self, root=HISTORY_DIR):
+        self.root = root
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def path(self, market, symbol, adjust):
+        return os.path.join(self.root, market, adjust or "none", symbol)
+
+    def lock(self, market, symbol, adjust):
+        # 同一只股票的读写串行，不同股票互不影响
+        key = (market, symbol, adjust)
+        with self._locks_lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def load(self, market, symbol, adjust):
+        path = self.path(market, symbol, adjust)
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        data = {}
+        for column in meta["columns"]:
+            values = np.load(os.path.join(path, column["file"]), allow_pickle=False)
+            if column["kind"] == "date":
+                values = pd.to_datetime(values).date
+            elif column["kind"] == "str":
+                values = values.astype(object)
+            data[column["name"]] = values
+        return pd.DataFrame(data)
+
+    def save(self, market, symbol, adjust, df: pd.DataFrame):
+        path = self.path(market, symbol, adjust)
+        temp_path = path + ".tmp"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+
+        columns = []
+        for index, name in enumerate(df.columns):
+            values, kind = _column_values(df[name])
+            file_name = f"{index}.npy"
+            np.save(os.path.join(temp_path, file_name), values, allow_pickle=False)
+            columns.append({"name": name, "file": file_name, "kind": kind})
+
+        with open(os.path.join(temp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"columns": columns, "rows": len(df)}, f, ensure_ascii=False)
+
+        # 整个目录替换，读到的要么是旧数据要么是新数据
+        old_path = path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(temp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _column_values(series: pd.Series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(), "datetime"
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(), "number"
+    first = series.dropna().iloc[0] if series.notna().any() else None
+    if isinstance(first, date):
+        return pd.to_datetime(series).to_numpy(dtype="datetime64[ns]"), "date"
+    return series.astype(str).to_numpy(dtype=str), "str"
+
+
+def fetch_incremental(store: HistoryStore, market, symbol, adjust, date_column, close_column, fetch):
+    """
+    先读本地已存的历史，只向数据源请求最后两根 K 线之后的数据并追加保存
+    fetch(start) 以 pd.Timestamp 为起始日期请求数据，start 为 None 时请求全部历史
+    复权数据在分红送转后会整体变化：重叠的倒数第二根 K 线收盘价对不上时，重新下载全部历史
+    """
+    with store.lock(market, symbol, adjust):
+        stored = store.load(market, symbol, adjust)
+        if stored is None or len(stored) < 2:
+            df = fetch(None)
+            store.save(market, symbol, adjust, df)
+            return df
+
+        stored_dates = pd.to_datetime(stored[date_column])
+        # 最后一根可能是盘中未收盘的数据，从倒数第二根开始重叠请求，用它来校验
+        anchor = stored_dates.iloc[-2]
+        new = fetch(anchor)
+        if new is None or len(new) == 0:
+            return stored
+
+        new_dates = pd.to_datetime(new[date_column])
+        overlap = new[new_dates == anchor]
+        if len(overlap) == 0 or not np.isclose(float(overlap[close_column].iloc[0]),
+                                               float(stored[close_column].iloc[-2])):
+            df = fetch(None)
+        else:
+            df = pd.concat([stored[stored_dates < anchor], new], ignore_index=True)
+        store.save(market, symbol, adjust, df)
+        return df
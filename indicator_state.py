@@ -0,0 +1,423 @@
+import json
+import math
+import os
+from collections import deque
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from compute_utils import MARKET_COLUMNS, LEAN_DTYPE, compute_indicator_arrays, stored_float, _diff, _shift
+from rolling_kernels import rolling_mean, rolling_min, rolling_max, ewm_mean, wilder_smooth, thread_scratch
+
+# 每只股票的增量指标状态保存目录
+STATE_DIR = "state"
+
+# 各滚动窗口需要保留的最近 K 线数
+BUFFER_SIZES = {
+    "close": 60,  # MA5~MA60、BIAS、BOLL，以及 ROC 的 12 日前收盘价
+    "high": 10,  # KDJ、WR
+    "low": 10,
+    "volume": 10,  # VOL_MA5 / VOL_MA10
+    "tr": 14,  # DMI
+    "plus_dm": 14,
+    "minus_dm": 14,
+    "dx": 6,
+    "adx": 7,  # ADXR 需要 6 日前的 ADX
+    "obv": 30,
+    "tp": 14,  # CCI
+    "roc": 6,
+    "p1": 26,  # CR
+    "p2": 26,
+    "cr": 40,
+    "cr_ma1": 1 + int(10 / 2.5) + 1,  # CR 均线整体后移 1 + int(n / 2.5) 日
+    "cr_ma2": 1 + int(20 / 2.5) + 1,
+    "cr_ma3": 1 + int(40 / 2.5) + 1,
+}
+
+# 递推 EMA 的 com 参数（与 pandas 内部一致：alpha = 1 / (1 + com)）
+EWM_COMS = {
+    "gain6": 6 - 1, "loss6": 6 - 1,
+    "gain12": 12 - 1, "loss12": 12 - 1,
+    "gain24": 24 - 1, "loss24": 24 - 1,
+    "k": 3 - 1, "d": 3 - 1,
+    "ema12": (12 - 1) / 2, "ema26": (26 - 1) / 2, "dea": (9 - 1) / 2,
+}
+
+
+class _Ewm:
+    """
+    与 pandas ewm(adjust=False).mean() 逐点一致的递推 EMA（含 NaN 的处理）
+    """
+    __slots__ = ("com", "weighted", "old_wt")
+
+    def __init__(self, com, weighted=math.nan, old_wt=1.0):
+        self.com = com
+        self.weighted = weighted
+        self.old_wt = old_wt
+
+    def update(self, x):
+        alpha = 1. / (1. + self.com)
+        if self.weighted == self.weighted:
+            self.old_wt *= 1. - alpha
+            if x == x:
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted + alpha * x) / (self.old_wt + alpha)
+                self.old_wt = 1.
+        elif x == x:
+            self.weighted = x
+        return self.weighted
+
+
+def _tail(buf, n):
+    if len(buf) < n:
+        return None
+    return np.fromiter(islice(buf, len(buf) - n, None), dtype=np.float64, count=n)
+
+
+def _mean(buf, n):
+    values = _tail(buf, n)
+    return np.nan if values is None else np.mean(values)
+
+
+def _sum(buf, n):
+    values = _tail(buf, n)
+    return np.nan if values is None else np.sum(values)
+
+
+class IndicatorState:
+    """
+    单只股票的增量指标状态：保存各 EMA 的当前值和滚动窗口的环形缓冲区，
+    每来一根新 K 线只需 update 一次，结果与 compute_indicator_arrays 逐根一致
+    """
+
+    def __init__(self, market):
+        self.market = market
+        self.last_date = None
+        self.last_close = None
+        self.bars = 0
+        self.prev = {"close": np.nan, "high": np.nan, "low": np.nan, "mid": np.nan}
+        self.ewm = {name: _Ewm(com) for name, com in EWM_COMS.items()}
+        self.buffers = {name: deque(maxlen=size) for name, size in BUFFER_SIZES.items()}
+        self.obv = 0.0
+        self.latest = {}
+        # 由低内存模式的批量计算建立（误差见 LEAN_ERROR_BOUND）；正常模式读到这样的状态时重建
+        self.lean = False
+
+    def update(self, date, high, low, close, volume):
+        """
+        折叠一根新 K 线，返回该 K 线上的全部指标值
+        """
+        high, low, close, volume = (np.float64(v) for v in (high, low, close, volume))
+        buf = self.buffers
+        ewm = self.ewm
+        prev_close = self.prev["close"]
+        out = {}
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            buf["close"].append(close)
+            buf["high"].append(high)
+            buf["low"].append(low)
+            buf["volume"].append(volume)
+
+            # === MA ===
+            for n in (5, 10, 20, 30, 60):
+                out[f'MA{n}'] = _mean(buf["close"], n)
+
+            # === 成交量及其 MA5 / MA10 ===
+            out['VOL'] = volume
+            out['VOL_MA5'] = _mean(buf["volume"], 5)
+            out['VOL_MA10'] = _mean(buf["volume"], 10)
+
+            # === RSI ===
+            delta = close - prev_close
+            gain = 0.0 if delta < 0 else delta
+            loss = -(0.0 if delta > 0 else delta)
+            for n in (6, 12, 24):
+                rs = ewm[f"gain{n}"].update(gain) / ewm[f"loss{n}"].update(loss)
+                out[f'RSI{n}'] = 100 - (100 / (1 + rs))
+
+            # === KDJ ===
+            lows, highs = _tail(buf["low"], 9), _tail(buf["high"], 9)
+            if lows is None:
+                rsv = np.nan
+            else:
+                low_min, high_max = np.min(lows), np.max(highs)
+                rsv = (close - low_min) / (high_max - low_min) * 100
+            k = ewm["k"].update(rsv)
+            d = ewm["d"].update(k)
+            out['K'] = k
+            out['D'] = d
+            out['J'] = 3 * k - 2 * d
+
+            # === MACD ===
+            dif = ewm["ema12"].update(close) - ewm["ema26"].update(close)
+            dea = ewm["dea"].update(dif)
+            out['DIF'] = dif
+            out['DEA'] = dea
+            out['MACD'] = 2 * (dif - dea)
+
+            # === WR10 / WR6 ===
+            for n in (10, 6):
+                highs, lows = _tail(buf["high"], n), _tail(buf["low"], n)
+                if highs is None:
+                    out[f'WR{n}'] = np.nan
+                else:
+                    high_n, low_n = np.max(highs), np.min(lows)
+                    out[f'WR{n}'] = (high_n - close) / (high_n - low_n) * 100
+
+            # === DMI ===
+            tr = np.fmax(np.fmax(high - low, abs(high - prev_close)), abs(low - prev_close))
+            plus_dm = high - self.prev["high"]
+            minus_dm = self.prev["low"] - low
+            plus_dm = plus_dm if (plus_dm > minus_dm) and (plus_dm > 0) else 0.0
+            minus_dm = minus_dm if (minus_dm > plus_dm) and (minus_dm > 0) else 0.0
+            buf["tr"].append(tr)
+            buf["plus_dm"].append(plus_dm)
+            buf["minus_dm"].append(minus_dm)
+
+            tr_sum = _sum(buf["tr"], 14)
+            pdi = 100 * (_sum(buf["plus_dm"], 14) / tr_sum)
+            mdi = 100 * (_sum(buf["minus_dm"], 14) / tr_sum)
+            buf["dx"].append(100 * (abs(pdi - mdi) / (pdi + mdi)))
+            adx = _mean(buf["dx"], 6)
+            buf["adx"].append(adx)
+            out['PDI'] = pdi
+            out['MDI'] = mdi
+            out['ADX'] = adx
+            out['ADXR'] = (adx + buf["adx"][0]) / 2 if len(buf["adx"]) == BUFFER_SIZES["adx"] else np.nan
+
+            # === BIAS ===
+            for n in (6, 12, 24):
+                ma = _mean(buf["close"], n)
+                out[f'BIAS{n}'] = (close - ma) / ma * 100
+
+            # === OBV ===
+            obv_change = volume * (1 if delta > 0 else -1 if delta < 0 else 0)
+            if obv_change == obv_change:
+                self.obv += obv_change
+            buf["obv"].append(self.obv)
+            out['OBV'] = self.obv
+            out['OBV_MA'] = _mean(buf["obv"], 30)
+
+            # === CCI ===
+            tp = (high + low + close) / 3
+            buf["tp"].append(tp)
+            tps = _tail(buf["tp"], 14)
+            if tps is None:
+                out['CCI'] = np.nan
+            else:
+                tp_ma = np.mean(tps)
+                out['CCI'] = (tp - tp_ma) / (0.015 * np.mean(np.abs(tps - tp_ma)))
+
+            # === ROC ===
+            close_n = buf["close"][-13] if len(buf["close"]) >= 13 else np.nan
+            roc = (close - close_n) / close_n * 100
+            buf["roc"].append(roc)
+            out['ROC'] = roc
+            out['ROC_MA'] = _mean(buf["roc"], 6)
+
+            # === CR ===
+            mid_yesterday = self.prev["mid"]
+            buf["p1"].append(0.0 if mid_yesterday > high else high - mid_yesterday)
+            buf["p2"].append(0.0 if low > mid_yesterday else mid_yesterday - low)
+            cr = _sum(buf["p1"], 26) / _sum(buf["p2"], 26) * 100
+            buf["cr"].append(cr)
+            out['CR'] = cr
+            for name, n in (('MA1', 10), ('MA2', 20), ('MA3', 40)):
+                history = buf[f"cr_{name.lower()}"]
+                history.append(_mean(buf["cr"], n))
+                out[name] = history[0] if len(history) == history.maxlen else np.nan
+
+            # === BOLL ===
+            if self.market != "A":
+                closes = _tail(buf["close"], 20)
+                mid = _mean(buf["close"], 20)
+                std = np.nan if closes is None else np.std(closes, ddof=1)
+                out['BOLL_MID'] = mid
+                out['BOLL_STD'] = std
+                out['BOLL_UPPER'] = mid + 2 * std
+                out['BOLL_LOWER'] = mid - 2 * std
+
+        self.prev = {"close": close, "high": high, "low": low, "mid": (high + low) / 2}
+        self.last_date = date
+        self.last_close = float(close)
+        self.bars += 1
+        self.latest = {name: float(value) for name, value in out.items()}
+        return out
+
+    def extend_arrays(self, dates, high, low, close, volume):
+        count = 0
+        for date, h, l, c, v in zip(dates, high, low, close, volume):
+            if self.last_date is not None and date <= self.last_date:
+                continue
+            self.update(date, h, l, c, v)
+            count += 1
+        return count
+
+    @classmethod
+    def from_arrays(cls, dates, high, low, close, volume, market, lean=False):
+        """
+        用一次批量计算的结果直接生成状态，避免逐根回放整段历史
+        lean 为 True 时这次批量计算按低内存模式进行（float32，临时数组复用），之后的增量更新仍为 float64
+        """
+        arrays = compute_indicator_arrays(close, high, low, volume, boll=market != "A",
+                                          dtype=LEAN_DTYPE if lean else np.float64,
+                                          scratch=thread_scratch() if lean else None)
+
+        state = cls(market)
+        state.lean = lean
+        if len(close) == 0:
+            return state
+        state.last_date = dates[-1]
+        state.last_close = float(close[-1])
+        state.bars = len(close)
+        state.prev = {"close": close[-1], "high": high[-1], "low": low[-1], "mid": (high[-1] + low[-1]) / 2}
+        state.obv = float(arrays['OBV'][-1])
+        state.latest = {name: stored_float(values[-1]) for name, values in arrays.items()}
+
+        # 只有 EMA 本身不在输出里的（RSI 的平均涨跌幅、EMA12/EMA26、RSV）需要单独再算一遍
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = _diff(close)
+            gain = np.where(delta < 0, 0.0, delta)
+            loss = -np.where(delta > 0, 0.0, delta)
+            low_min = rolling_min(low, 9)
+            rsv = (close - low_min) / (rolling_max(high, 9) - low_min) * 100
+            inputs = {"ema12": (close, ewm_mean(close, span=12)), "ema26": (close, ewm_mean(close, span=26)),
+                      "k": (rsv, arrays['K']), "d": (arrays['K'], arrays['D']),
+                      "dea": (arrays['DIF'], arrays['DEA'])}
+            for n in (6, 12, 24):
+                inputs[f"gain{n}"] = (gain, wilder_smooth(gain, n))
+                inputs[f"loss{n}"] = (loss, wilder_smooth(loss, n))
+            for name, (values, output) in inputs.items():
+                state.ewm[name] = _ewm_state(EWM_COMS[name], values, float(output[-1]))
+
+            # 滚动窗口缓冲区取各中间序列的尾部；尾部切片要比最长的缓冲区长，切口处的首根才不会进入缓冲区
+            start = max(len(close) - 64, 0)
+            c, h, l = close[start:], high[start:], low[start:]
+            prev_close = _shift(c, 1)
+            plus_dm = _diff(h)
+            minus_dm = _shift(l, 1) - l
+            plus_dm = np.where((plus_dm > minus_dm) & (plus_dm > 0), plus_dm, 0.0)
+            minus_dm = np.where((minus_dm > plus_dm) & (minus_dm > 0), minus_dm, 0.0)
+            pdi, mdi = arrays['PDI'], arrays['MDI']
+            mid_yesterday = _shift((high + low) / 2, 1)
+            cr = arrays['CR'][start:]
+            series = {
+                "close": close, "high": high, "low": low, "volume": volume,
+                "tr": np.fmax(np.fmax(h - l, np.abs(h - prev_close)), np.abs(l - prev_close)),
+                "plus_dm": plus_dm, "minus_dm": minus_dm,
+                "dx": 100 * (np.abs(pdi - mdi) / (pdi + mdi)),
+                "adx": arrays['ADX'], "obv": arrays['OBV'],
+                "tp": (h + l + c) / 3, "roc": arrays['ROC'],
+                "p1": np.where(mid_yesterday > high, 0.0, high - mid_yesterday),
+                "p2": np.where(low > mid_yesterday, 0.0, mid_yesterday - low),
+                "cr": cr,
+                "cr_ma1": rolling_mean(cr, 10),
+                "cr_ma2": rolling_mean(cr, 20),
+                "cr_ma3": rolling_mean(cr, 40),
+            }
+            for name, values in series.items():
+                state.buffers[name].extend(np.asarray(values[-BUFFER_SIZES[name]:], dtype=np.float64))
+        return state
+
+    def to_dict(self):
+        return {
+            "market": self.market,
+            "last_date": self.last_date,
+            "last_close": self.last_close,
+            "bars": self.bars,
+            "prev": {name: float(value) for name, value in self.prev.items()},
+            "ewm": {name: [e.com, float(e.weighted), e.old_wt] for name, e in self.ewm.items()},
+            "buffers": {name: [float(v) for v in values] for name, values in self.buffers.items()},
+            "obv": float(self.obv),
+            "latest": self.latest,
+            "lean": self.lean,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data["market"])
+        state.last_date = data["last_date"]
+        state.last_close = data["last_close"]
+        state.bars = data["bars"]
+        state.prev = {name: np.float64(value) for name, value in data["prev"].items()}
+        state.ewm = {name: _Ewm(*values) for name, values in data["ewm"].items()}
+        state.buffers = {name: deque((np.float64(v) for v in data["buffers"][name]), maxlen=size)
+                         for name, size in BUFFER_SIZES.items()}
+        state.obv = data["obv"]
+        state.latest = data["latest"]
+        state.lean = data.get("lean", False)
+        return state
+
+    def save(self, path):
+        # 先写临时文件再替换，避免中途出错留下半个状态文件
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def _ewm_state(com, values, weighted):
+    # 已开始的 EMA 在最后一个有效输入后 old_wt 复位为 1，此后每遇到一个 NaN 乘一次 (1 - alpha)
+    if weighted != weighted:
+        return _Ewm(com)
+    old_wt = 1.
+    for value in values[::-1]:
+        if value == value:
+            break
+        old_wt *= 1. - 1. / (1. + com)
+    return _Ewm(com, weighted, old_wt)
+
+
+def _date_strings(dates):
+    return pd.to_datetime(dates).dt.strftime("%Y-%m-%d").to_numpy()
+
+
+def state_path(stockCode, state_dir=STATE_DIR):
+    return os.path.join(state_dir, stockCode + ".json")
+
+
+def ohlcv_arrays(df: pd.DataFrame, market):
+    """
+    按市场列名取出 (日期字符串, high, low, close, volume)，价格和成交量为 float64
+    """
+    columns = MARKET_COLUMNS[market]
+    return (_date_strings(df[columns["date"]]),
+            df[columns["high"]].to_numpy(dtype=np.float64),
+            df[columns["low"]].to_numpy(dtype=np.float64),
+            df[columns["close"]].to_numpy(dtype=np.float64),
+            df[columns["volume"]].to_numpy(dtype=np.float64))
+
+
+def latest_with_state(dates, high, low, close, volume, market, path, lean=False):
+    """
+    用持久化的增量状态计算最后一根 K 线上的全部指标值（按日期升序的数组输入）
+    状态不存在、或已存的最后一根 K 线与本次数据对不上（如复权价格因分红被整体调整）时从头重建
+    lean 为 True 时重建按低内存模式进行；正常模式下遇到低内存模式建立的状态也重建
+    """
+    state = None
+    if os.path.exists(path):
+        try:
+            state = IndicatorState.load(path)
+        except (OSError, ValueError, KeyError):
+            state = None
+
+    if state is not None:
+        matched = np.flatnonzero(dates == state.last_date)
+        if state.market != market or len(matched) == 0 or close[matched[0]] != state.last_close \
+                or (state.lean and not lean):
+            state = None
+
+    if state is None:
+        state = IndicatorState.from_arrays(dates, high, low, close, volume, market, lean)
+        state.save(path)
+    elif state.extend_arrays(dates, high, low, close, volume) > 0:
+        state.save(path)
+    return state.latest
@@ -1,16 +1,14 @@
 import os
 import platform
 import shutil
+import threading
 from datetime import datetime
-from functools import partial
-import json
 
 # from easyocr import easyocr
 from kivy.config import Config
-from pybroker import YFinance
 
-from compute_utils import compute_us_indicators
-from utils import startGetData, getData
+# 行情、计算和合并模块（pandas / numpy / akshare / yfinance / openpyxl）不在这里导入：
+# 窗口先显示出来，utils 随后在后台线程中预加载，akshare、yfinance 到请求对应市场时才加载
 
 # 注册字体文件
 font_path = os.path.join("font", 'SourceHanSansCN-Normal.otf')
@@ -23,13 +21,44 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
 from kivy.uix.label import Label
-from kivy.uix.scrollview import ScrollView
 from kivy.uix.popup import Popup
 from kivy.clock import Clock
 from kivy.uix.togglebutton import ToggleButton
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.properties import StringProperty
 
-# 文件路径用于保存列表数据
-DATA_FILE = os.path.join('stock_list.json')
+from watchlist import WatchlistModel, WatchlistStore, code_of
+
+
+class WatchlistRow(BoxLayout):
+    """
+    自选列表的一行（名称和删除按钮）；RecycleView 只创建可见的行，滚动时复用并改写 text / code
+    """
+    text = StringProperty('')
+    code = StringProperty('')
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', size_hint_y=None, height=60, spacing=10, **kwargs)
+        label = Label(size_hint_y=None, height=60)
+        self.bind(text=label.setter('text'))
+
+        delete_button = Button(
+            text='删除',
+            size_hint_x=0.2,
+            width=60,
+            size_hint_y=None,
+            height=55,
+            padding=[10, 10]  # 设置按钮的内边距，使其看起来更大
+        )
+        delete_button.bind(on_press=lambda instance: App.get_running_app().delete_code(self.code))
+
+        self.add_widget(label)
+        self.add_widget(delete_button)
+
+
+def rowData(item):
+    return {'text': item, 'code': code_of(item)}
 
 
 class MyApp(App):
@@ -123,6 +152,12 @@ class MyApp(App):
         self.radio_layout.add_widget(self.excel_radio)
         self.radio_layout.add_widget(excel_label)
 
+        # 输出格式选择 - 所有股票汇总到一个 Excel
+        self.workbook_radio = ToggleButton(group='output', state='normal')
+        workbook_label = Label(text="汇总 Excel", size_hint_y=None, height=60)
+        self.radio_layout.add_widget(self.workbook_radio)
+        self.radio_layout.add_widget(workbook_label)
+
         # 将输入框和添加按钮放入水平布局
         input_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=60, spacing=10)
         add_button = Button(text='添加', size_hint_y=None, height=60, size_hint_x=0.1)  # 按钮占用 10% 宽度
@@ -152,19 +187,25 @@ class MyApp(App):
         left_layout.add_widget(self.merge_button)
         left_layout.add_widget(input_layout)
 
-        # 右侧布局（文本列表）
-        right_layout = ScrollView(size_hint=(0.45, 1))
-        self.text_list_layout = BoxLayout(orientation='vertical', size_hint_y=None)
-        self.text_list_layout.bind(minimum_height=self.text_list_layout.setter('height'))
-
-        right_layout.add_widget(self.text_list_layout)
+        # 右侧布局（自选列表）：RecycleView 只为可见的行创建控件，几千只股票也不会卡顿
+        self.list_view = RecycleView(size_hint=(0.45, 1))
+        self.list_view.viewclass = WatchlistRow
+        list_layout = RecycleBoxLayout(orientation='vertical', size_hint_y=None,
+                                       default_size=(None, 60), default_size_hint=(1, None))
+        list_layout.bind(minimum_height=list_layout.setter('height'))
+        self.list_view.add_widget(list_layout)
 
         # 将左右布局添加到根布局
         self.root.add_widget(left_layout)
-        self.root.add_widget(right_layout)
+        self.root.add_widget(self.list_view)
 
-        # 加载已保存的列表
-        self.load_data()
+        # 加载已保存的列表，之后的增删和名称更新都只修改内存中的模型
+        self.watchlist = WatchlistModel(WatchlistStore())
+        self.watchlist.bind(self.on_watchlist_change)
+        self.list_view.data = [rowData(item) for item in self.watchlist.items]
+
+        # 第一帧画出来之后再在后台预加载行情和计算模块
+        Clock.schedule_once(lambda dt: threading.Thread(target=preloadModules, daemon=True).start(), 0)
 
         return self.root
 
@@ -179,11 +220,22 @@ class MyApp(App):
 
     def start_scraping(self, instance):
         self.show_loading_popup()
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                items = json.load(f)
-            output_format = 'txt' if self.txt_radio.state == 'down' else 'excel'
-            startGetData(items, self.onFinish, self.onError, output_format, int(self.crawl_input.text))
+        items = self.watchlist.store.items()
+        if items:
+            if self.txt_radio.state == 'down':
+                output_format = 'txt'
+            elif self.workbook_radio.state == 'down':
+                output_format = 'workbook'
+            else:
+                output_format = 'excel'
+            threading.Thread(target=self.scrape_in_background,
+                             args=(items, output_format, int(self.crawl_input.text))).start()
+
+    def scrape_in_background(self, items, output_format, crawlThreadCount):
+        # 预加载还没完成时在这里等它完成，不阻塞界面
+        from utils import startWithThread
+
+        startWithThread(items, self.onFinish, self.onError, output_format, crawlThreadCount)
 
     def start_merge(self, instance):
         base_path = os.path.join('result')
@@ -198,45 +250,32 @@ class MyApp(App):
             Clock.schedule_once(lambda dt: self.show_tips_popup("没有任何子文件夹", True), 0)
             return
 
-        merged_count = 0
-
-        for folder in sub_dirs:
-            folder_path = os.path.join(base_path, folder)
-            txt_files = [f for f in os.listdir(folder_path) if f.endswith('.txt') and not f.startswith('合并结果')]
-
-            if not txt_files:
-                continue  # 如果该子文件夹没有 txt 文件，跳过
-
-            merged_content = ""
-            for file_name in txt_files:
-                file_path = os.path.join(folder_path, file_name)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                        merged_content += f"===== {file_name} =====\n{content}\n\n"
-                except Exception as e:
-                    print(f"读取文件失败: {file_path} - {e}")
-
-            # 保存合并结果
-            merged_path = os.path.join(folder_path, f"merge({folder}).txt")
-            try:
-                with open(merged_path, "w", encoding="utf-8") as f:
-                    f.write(merged_content)
-                merged_count += 1
-            except Exception as e:
-                print(f"保存合并文件失败: {merged_path} - {e}")
+        # 合并在后台线程中进行，不阻塞界面
+        threading.Thread(target=self.merge_in_background, args=(base_path,), daemon=True).start()
+
+    def merge_in_background(self, base_path):
+        from merge import mergeResults
+
+        try:
+            merged_count, skipped_count = mergeResults(base_path)
+        except Exception as e:
+            print(f"合并失败: {e}")
+            Clock.schedule_once(lambda dt: self.show_tips_popup("合并失败", True), 0)
+            return
 
         # 弹窗提示最终结果
         if merged_count > 0:
             Clock.schedule_once(lambda dt: self.show_tips_popup(f"已合并 {merged_count} 个文件夹", False), 0)
+        elif skipped_count > 0:
+            Clock.schedule_once(lambda dt: self.show_tips_popup("结果没有变化，无需重新合并", False), 0)
         else:
             Clock.schedule_once(lambda dt: self.show_tips_popup("没有需要合并的文件", True), 0)
 
-    def onFinish(self):
+    def onFinish(self, summary):
         Clock.schedule_once(lambda dt: self.close_loading_popup(), 0)
         Clock.schedule_once(lambda dt: self.show_tips_popup("爬取完成", False), 0)
-        Clock.schedule_once(lambda dt: self.text_list_layout.clear_widgets(), 0)
-        Clock.schedule_once(lambda dt: self.load_data(), 0)
+        # 只更新这次运行补上名称的条目
+        Clock.schedule_once(lambda dt: self.watchlist.apply_names(summary["names"]), 0)
 
     def onError(self, text, auto_dismiss=False):
         Clock.schedule_once(lambda dt: self.show_tips_popup(text, auto_dismiss), 0)
@@ -271,119 +310,31 @@ class MyApp(App):
         text = self.input_field.text.strip()
         if len(text) == 0:
             return
-        if text:
-            # 创建一个水平布局来放置 Label 和 删除按钮
-            item_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=60, spacing=10)
-
-            # 创建一个标签并添加到布局
-            label = Label(text=text, size_hint_y=None, height=60)
-
-            # 创建删除按钮并绑定事件
-            delete_button = Button(
-                text='删除',
-                size_hint_x=0.2,
-                width=60,
-                size_hint_y=None,
-                height=55,
-                padding=[10, 10]  # 设置按钮的内边距，使其看起来更大
-            )
-
-            # 使用 partial 来绑定 delete_text 方法并传递 item_layout
-            delete_button.bind(on_press=partial(self.delete_text, item_layout))
-
-            # 将标签和删除按钮添加到布局
-            item_layout.add_widget(label)
-            item_layout.add_widget(delete_button)
-
-            # 将整个布局添加到文本列表的顶部
-            self.text_list_layout.add_widget(item_layout, )
-
-            # 手动更新布局
-            self.text_list_layout.canvas.ask_update()
-            # 保存当前列表项到文件
-            self.save_data(label.text)
-
-            # 清除列表
-            self.text_list_layout.clear_widgets()
-            self.load_data()
-
-            # 清空输入框
-            self.input_field.text = ''
-
-    def delete_text(self, item_layout, instance):
-        self.text_list_layout.remove_widget(item_layout)
-        self.remove_data(item_layout.children[1].text)
-
-    def remove_data(self, text):
-        textItems = []
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                items = json.load(f)
-
-            for item in items:
-                if item != text:
-                    textItems.append(item)
-
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(textItems, f, ensure_ascii=False, indent=4)
-
-    def save_data(self, text):
-        # 获取所有文本项
-        compairList = []
-        textItems = []
-        #
-        # textItems.append(text)
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                items = json.load(f)
-
-            # 将保存的列表项添加到界面
-            for item in items:
-                textItems.append(item)
-                compairList.append(item.split(":")[0])
-
-        # 判断是否已经存在
-        if text not in compairList:
-            # 添加到最前面
-            textItems.insert(0, text)
-        else:
+        # 添加到最前面，列表只插入这一行
+        if not self.watchlist.add(text):
             Clock.schedule_once(lambda dt: self.show_tips_popup("该代码已经存在", True), 0)
-            return
-
-        # 保存为 JSON 格式
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(textItems, f, ensure_ascii=False, indent=4)
 
-    def load_data(self):
-        # 如果文件存在，加载保存的列表项
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                items = json.load(f)
+        # 清空输入框
+        self.input_field.text = ''
 
-            # 将保存的列表项添加到界面
-            for item in items:
-                item_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=60, spacing=10)
+    def delete_code(self, code):
+        self.watchlist.remove(code)
 
-                label = Label(text=item, size_hint_y=None, height=60)
-
-                delete_button = Button(
-                    text='删除',
-                    size_hint_x=0.2,
-                    width=60,
-                    size_hint_y=None,
-                    height=55,
-                    padding=[10, 10]
-                )
+    def on_watchlist_change(self, op, index, item):
+        # 把模型的增量变化应用到 RecycleView 的数据上，只刷新受影响的行
+        data = self.list_view.data
+        if op == "insert":
+            data.insert(index, rowData(item))
+        elif op == "remove":
+            del data[index]
+        else:
+            data[index] = rowData(item)
 
-                delete_button.bind(on_press=partial(self.delete_text, item_layout))
 
-                item_layout.add_widget(label)
-                item_layout.add_widget(delete_button)
+def preloadModules():
+    import utils  # noqa: F401
 
-                # 将保存的数据插入到顶部
-                self.text_list_layout.add_widget(item_layout)
 
-import akshare as ak
 if __name__ == '__main__':
     # 创建result 文件夹
     if not os.path.exists("result"):
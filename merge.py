@@ -0,0 +1,111 @@
+import csv
+import json
+import os
+import re
+
+from compute_utils import INDICATOR_COLUMNS, BOLL_COLUMNS
+
+# 合并生成的文件，不作为合并的输入
+MERGE_PREFIXES = ("合并结果", "merge(")
+
+# 记录上次合并时各输入文件的修改时间和大小，输入没有变化的日期文件夹不再重新合并
+MANIFEST_NAME = ".merge_manifest.json"
+
+# 汇总表的列：每只股票一行
+TABLE_COLUMNS = ["股票代码", "股票名称"] + INDICATOR_COLUMNS + BOLL_COLUMNS
+
+# 结果文件名：名称(代码) 日期.txt
+RESULT_NAME = re.compile(r"^(?P<name>.*)\((?P<code>[^()]+)\) (?P<date>\d{4}-\d{2}-\d{2})\.txt$")
+
+
+def resultFiles(folder_path):
+    return sorted(f for f in os.listdir(folder_path)
+                  if f.endswith('.txt') and not f.startswith(MERGE_PREFIXES))
+
+
+def folderManifest(folder_path, files):
+    manifest = {}
+    for file_name in files:
+        stat = os.stat(os.path.join(folder_path, file_name))
+        manifest[file_name] = [stat.st_mtime_ns, stat.st_size]
+    return manifest
+
+
+def loadManifest(folder_path):
+    try:
+        with open(os.path.join(folder_path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def mergeFolder(folder_path, folder, files):
+    """
+    逐行把各 TXT 写入 merge(日期).txt，同时解析【数据指标】生成 merge(日期).csv（每只股票一行）
+    """
+    merged_path = os.path.join(folder_path, f"merge({folder}).txt")
+    table_path = os.path.join(folder_path, f"merge({folder}).csv")
+
+    # 先写临时文件再替换，合并中途出错不会留下半个文件
+    with open(merged_path + ".tmp", "w", encoding="utf-8") as merged, \
+            open(table_path + ".tmp", "w", encoding="utf-8-sig", newline="") as table:
+        writer = csv.DictWriter(table, fieldnames=TABLE_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for file_name in files:
+            file_path = os.path.join(folder_path, file_name)
+            match = RESULT_NAME.match(file_name)
+            row = {"股票代码": match["code"], "股票名称": match["name"]} if match else {"股票名称": file_name}
+            section = None
+            try:
+                merged.write(f"===== {file_name} =====\n")
+                with open(file_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        merged.write(line)
+                        line = line.rstrip("\n")
+                        if line.startswith("【"):
+                            section = line
+                        elif section == "【数据指标】" and ": " in line:
+                            key, value = line.split(": ", 1)
+                            row[key] = "" if value == "None" else value
+                merged.write("\n\n")
+                writer.writerow(row)
+            except Exception as e:
+                print(f"读取文件失败: {file_path} - {e}")
+
+    os.replace(merged_path + ".tmp", merged_path)
+    os.replace(table_path + ".tmp", table_path)
+
+
+def mergeResults(base_path="result"):
+    """
+    合并 result 下每个日期文件夹中的 TXT，返回 (合并的文件夹数, 因输入未变化跳过的文件夹数)
+    """
+    merged_count = 0
+    skipped_count = 0
+
+    # 遍历所有子文件夹（日期文件夹）
+    for folder in sorted(os.listdir(base_path)):
+        folder_path = os.path.join(base_path, folder)
+        if not os.path.isdir(folder_path):
+            continue
+
+        files = resultFiles(folder_path)
+        if not files:
+            continue  # 如果该子文件夹没有 txt 文件，跳过
+
+        manifest = folderManifest(folder_path, files)
+        outputs_exist = all(os.path.exists(os.path.join(folder_path, f"merge({folder}).{suffix}"))
+                            for suffix in ("txt", "csv"))
+        if outputs_exist and loadManifest(folder_path) == manifest:
+            skipped_count += 1
+            continue
+
+        try:
+            mergeFolder(folder_path, folder, files)
+            with open(os.path.join(folder_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            merged_count += 1
+        except Exception as e:
+            print(f"保存合并文件失败: {folder_path} - {e}")
+
+    return merged_count, skipped_count
@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+import time
+
+# 股票信息（公司资料）缓存目录：metadata/<市场>/<代码>.json
+METADATA_DIR = "metadata"
+
+DAY = 24 * 60 * 60
+
+# 各市场缓存的有效期（秒），过期后先返回旧数据再在后台刷新
+# A 股资料里的最新价、总市值等字段不缓存（见 utils.A_PRICE_FIELDS）
+METADATA_TTL = {"A": 7 * DAY, "HK": 7 * DAY, "US": 1 * DAY}
+
+# 超过这个时间的缓存不再直接使用，须同步重新获取
+METADATA_MAX_STALE = 90 * DAY
+
+
+class MetadataCache:
+    """
+    按 (市场, 代码) 缓存股票信息
+    未过期直接返回；过期但未超过 max_stale 时返回旧数据并通过 on_stale 交给后台刷新（没有设置 on_stale 时同步获取）；
+    没有缓存或太旧时同步获取
+    """
+
+    def __init__(self, root=METADATA_DIR, ttl=None, max_stale=METADATA_MAX_STALE):
+        self.root = root
+        self.ttl = METADATA_TTL if ttl is None else ttl
+        self.max_stale = max_stale
+        # on_stale(market, symbol, fetch)：在调用 get 的线程中被调用，负责安排后台刷新
+        self.on_stale = None
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def path(self, market, symbol):
+        return os.path.join(self.root, market, symbol + ".json")
+
+    def lookup(self, market, symbol):
+        """
+        返回 (缓存的数据, 状态)，状态为 "fresh" / "stale" / "missing"
+        """
+        try:
+            with open(self.path(market, symbol), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None, "missing"
+
+        age = time.time() - entry["fetched_at"]
+        if age < self.ttl.get(market, 0):
+            return entry["data"], "fresh"
+        if age < self.max_stale:
+            return entry["data"], "stale"
+        return entry["data"], "missing"
+
+    def put(self, market, symbol, data):
+        path = self.path(market, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，其他线程读到的要么是旧缓存要么是新缓存
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "data": data}, f, ensure_ascii=False, default=str)
+        os.replace(temp_path, path)
+
+    def get(self, market, symbol, fetch):
+        data, status = self.lookup(market, symbol)
+        if status == "fresh":
+            return data
+        if status == "stale" and self.on_stale is not None:
+            with self._lock:
+                # 同一只股票只安排一次刷新
+                scheduled = (market, symbol) in self._refreshing
+                self._refreshing.add((market, symbol))
+            if not scheduled:
+                self.on_stale(market, symbol, fetch)
+            return data
+        data = fetch()
+        self.put(market, symbol, data)
+        return data
+
+    def refresh(self, market, symbol, fetch):
+        try:
+            data = fetch()
+            self.put(market, symbol, data)
+            return data
+        finally:
+            with self._lock:
+                self._refreshing.discard((market, symbol))
+
+
+if __name__ == "__main__":
+    # 批量预热：python metadata_cache.py [线程数]，为自选列表中的全部股票获取并缓存股票信息
+    import sys
+
+    from utils import WATCHLIST, warmMetadata
+
+    warmMetadata(WATCHLIST.items(), int(sys.argv[1]) if len(sys.argv) > 1 else 8)
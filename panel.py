@@ -0,0 +1,155 @@
+import csv
+import os
+
+import numpy as np
+
+from compute_utils import (MARKET_INDICATORS, INDICATOR_COLUMNS, BOLL_COLUMNS, LEAN_DTYPE, _obv_change,
+                           compute_indicator_arrays, latest_window)
+from rolling_kernels import rolling_mean, thread_scratch
+from stock_result import plain_value
+
+# 全市场模式支持的市场：A 股（沪深京）和港股主板
+PANEL_MARKETS = ("A", "HK")
+
+# 每次向量化计算的股票数：中间数组约为 窗口长度 x PANEL_CHUNK x 8 字节 x 指标数，控制峰值内存
+PANEL_CHUNK = 500
+
+# 快照表的列：每只股票一行，A 股没有 BOLL，对应的列留空
+SNAPSHOT_COLUMNS = ["股票代码", "股票名称", "市场", "日期", "收盘", "K线数"] + INDICATOR_COLUMNS + BOLL_COLUMNS
+
+
+def a_share_code(code):
+    # 6 开头为沪市，0 / 3 开头为深市，其余（4、8、92 开头）为北交所
+    if code.startswith("6"):
+        return "sh" + code
+    if code.startswith(("0", "3")):
+        return "sz" + code
+    return "bj" + code
+
+
+def fetch_universe(market):
+    """
+    一次请求取得该市场的全部股票，返回 [(股票代码, 名称)]，代码格式与自选列表一致
+    """
+    import akshare as ak
+
+    if market == "A":
+        df = ak.stock_zh_a_spot_em()
+        return [(a_share_code(str(code)), name) for code, name in zip(df["代码"], df["名称"])]
+    if market == "HK":
+        df = ak.stock_hk_main_board_spot_em()
+        return [("HK" + str(code), name) for code, name in zip(df["代码"], df["名称"])]
+    raise ValueError(f"全市场模式不支持的市场: {market}")
+
+
+def panel_tail(dates, high, low, close, volume, window):
+    """
+    一只股票计算最新指标所需的尾部 window 根 K 线（按日期升序的数组输入），
+    以及尾部第一根 K 线（含）之前的累计 OBV
+    """
+    start = max(len(close) - window, 0)
+    return {
+        "date": dates[-1],
+        "bars": len(close) - start,
+        "high": high[start:],
+        "low": low[start:],
+        "close": close[start:],
+        "volume": volume[start:],
+        "obv_base": _obv_change(close[:start + 1], volume[:start + 1]).sum(),
+    }
+
+
+class Panel:
+    """
+    一个市场的全部股票按 K 线右对齐成 (K 线, 股票) 矩阵：每列的最后一行是该股票的最后一根 K 线，
+    历史不足 window 的股票上方补 NaN；按各自的 K 线对齐而不是按日期，停牌不影响其他股票
+    """
+
+    def __init__(self, market, codes, names, dates, bars, high, low, close, volume, obv_base):
+        self.market = market
+        self.codes = codes
+        self.names = names
+        self.dates = dates
+        self.bars = bars
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.obv_base = obv_base
+
+    @classmethod
+    def from_tails(cls, market, rows, window=None):
+        """
+        rows 为 [(股票代码, 名称, panel_tail 的结果)]
+        """
+        window = window or latest_window(market)
+        matrices = {key: np.full((window, len(rows)), np.nan) for key in ("high", "low", "close", "volume")}
+        for column, (_, _, tail) in enumerate(rows):
+            for key, matrix in matrices.items():
+                matrix[window - tail["bars"]:, column] = tail[key]
+        return cls(market,
+                   [code for code, _, _ in rows],
+                   [name for _, name, _ in rows],
+                   [tail["date"] for _, _, tail in rows],
+                   np.array([tail["bars"] for _, _, tail in rows]),
+                   obv_base=np.array([tail["obv_base"] for _, _, tail in rows], dtype=np.float64),
+                   **matrices)
+
+    def latest(self, chunk=PANEL_CHUNK, lean=False, columns=None):
+        """
+        用二维向量化运算计算全部股票最后一根 K 线上的指标，返回 {指标名: 各股票的值}
+        按 chunk 只股票分批，每批内仍是整块矩阵运算；lean 为 True 时每批按低内存模式计算
+        columns 不为 None 时只计算这些指标
+        """
+        window = len(self.close)
+        names = [name for name in MARKET_INDICATORS[self.market] if columns is None or name in columns]
+        if columns is not None and "OBV_MA" in columns:
+            # 重新计算 OBV_MA 要用到 OBV
+            columns = list(columns) + ["OBV"]
+        values = {}
+        for begin in range(0, len(self.codes), chunk):
+            part = slice(begin, begin + chunk)
+            arrays = compute_indicator_arrays(close=self.close[:, part], high=self.high[:, part],
+                                              low=self.low[:, part], volume=self.volume[:, part],
+                                              boll=self.market != "A", obv_base=self.obv_base[part], columns=columns,
+                                              dtype=LEAN_DTYPE if lean else np.float64,
+                                              scratch=thread_scratch() if lean else None)
+            if "OBV_MA" in arrays:
+                # OBV 是累计值，补位的 NaN 行会被当作 0 累加进去，OBV_MA 须去掉补位行重新计算
+                padding = np.arange(window)[:, None] < (window - self.bars[part])[None, :]
+                obv = np.where(padding, np.nan, arrays["OBV"])
+                arrays["OBV_MA"] = rolling_mean(obv, 30)
+            for name in names:
+                if name not in values:
+                    # 低内存模式下除 OBV 外为 float32，结果保持同样的精度
+                    values[name] = np.empty(len(self.codes), dtype=arrays[name].dtype)
+                values[name][part] = arrays[name][-1]
+        return values
+
+
+def snapshot_rows(panel: Panel, values):
+    """
+    快照表的行（按 SNAPSHOT_COLUMNS 的顺序），数值与结果文件一样转换为普通 Python 值
+    """
+    for column, code in enumerate(panel.codes):
+        row = [code, panel.names[column], panel.market, panel.dates[column],
+               plain_value(panel.close[-1, column]), int(panel.bars[column])]
+        row += [plain_value(values[name][column]) if name in values else None
+                for name in INDICATOR_COLUMNS + BOLL_COLUMNS]
+        yield row
+
+
+def write_snapshot(path, rows):
+    """
+    写入快照表 CSV（utf-8-sig，Excel 可直接打开），返回写入的行数
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path + ".tmp", "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SNAPSHOT_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    os.replace(path + ".tmp", path)
+    return count
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+# 需要复权的价格列（akshare 不复权日线的原始中文列），成交量不做调整
+PRICE_COLUMNS = ["开盘", "收盘", "最高", "最低"]
+
+
+def fetch_adjust_factors(stockCode):
+    """
+    获取 A 股的后复权因子，返回按日期升序的 DataFrame(date, hfq_factor)
+    每行的因子从该日起生效，直到下一次除权除息
+    """
+    import akshare as ak
+
+    df = ak.stock_zh_a_daily(symbol=stockCode.lower(), adjust="hfq-factor")
+    df = pd.DataFrame({
+        "date": pd.to_datetime(df["date"]),
+        "hfq_factor": df["hfq_factor"].astype(float),
+    })
+    return df.sort_values("date").reset_index(drop=True)
+
+
+def factor_series(dates, factors: pd.DataFrame):
+    """
+    每根 K 线当天生效的后复权因子；早于第一条因子记录的 K 线按 1 处理
+    """
+    bar_dates = pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]")
+    factor_dates = factors["date"].to_numpy(dtype="datetime64[ns]")
+    values = factors["hfq_factor"].to_numpy(dtype=np.float64)
+    index = np.searchsorted(factor_dates, bar_dates, side="right") - 1
+    return np.where(index >= 0, values[np.maximum(index, 0)], 1.0)
+
+
+def adjust_prices(df: pd.DataFrame, factors: pd.DataFrame, adjust, date_column="日期",
+                  price_columns=PRICE_COLUMNS):
+    """
+    用累计复权因子在本地生成复权价格
+    hfq：原始价格 × 当日因子；qfq：原始价格 × 当日因子 / 最新一根 K 线的因子（最新价格与不复权一致）
+    """
+    if not adjust or len(df) == 0 or factors is None or len(factors) == 0:
+        return df
+
+    factor = factor_series(df[date_column], factors)
+    if adjust == "qfq":
+        factor = factor / factor[-1]
+    elif adjust != "hfq":
+        raise ValueError(f"不支持的复权方式: {adjust}")
+
+    df = df.copy()
+    for column in price_columns:
+        df[column] = df[column].to_numpy(dtype=np.float64) * factor
+    return df
@@ -0,0 +1,186 @@
+import contextlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+# 滚动窗口计算的向量化核函数
+# 约定与 pandas rolling(window) 一致：第 0 维为时间轴，前 window-1 个值为 NaN，窗口内有 NaN 时结果为 NaN
+# 输出与输入同为 float32 / float64（其他类型输出 float64）；窗口求和、平方和等累加始终用 float64
+
+
+class ScratchBuffers:
+    """
+    可复用的临时数组：每个用途的数组按需增长后一直保留，之后同样或更小的形状直接覆盖使用，
+    逐只股票计算时不再反复分配；不能跨线程共享
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, key, shape, dtype=np.float64):
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        buffer = self._buffers.get((key, dtype))
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype)
+            self._buffers[(key, dtype)] = buffer
+        return buffer[:size].reshape(shape)
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+_active = threading.local()
+
+
+@contextlib.contextmanager
+def use_scratch(scratch):
+    """
+    块内本线程的核函数从 scratch 取临时数组；scratch 为 None 时照常每次分配
+    """
+    previous = getattr(_active, "scratch", None)
+    _active.scratch = scratch
+    try:
+        yield scratch
+    finally:
+        _active.scratch = previous
+
+
+def thread_scratch():
+    """
+    本线程（计算进程中即本进程）专用的 ScratchBuffers，同一线程内逐只股票计算时复用
+    """
+    if not hasattr(_active, "own"):
+        _active.own = ScratchBuffers()
+    return _active.own
+
+
+def _temp(key, shape, dtype=np.float64):
+    scratch = getattr(_active, "scratch", None)
+    return np.empty(shape, dtype) if scratch is None else scratch.get(key, shape, dtype)
+
+
+def _float_dtype(x):
+    return x.dtype if x.dtype in (np.float32, np.float64) else np.dtype(np.float64)
+
+
+def _empty(x, window):
+    out = np.full(x.shape, np.nan, dtype=_float_dtype(x))
+    return out, len(x) >= window
+
+
+def _offsets(x, window):
+    # 窗口内第 k 个位置对应的连续切片；按偏移逐个累加比在跨步视图的最后一维上归约快得多
+    m = len(x) - window + 1
+    for k in range(window):
+        yield x[k:k + m]
+
+
+def _window_sum(x, window):
+    offsets = _offsets(x, window)
+    first = next(offsets)
+    total = _temp("sum", first.shape)
+    total[...] = first
+    for values in offsets:
+        total += values
+    return total
+
+
+def rolling_moments(x, window, ddof=1):
+    """
+    一次遍历窗口同时得到滚动和、均值、标准差
+    """
+    total, ok = _empty(x, window)
+    mean = total.copy()
+    std = total.copy()
+    if ok:
+        total[window - 1:] = _window_sum(x, window)
+        mean[window - 1:] = total[window - 1:] / window
+        squares = _temp("squares", mean[window - 1:].shape)
+        squares[...] = 0.0
+        deviation = _temp("deviation", mean[window - 1:].shape, mean.dtype)
+        for values in _offsets(x, window):
+            np.subtract(values, mean[window - 1:], out=deviation)
+            np.multiply(deviation, deviation, out=deviation)
+            squares += deviation
+        std[window - 1:] = np.sqrt(squares / (window - ddof))
+    return total, mean, std
+
+
+def rolling_sum(x, window):
+    out, ok = _empty(x, window)
+    if ok:
+        out[window - 1:] = _window_sum(x, window)
+    return out
+
+
+def rolling_mean(x, window):
+    return rolling_sum(x, window) / window
+
+
+def rolling_mean_mad(x, window):
+    """
+    滚动均值和平均绝对偏差 mean(|x - mean(x)|)
+    """
+    mean, ok = _empty(x, window)
+    mad = mean.copy()
+    if ok:
+        mean[window - 1:] = _window_sum(x, window) / window
+        total = _temp("deviation_sum", mean[window - 1:].shape)
+        total[...] = 0.0
+        deviation = _temp("deviation", mean[window - 1:].shape, mean.dtype)
+        for values in _offsets(x, window):
+            np.subtract(values, mean[window - 1:], out=deviation)
+            np.abs(deviation, out=deviation)
+            total += deviation
+        mad[window - 1:] = total / window
+    return mean, mad
+
+
+def _rolling_extreme(x, window, ufunc):
+    # van Herk / Gil-Werman：按窗口长度分块，块内前缀、后缀各累计一次，
+    # 每个窗口的极值 = 起点所在块的后缀极值与终点所在块的前缀极值之一，整体 O(n)，与窗口长度无关
+    out, ok = _empty(x, window)
+    if not ok:
+        return out
+    n = len(x)
+    blocks = -(-n // window)
+    shape = (blocks, window) + x.shape[1:]
+    padded = _temp("padded", shape, out.dtype)
+    flat = padded.reshape((blocks * window,) + x.shape[1:])
+    flat[:n] = x
+    flat[n:] = np.nan
+    prefix = ufunc.accumulate(padded, axis=1, out=_temp("prefix", shape, out.dtype))
+    suffix = _temp("suffix", shape, out.dtype)
+    ufunc.accumulate(padded[:, ::-1], axis=1, out=suffix[:, ::-1])
+    prefix = prefix.reshape(flat.shape)
+    suffix = suffix.reshape(flat.shape)
+    ufunc(suffix[:n - window + 1], prefix[window - 1:n], out=out[window - 1:])
+    return out
+
+
+def rolling_max(x, window):
+    return _rolling_extreme(x, window, np.maximum)
+
+
+def rolling_min(x, window):
+    return _rolling_extreme(x, window, np.minimum)
+
+
+def ewm_mean(x, **kwargs):
+    """
+    递推 EMA，等同 pandas ewm(adjust=False, **kwargs).mean()
+    二维输入的各列在同一次调用中计算
+    """
+    frame = pd.Series(x) if x.ndim == 1 else pd.DataFrame(x.reshape(len(x), -1))
+    # pandas 内部按 float64 递推，结果转回输入的精度
+    return frame.ewm(adjust=False, **kwargs).mean().to_numpy(dtype=_float_dtype(x)).reshape(x.shape)
+
+
+def wilder_smooth(x, n):
+    """
+    Wilder 平滑（RSI 的平均涨跌幅），即 alpha = 1 / n 的 EMA
+    """
+    return ewm_mean(x, alpha=1 / n)
@@ -0,0 +1,222 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+# 运行指标目录：每次运行一个 run-<时间>.json 报告，metrics.prom 为最近一次运行的 Prometheus 文本格式
+METRICS_DIR = "metrics"
+
+# 耗时直方图的分桶上界（秒）
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+# 各阶段及其 source 标签的含义：
+#   metadata_fetch / history_fetch  数据源（eastmoney / yahoo）
+#   compute                         计算进程池（compute_pool）
+#   serialization / file_write      输出格式（txt / excel 由 openpyxl 生成 / workbook）
+#   retry_wait                      数据源，失败重试的退避等待和熔断等待
+STAGES = ("metadata_fetch", "history_fetch", "compute", "serialization", "file_write", "retry_wait")
+
+
+class Histogram:
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class StageTimer:
+    """
+    RunMetrics.timer 返回的计时器：退出时记录耗时，块内可以设置 rows / bytes；块内抛出异常时记一次错误
+    """
+
+    def __init__(self, metrics, stage, source, symbol):
+        self.metrics = metrics
+        self.stage = stage
+        self.source = source
+        self.symbol = symbol
+        self.rows = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, self.source, time.perf_counter() - self.started, self.symbol,
+                             rows=self.rows, size=self.bytes, error=exc_type is not None)
+        return False
+
+
+class RunMetrics:
+    """
+    一次运行中各阶段的耗时直方图、行数、字节数、错误数，以及每只股票在各阶段的累计耗时
+    可在多个线程中同时记录
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.histograms = defaultdict(Histogram)
+            self.rows = defaultdict(int)
+            self.bytes = defaultdict(int)
+            self.errors = defaultdict(int)
+            self.symbols = defaultdict(lambda: defaultdict(float))
+            # 峰值内存（字节）：低内存模式下计算进程用 tracemalloc 测量，按阶段取最大值，并记录每只股票的值
+            self.peaks = defaultdict(int)
+            self.symbol_peaks = {}
+
+    def timer(self, stage, source, symbol=None):
+        return StageTimer(self, stage, source, symbol)
+
+    def observe(self, stage, source, seconds, symbol=None, rows=0, size=0, error=False):
+        """
+        记录一次调用；symbol 为 None 表示批量调用（如美股批量下载），只计入阶段统计
+        """
+        key = (stage, source)
+        with self._lock:
+            self.histograms[key].observe(seconds)
+            self.rows[key] += rows
+            self.bytes[key] += size
+            if error:
+                self.errors[key] += 1
+            if symbol is not None:
+                self.symbols[symbol][stage] += seconds
+
+    def observe_peak(self, stage, source, nbytes, symbol=None):
+        """
+        记录一次调用的峰值内存
+        """
+        key = (stage, source)
+        with self._lock:
+            self.peaks[key] = max(self.peaks[key], nbytes)
+            if symbol is not None:
+                self.symbol_peaks[symbol] = max(self.symbol_peaks.get(symbol, 0), nbytes)
+
+    def report(self):
+        """
+        JSON 报告：{"started", "stages": {阶段: {source: 统计}}, "symbols": {股票代码: {阶段: 秒}}}
+        记录过峰值内存时另有 "peak_bytes": {股票代码: 字节}，对应阶段的统计中有 "peak_bytes"（最大值）
+        """
+        with self._lock:
+            stages = defaultdict(dict)
+            for (stage, source), histogram in sorted(self.histograms.items()):
+                key = (stage, source)
+                stages[stage][source] = {
+                    "count": histogram.count,
+                    "seconds": round(histogram.sum, 6),
+                    "max": round(histogram.max, 6),
+                    "rows": self.rows[key],
+                    "bytes": self.bytes[key],
+                    "errors": self.errors[key],
+                    "buckets": {_bound(bound): total for bound, total in histogram.cumulative()},
+                }
+                if key in self.peaks:
+                    stages[stage][source]["peak_bytes"] = self.peaks[key]
+            symbols = {symbol: {stage: round(seconds, 6) for stage, seconds in record.items()}
+                       for symbol, record in self.symbols.items()}
+            peaks = dict(self.symbol_peaks)
+        report = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "stages": dict(stages),
+            "symbols": symbols,
+        }
+        if peaks:
+            report["peak_bytes"] = peaks
+        return report
+
+    def stage_totals(self):
+        """
+        各阶段按 source 的累计耗时 {阶段: {source: 秒}}，按 STAGES 的顺序
+        """
+        with self._lock:
+            totals = {}
+            for stage in STAGES:
+                sources = {source: round(histogram.sum, 3) for (name, source), histogram
+                           in sorted(self.histograms.items()) if name == stage}
+                if sources:
+                    totals[stage] = sources
+            return totals
+
+    def to_prometheus(self, prefix="stock"):
+        """
+        Prometheus 文本格式；每只股票的明细基数太大，只在 JSON 报告中
+        """
+        with self._lock:
+            lines = [f"# HELP {prefix}_stage_seconds 各阶段单次调用耗时（秒）",
+                     f"# TYPE {prefix}_stage_seconds histogram"]
+            for (stage, source), histogram in sorted(self.histograms.items()):
+                labels = f'stage="{stage}",source="{source}"'
+                for bound, total in histogram.cumulative():
+                    lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{_bound(bound)}"}} {total}')
+                lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {histogram.count}")
+
+            for name, counter, help_text in (("rows", self.rows, "各阶段处理的行数（K 线或结果行）"),
+                                             ("bytes", self.bytes, "各阶段生成或写入的字节数"),
+                                             ("errors", self.errors, "各阶段失败的调用次数")):
+                lines.append(f"# HELP {prefix}_stage_{name}_total {help_text}")
+                lines.append(f"# TYPE {prefix}_stage_{name}_total counter")
+                for stage, source in sorted(self.histograms):
+                    lines.append(f'{prefix}_stage_{name}_total{{stage="{stage}",source="{source}"}} '
+                                 f'{counter[(stage, source)]}')
+
+            if self.peaks:
+                lines.append(f"# HELP {prefix}_stage_peak_bytes 各阶段单次调用的最大峰值内存（字节）")
+                lines.append(f"# TYPE {prefix}_stage_peak_bytes gauge")
+                for (stage, source), peak in sorted(self.peaks.items()):
+                    lines.append(f'{prefix}_stage_peak_bytes{{stage="{stage}",source="{source}"}} {peak}')
+
+            lines.append(f"# HELP {prefix}_run_started_seconds 本次运行开始的时间戳")
+            lines.append(f"# TYPE {prefix}_run_started_seconds gauge")
+            lines.append(f"{prefix}_run_started_seconds {self.started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, directory=None):
+        """
+        写入 JSON 报告和 Prometheus 文件，返回 {"report": 路径, "prometheus": 路径}
+        """
+        directory = directory or METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        # 文件名精确到毫秒，常驻模式或连续运行时不会互相覆盖
+        name = time.strftime("run-%Y%m%d-%H%M%S", time.localtime(self.started)) + f"{self.started % 1:.3f}"[1:]
+        report_path = os.path.join(directory, name + ".json")
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+        # 先写临时文件再替换，node_exporter 等采集方不会读到写了一半的文件
+        prom_path = os.path.join(directory, "metrics.prom")
+        with open(prom_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(prom_path + ".tmp", prom_path)
+        return {"report": report_path, "prometheus": prom_path}
+
+
+def _bound(bound):
+    return "+Inf" if bound == math.inf else repr(bound)
+
+
+# 全局指标：抓取线程、写入线程和事件循环都记到这里，每次运行开始时清空
+METRICS = RunMetrics()
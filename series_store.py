@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from compute_utils import MARKET_INDICATORS
+
+# 完整指标时间序列目录：series/<股票代码>.<格式>，每根 K 线一行，日期、高低收和每个指标各一列
+SERIES_DIR = "series"
+
+# 支持的文件格式（都需要 pyarrow）：feather 可内存映射读取；parquet 按日期范围读取时跳过无关的行组
+SERIES_FORMATS = ("feather", "parquet")
+
+# 列压缩算法：指标是高熵的浮点数，zstd 也只比 lz4 小几个百分点，写入却慢两三倍
+# feather 不压缩（None）时内存映射读取是零拷贝的，压缩后读取的列须先解压
+SERIES_COMPRESSION = "lz4"
+
+# parquet 每个行组的 K 线数（约一年），行组记录日期的最小最大值，按日期范围读取时只解压相关的行组
+PARQUET_ROW_GROUP = 250
+
+DATE_COLUMN = "date"
+
+
+def series_path(stockCode, fmt, series_dir=None):
+    return os.path.join(series_dir or SERIES_DIR, f"{stockCode}.{fmt}")
+
+
+def _format(path):
+    fmt = os.path.splitext(path)[1].lstrip(".")
+    if fmt not in SERIES_FORMATS:
+        raise ValueError(f"不支持的时间序列格式: {path}")
+    return fmt
+
+
+def write_series(path, days, high, low, close, arrays, market):
+    """
+    把 compute_indicator_arrays 的结果（与 K 线等长的数组）整表写入 path，返回文件字节数
+    days 为 datetime64[D] 日期；数组直接交给 Arrow，不经过 DataFrame
+    """
+    import pyarrow as pa
+
+    columns = {DATE_COLUMN: pa.array(days.astype("datetime64[D]")), "high": high, "low": low, "close": close}
+    for name in MARKET_INDICATORS[market]:
+        # 只计算了部分指标时只写这些列
+        if name in arrays:
+            columns[name] = arrays[name]
+    table = pa.table(columns)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + ".tmp"
+    if _format(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        # 指标几乎没有重复值，字典编码只会增大文件；只按日期过滤，其他列不写统计
+        pq.write_table(table, temp_path, compression=SERIES_COMPRESSION or "none", row_group_size=PARQUET_ROW_GROUP,
+                       use_dictionary=False, write_statistics=[DATE_COLUMN])
+    else:
+        import pyarrow.feather as feather
+
+        feather.write_feather(table, temp_path, compression=SERIES_COMPRESSION or "uncompressed")
+    # 先写临时文件再替换，读取方不会读到写了一半的文件
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+
+def read_series(path, columns=None, start=None, end=None):
+    """
+    读取时间序列，返回 DataFrame（date 列为日期）
+    columns：只读取这些指标列（date 列总会读取）；start / end：日期范围（含两端），可为字符串或日期
+    """
+    names = None if columns is None else [DATE_COLUMN] + [name for name in columns if name != DATE_COLUMN]
+    start = None if start is None else pd.Timestamp(start).date()
+    end = None if end is None else pd.Timestamp(end).date()
+
+    if _format(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        filters = []
+        if start is not None:
+            filters.append((DATE_COLUMN, ">=", start))
+        if end is not None:
+            filters.append((DATE_COLUMN, "<=", end))
+        table = pq.read_table(path, columns=names, filters=filters or None, memory_map=True)
+    else:
+        import pyarrow.feather as feather
+
+        table = feather.read_table(path, columns=names, memory_map=True)
+        if start is not None or end is not None:
+            # 日期升序：二分查找出范围后切片，不复制数据
+            dates = table[DATE_COLUMN].to_numpy()
+            low = 0 if start is None else np.searchsorted(dates, np.datetime64(start), side="left")
+            high = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end), side="right")
+            table = table.slice(low, max(high - low, 0))
+    return table.to_pandas(date_as_object=False)
+
+
+if __name__ == "__main__":
+    # 查看时间序列：python series_store.py 文件路径 [--columns 列 ...] [--start 日期] [--end 日期]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="读取完整指标时间序列")
+    parser.add_argument("path")
+    parser.add_argument("--columns", nargs="+")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    args = parser.parse_args()
+    print(read_series(args.path, args.columns, args.start, args.end).to_string(index=False))
@@ -0,0 +1,113 @@
+import json
+import math
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from compute_utils import MARKET_INDICATORS, stored_float
+
+# 浮点数保留的小数位（与 DataFrame.to_json 默认的 double_precision 一致）
+DOUBLE_PRECISION = 10
+
+# TXT / Excel 中各部分的顺序
+SECTIONS = ["股票信息", "今日概览", "数据指标"]
+
+
+def plain_value(value):
+    """
+    numpy 标量、日期等转换为可直接写入 JSON / TXT / Excel 的 Python 值，NaN 和无穷大为 None
+    """
+    if isinstance(value, (pd.Timestamp, date)):
+        return pd.Timestamp(value).isoformat(timespec="milliseconds")
+    if isinstance(value, np.floating):
+        value = stored_float(value)
+    elif isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return round(value, DOUBLE_PRECISION) if math.isfinite(value) else None
+    return value
+
+
+def plain_record(row):
+    """
+    一行数据（dict 或 pd.Series）逐项转换为 plain_value
+    """
+    return {key: plain_value(value) for key, value in row.items()}
+
+
+class StockResult:
+    """
+    一只股票的结果：股票信息、今日概览和最后一根 K 线上的指标
+    指标按 MARKET_INDICATORS 的顺序存放在一个 float64 数组中，写出时一次遍历转换
+    names 为 values 对应的指标名，默认为该市场的全部指标（只计算部分指标时为其中的一部分）
+    """
+    __slots__ = ("code", "market", "info", "overview", "values", "volume", "names")
+
+    def __init__(self, code, market, info, overview, values, volume, names=None):
+        self.code = code
+        self.market = market
+        self.info = info
+        self.overview = overview
+        self.values = values
+        # VOL 保留原始成交量的类型
+        self.volume = volume
+        self.names = MARKET_INDICATORS[market] if names is None else names
+
+    @classmethod
+    def from_latest(cls, code, market, info, overview, latest, volume):
+        """
+        latest 为 {指标名: 值}（如 latest_with_state 的返回值），可以只含部分指标
+        """
+        names = [name for name in MARKET_INDICATORS[market] if name in latest]
+        values = np.fromiter((latest[name] for name in names), dtype=np.float64, count=len(names))
+        return cls(code, market, info, overview, values, plain_value(volume), names)
+
+    def indicators(self):
+        result = {}
+        for name, value in zip(self.names, self.values.tolist()):
+            if name == 'VOL':
+                result[name] = self.volume
+            elif name == 'OBV_MA':
+                # 非科学计数法，保留两位小数
+                result[name] = f'{value:.2f}' if value == value else ''
+            else:
+                result[name] = round(value, DOUBLE_PRECISION) if math.isfinite(value) else None
+        return result
+
+    def sections(self):
+        """
+        按 TXT / Excel 的顺序返回 [(部分名称, dict)]，没有今日概览的市场（港股）跳过该部分
+        """
+        data = {"股票信息": self.info, "今日概览": self.overview, "数据指标": self.indicators()}
+        return [(title, data[title]) for title in SECTIONS if data[title] is not None]
+
+    def to_dict(self):
+        """
+        与 temp/<代码>.json 结构相同的 dict
+        """
+        if self.market == "US":
+            return {"今日概览": self.overview, "数据指标": self.indicators(), "股票信息": self.info}
+        return dict(self.sections())
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+
+def result_sections(result):
+    """
+    StockResult 或从 temp/<代码>.json 读回的 dict，统一按 TXT / Excel 的顺序返回 [(部分名称, dict)]
+    """
+    if isinstance(result, StockResult):
+        return result.sections()
+    return [(title, result[title]) for title in SECTIONS if title in result]
+
+
+def format_txt(sections):
+    lines = []
+    for title, items in sections:
+        lines.append(f"【{title}】\n")
+        lines.extend(f"{key}: {value}\n" for key, value in items.items())
+        lines.append("\n")
+    # 最后一部分后面不空行
+    return "".join(lines[:-1])
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import fetch_engine
+from fetch_engine import AsyncFetchEngine, is_retryable
+
+LIMITS = {"test": {"concurrency": 2, "rate": 1000.0, "burst": 1000}}
+BREAKER = {"failure_threshold": 100, "reset_timeout": 0.01, "max_trips": 3}
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class HTTPError(OSError):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = Response(status_code)
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (ConnectionError("reset"), True),
+    (TimeoutError(), True),
+    (HTTPError(503), True),
+    (HTTPError(429), True),
+    (HTTPError(404), False),
+    (ValueError("没有行情数据"), False),
+    (IndexError("single positional indexer is out-of-bounds"), False),
+    (KeyError("收盘"), False),
+    (RuntimeError("unknown"), False),
+])
+def test_is_retryable(exc, expected):
+    assert is_retryable(exc) is expected
+
+
+def run(func, retry_policy):
+    async def main():
+        engine = AsyncFetchEngine(2, LIMITS, retry_policy, BREAKER)
+        try:
+            try:
+                await engine.run_with_retry("sz000001", "test", "A", func)
+            except Exception as e:
+                return e, engine.breaker("A"), engine.report()
+        finally:
+            engine.shutdown()
+
+    return asyncio.run(main())
+
+
+def test_data_error_not_retried():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise ValueError("没有行情数据")
+
+    error, breaker, report = run(fetch, {"max_retries": 10, "base_delay": 0.001, "max_delay": 0.001,
+                                         "max_total_delay": 1.0})
+    assert isinstance(error, ValueError)
+    assert len(calls) == 1
+    assert breaker.failures == 0 and breaker.trips == 0
+    assert report["retries"] == {} and report["failures"] == {"A": 1}
+
+
+def test_total_backoff_capped(monkeypatch):
+    # 退避时间取抖动区间的上界
+    monkeypatch.setattr(fetch_engine.random, "uniform", lambda low, high: high)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise ConnectionError("reset")
+
+    # 每次退避 0.02 秒，累计 0.05 秒的上限在第 3 次退避（截短为 0.01 秒）后用完，不会重试满 10 次
+    error, breaker, report = run(fetch, {"max_retries": 10, "base_delay": 1.0, "max_delay": 0.02,
+                                         "max_total_delay": 0.05})
+    assert isinstance(error, ConnectionError)
+    assert len(calls) == 4
+    assert report["failures"] == {"A": 1}
@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_budget():
+    # 在子进程中运行 benchmark.imports：入口模块的导入耗时预算、不应提前加载的模块、只有 A 股 / 港股的 TXT 运行
+    done = subprocess.run([sys.executable, "-m", "benchmark.imports"], cwd=REPO_ROOT, capture_output=True, text=True,
+                          timeout=300)
+    assert done.returncode == 0, done.stdout + done.stderr
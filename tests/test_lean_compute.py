@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+import pytest
+
+from benchmark.synthetic import make_ohlcv
+from compute_pool import _latest_from_shared, pack_ohlcv
+from compute_utils import LEAN_ERROR_BOUND, sort_by_date
+from indicator_state import IndicatorState
+from run_metrics import RunMetrics
+from stock_result import StockResult
+
+SUBSET = ["MA5", "RSI6", "K", "OBV_MA"]
+
+
+@pytest.fixture
+def shared():
+    df = sort_by_date(make_ohlcv("sz000001", "A", bars=600), "A")
+    shm, n = pack_ohlcv(df, "A")
+    yield shm, n
+    shm.close()
+    shm.unlink()
+
+
+def assert_close(actual, expected):
+    assert actual.keys() == expected.keys()
+    for name, value in expected.items():
+        if math.isnan(value):
+            assert math.isnan(actual[name]), name
+        else:
+            assert abs(actual[name] - value) <= LEAN_ERROR_BOUND * max(abs(value), 1.0), name
+
+
+def test_latest_subset(shared, tmp_path):
+    shm, n = shared
+    full, peak = _latest_from_shared(shm.name, n, "A", str(tmp_path / "full.json"))
+    assert peak is None
+
+    # 只算部分指标时不读写增量状态，只返回要求的指标（K 不带出同组的 D / J）
+    subset, peak = _latest_from_shared(shm.name, n, "A", str(tmp_path / "subset.json"), indicators=SUBSET)
+    assert not (tmp_path / "subset.json").exists()
+    assert list(subset) == SUBSET
+    assert_close(subset, {name: full[name] for name in SUBSET})
+
+    lean, peak = _latest_from_shared(shm.name, n, "A", str(tmp_path / "lean.json"), lean=True, indicators=SUBSET)
+    assert peak > 0
+    assert_close(lean, {name: full[name] for name in SUBSET})
+
+
+def test_lean_state(shared, tmp_path):
+    shm, n = shared
+    path = str(tmp_path / "state.json")
+    expected, _ = _latest_from_shared(shm.name, n, "A", str(tmp_path / "full.json"))
+
+    lean, peak = _latest_from_shared(shm.name, n, "A", path, lean=True)
+    assert peak > 0
+    assert IndicatorState.load(path).lean
+    assert_close(lean, expected)
+
+    # 正常模式遇到低内存模式建立的状态时重建，结果与 float64 完全一致
+    latest, _ = _latest_from_shared(shm.name, n, "A", path)
+    assert not IndicatorState.load(path).lean
+    assert latest == expected
+
+
+def test_partial_result():
+    result = StockResult.from_latest("sz000001", "A", {}, {}, {"MA5": 1.5, "OBV_MA": 1234.567}, 100)
+    assert result.indicators() == {"MA5": 1.5, "OBV_MA": "1234.57"}
+
+
+def test_peak_report():
+    metrics = RunMetrics()
+    assert "peak_bytes" not in metrics.report()
+    metrics.observe("compute", "compute_pool", 0.1, "sz000001")
+    metrics.observe_peak("compute", "compute_pool", 2048, "sz000001")
+    metrics.observe_peak("compute", "compute_pool", 1024, "sz000002")
+    report = metrics.report()
+    assert report["peak_bytes"] == {"sz000001": 2048, "sz000002": 1024}
+    assert report["stages"]["compute"]["compute_pool"]["peak_bytes"] == 2048
+    assert 'stock_stage_peak_bytes{stage="compute",source="compute_pool"} 2048' in metrics.to_prometheus()
@@ -0,0 +1,54 @@
+import asyncio
+import sys
+
+import pytest
+
+import utils
+from benchmark.fakes import FakeProvider, fake_akshare, fake_yfinance
+from fetch_engine import AsyncFetchEngine
+from metadata_cache import MetadataCache
+
+
+@pytest.fixture
+def provider(monkeypatch, tmp_path):
+    provider = FakeProvider("eastmoney", bars=300)
+    monkeypatch.setitem(sys.modules, "akshare", fake_akshare(provider))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils, "METADATA_CACHE", MetadataCache(str(tmp_path / "metadata")))
+    return provider
+
+
+def test_price_fields_not_cached(provider):
+    info = utils.fetchAInfo("600000")
+    assert info["股票简称"] == "模拟600000"
+    assert all(info[field] is None for field in utils.A_PRICE_FIELDS)
+
+
+def test_price_fields_from_history(provider):
+    # 缓存里留着旧版本写入的一周前的价格
+    utils.METADATA_CACHE.put("A", "600000", dict(utils.fetchAInfo("600000"), 最新=1.0, 总市值=1e9))
+    raw = utils.fetchRaw("sh600000")
+    close = raw["overview"]["收盘"]
+    assert raw["info"]["最新"] == close
+    assert raw["info"]["总市值"] == pytest.approx(1e9 * close)
+    assert raw["info"]["流通市值"] == pytest.approx(8e8 * close)
+    assert list(raw["info"])[0] == "最新"
+
+
+def test_us_profiles_through_engine(monkeypatch, tmp_path):
+    provider = FakeProvider("yahoo")
+    monkeypatch.setitem(sys.modules, "yfinance", fake_yfinance(provider))
+    monkeypatch.setattr(utils, "METADATA_CACHE", MetadataCache(str(tmp_path / "metadata")))
+    utils.METADATA_CACHE.put("US", "AAPL", {"displayName": "cached"})
+
+    async def main():
+        engine = AsyncFetchEngine(4)
+        try:
+            return await utils.fetchUsProfiles(engine, ["AAPL", "MSFT", "NVDA"])
+        finally:
+            engine.shutdown()
+
+    profiles = asyncio.run(main())
+    # 缓存中已有的不再请求，其余每只一次请求，都经过抓取引擎（yahoo 的并发和限速）
+    assert sorted(profiles) == ["MSFT", "NVDA"]
+    assert provider.stats()["requests"] == 2
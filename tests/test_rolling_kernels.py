@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling_kernels import (ScratchBuffers, ewm_mean, rolling_max, rolling_mean_mad, rolling_min, rolling_moments,
+                             rolling_sum, use_scratch, wilder_smooth)
+
+WINDOWS = [1, 3, 20]
+
+
+def series(n=60, columns=None, seed=0):
+    """
+    随机游走，第 0 维为时间；中间放入几个 NaN（停牌），覆盖窗口内有 NaN 的情况
+    """
+    rng = np.random.default_rng(seed)
+    shape = (n,) if columns is None else (n, columns)
+    x = 10 + np.cumsum(rng.normal(0, 0.2, shape), axis=0)
+    x[[5, 6, 31]] = np.nan
+    return x
+
+
+def frame(x):
+    return pd.Series(x) if x.ndim == 1 else pd.DataFrame(x)
+
+
+def assert_same(actual, expected):
+    expected = expected.to_numpy() if hasattr(expected, "to_numpy") else expected
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-10, equal_nan=True)
+
+
+INPUTS = {
+    "1d": series(),
+    "2d": series(columns=4),
+    "short": series()[:2],
+    "short_2d": series(columns=3)[:2],
+}
+
+
+@pytest.mark.parametrize("name", INPUTS)
+@pytest.mark.parametrize("window", WINDOWS)
+def test_rolling_sum(name, window):
+    x = INPUTS[name]
+    assert_same(rolling_sum(x, window), frame(x).rolling(window).sum())
+
+
+# 窗口为 1 时 ddof=1 的标准差是 0 / 0，与 pandas 一样为 NaN
+@pytest.mark.filterwarnings("ignore:invalid value encountered in divide:RuntimeWarning")
+@pytest.mark.parametrize("name", INPUTS)
+@pytest.mark.parametrize("window", WINDOWS)
+def test_rolling_moments(name, window):
+    x = INPUTS[name]
+    total, mean, std = rolling_moments(x, window)
+    rolling = frame(x).rolling(window)
+    assert_same(total, rolling.sum())
+    assert_same(mean, rolling.mean())
+    assert_same(std, rolling.std(ddof=1))
+
+
+@pytest.mark.parametrize("name", INPUTS)
+@pytest.mark.parametrize("window", WINDOWS)
+def test_rolling_moments_ddof0(name, window):
+    x = INPUTS[name]
+    _, _, std = rolling_moments(x, window, ddof=0)
+    assert_same(std, frame(x).rolling(window).std(ddof=0))
+
+
+@pytest.mark.parametrize("name", INPUTS)
+@pytest.mark.parametrize("window", WINDOWS)
+def test_rolling_mean_mad(name, window):
+    x = INPUTS[name]
+    mean, mad = rolling_mean_mad(x, window)
+    rolling = frame(x).rolling(window)
+    assert_same(mean, rolling.mean())
+    assert_same(mad, rolling.apply(lambda v: np.mean(np.abs(v - v.mean())), raw=True))
+
+
+@pytest.mark.parametrize("name", INPUTS)
+@pytest.mark.parametrize("window", WINDOWS + [7])
+def test_rolling_min_max(name, window):
+    # 7 不整除长度，覆盖最后一个不完整的分块
+    x = INPUTS[name]
+    rolling = frame(x).rolling(window)
+    assert_same(rolling_max(x, window), rolling.max())
+    assert_same(rolling_min(x, window), rolling.min())
+
+
+@pytest.mark.parametrize("name", INPUTS)
+def test_ewm_mean(name):
+    x = INPUTS[name]
+    assert_same(ewm_mean(x, span=12), frame(x).ewm(span=12, adjust=False).mean())
+    assert_same(ewm_mean(x, alpha=0.3), frame(x).ewm(alpha=0.3, adjust=False).mean())
+
+
+@pytest.mark.parametrize("name", INPUTS)
+@pytest.mark.parametrize("n", [6, 14])
+def test_wilder_smooth(name, n):
+    x = INPUTS[name]
+    assert_same(wilder_smooth(x, n), frame(x).ewm(alpha=1 / n, adjust=False).mean())
+
+
+def test_float32_keeps_dtype():
+    x = series(columns=2)
+    lean = x.astype(np.float32)
+    for func in (rolling_sum, rolling_max, rolling_min, lambda v, w: rolling_moments(v, w)[2],
+                 lambda v, w: rolling_mean_mad(v, w)[1], lambda v, w: ewm_mean(v, span=w)):
+        actual = func(lean, 5)
+        assert actual.dtype == np.float32
+        np.testing.assert_allclose(actual, func(x, 5), rtol=1e-5, atol=1e-5, equal_nan=True)
+
+
+def test_scratch_reuse_matches():
+    # 先算长序列再算短序列，复用的临时数组中残留的数据不能影响结果
+    x = series(n=200, columns=3)
+
+    def compute(values):
+        return [*rolling_moments(values, 20), *rolling_mean_mad(values, 20), rolling_max(values, 20)]
+
+    expected = compute(x[:50])
+    with use_scratch(ScratchBuffers()):
+        compute(x)
+        actual = compute(x[:50])
+    for got, want in zip(actual, expected):
+        np.testing.assert_array_equal(got, want)
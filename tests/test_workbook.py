@@ -0,0 +1,53 @@
+import numpy as np
+from openpyxl import load_workbook
+
+import excel
+from compute_utils import MARKET_INDICATORS
+from stock_result import StockResult
+
+
+def make_result(code, market, info, overview):
+    values = np.arange(len(MARKET_INDICATORS[market]), dtype=np.float64) + 1.5
+    return StockResult(code, market, info, overview, values, 1000)
+
+
+def test_mixed_results_reload(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(excel, "RESULT_DIR", str(tmp_path))
+    errors = []
+    writer = excel.WorkbookWriter("2026-01-02")
+    writer.add("浦发银行", "600000", errors.append,
+               make_result("600000", "A", {"股票代码": "600000", "总市值": 2.1e11}, {"最新价": 10.2}))
+    # 美股 info 中有列表、字典等嵌套值
+    writer.add("Apple", "AAPL", errors.append,
+               make_result("AAPL", "US",
+                           {"symbol": "AAPL", "companyOfficers": [{"name": "x", "age": 60}],
+                            "sectorDisp": {"名称": "科技"}, "tags": ("a", "b")},
+                           {"最新价": 190.5}))
+    writer.save(errors.append)
+    assert errors == []
+
+    wb = load_workbook(writer.path)
+    assert [row[0] for row in wb["数据指标"].iter_rows(min_row=2, values_only=True)] == ["600000", "AAPL"]
+    info = {row[2]: row[3] for row in wb["股票信息"].iter_rows(min_row=2, values_only=True) if row[0] == "AAPL"}
+    assert info["companyOfficers"] == '[{"name": "x", "age": 60}]'
+    assert info["sectorDisp"] == '{"名称": "科技"}'
+    assert info["tags"] == '["a", "b"]'
+
+
+def test_bad_symbol_skipped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(excel, "RESULT_DIR", str(tmp_path))
+    errors = []
+    writer = excel.WorkbookWriter("2026-01-02")
+    # 非法控制字符在创建单元格时就出错，这只股票的行一行也不写入
+    writer.add("坏数据", "000001", errors.append,
+               make_result("000001", "A", {"股票代码": "000001", "简介": "bad\x01"}, {"最新价": 1.0}))
+    writer.add("浦发银行", "600000", errors.append,
+               make_result("600000", "A", {"股票代码": "600000"}, {"最新价": 10.2}))
+    writer.save(errors.append)
+    assert errors == ["000001 写入汇总 Excel 失败"]
+
+    wb = load_workbook(writer.path)
+    for sheet_name in ("数据指标", "股票信息", "今日概览"):
+        assert {row[0] for row in wb[sheet_name].iter_rows(min_row=2, values_only=True)} == {"600000"}
@@ -0,0 +1,179 @@
+from functools import partial
+
+import pandas as pd
+
+from history_store import HistoryStore, fetch_incremental
+from metadata_cache import MetadataCache
+from run_metrics import METRICS
+
+# yfinance 在各函数内导入：只有自选列表中有美股时才加载
+
+# yfinance 列名 -> pybroker YFinance().query 的列名
+YF_COLUMNS = {"Open": "open", "High": "high", "Low": "low", "Close": "close",
+              "Adj Close": "adj_close", "Volume": "volume"}
+
+
+def download_us_history(symbols, start=None):
+    """
+    一次请求下载多只美股的日线，返回 {代码: DataFrame}，列与 pybroker YFinance().query 一致
+    start 为 None 时下载全部历史
+    """
+    if not symbols:
+        return {}
+    import yfinance as yf
+
+    # 一次请求多只股票，只计入阶段统计，不分摊到每只股票
+    with METRICS.timer("history_fetch", "yahoo") as timer:
+        if start is None:
+            raw = yf.download(symbols, period="max", interval="1d", group_by="ticker",
+                              auto_adjust=False, progress=False, threads=True)
+        else:
+            raw = yf.download(symbols, start=start.strftime('%Y-%m-%d'), interval="1d", group_by="ticker",
+                              auto_adjust=False, progress=False, threads=True)
+        timer.rows = len(raw)
+
+    histories = {}
+    for symbol in symbols:
+        if isinstance(raw.columns, pd.MultiIndex):
+            if symbol not in raw.columns.get_level_values(0):
+                continue
+            part = raw[symbol]
+        else:
+            part = raw
+        # 多只股票共用一个日期索引，各自没有交易的日期整行为空
+        part = part.dropna(how="all")
+        if part.empty:
+            continue
+        df = part.rename(columns=YF_COLUMNS)
+        df = df[[column for column in YF_COLUMNS.values() if column in df.columns]]
+        df.index.name = "date"
+        df = df.reset_index()
+        df.insert(1, "symbol", symbol)
+        histories[symbol] = df
+    return histories
+
+
+def us_overview(symbol, df: pd.DataFrame):
+    """
+    从日线的最后一根 K 线生成今日概览
+    """
+    if df is None or df.empty:
+        return {"股票代码": symbol, "提示": "今日无交易数据"}
+
+    row = df.iloc[-1]
+    close = float(row["close"])
+    return {
+        "股票代码": symbol,
+        "当前价格": round(close, 2),
+        "开盘": round(float(row["open"]), 2),
+        "最高": round(float(row["high"]), 2),
+        "最低": round(float(row["low"]), 2),
+        "收盘": round(close, 2),
+        "成交量": int(row["volume"])
+    }
+
+
+def fetch_us_profile(symbol):
+    """
+    一只美股自己的资料（yf.Ticker(symbol).info），每只股票一次请求；
+    批量运行时由调用方交给抓取引擎逐只执行，受 yahoo 的并发数和限速约束
+    """
+    import yfinance as yf
+
+    with METRICS.timer("metadata_fetch", "yahoo", "US" + symbol) as timer:
+        data = yf.Ticker(symbol).info
+        timer.rows = len(data)
+    return data
+
+
+def missing_us_profiles(symbols, metadata: MetadataCache):
+    """
+    缓存中没有可用资料、需要向数据源请求的股票
+    """
+    # 过期的缓存在有后台刷新时仍可先用
+    usable = ("fresh", "stale") if metadata.on_stale is not None else ("fresh",)
+    return [symbol for symbol in symbols if metadata.lookup("US", symbol)[1] not in usable]
+
+
+def cached_us_profiles(symbols, metadata: MetadataCache, fetched=None):
+    """
+    优先取缓存的个股资料，返回 {代码: dict 或获取时的异常}
+    fetched 为调用方已获取的资料（格式相同，通常是 missing_us_profiles 中的股票），写入缓存；其余缓存中没有的逐只获取
+    """
+    fetched = fetched or {}
+    for symbol, info in fetched.items():
+        if not isinstance(info, Exception):
+            metadata.put("US", symbol, info)
+
+    profiles = {}
+    for symbol in symbols:
+        if isinstance(fetched.get(symbol), Exception):
+            profiles[symbol] = fetched[symbol]
+            continue
+        try:
+            profiles[symbol] = metadata.get("US", symbol, partial(fetch_us_profile, symbol))
+        except Exception as e:
+            profiles[symbol] = e
+    return profiles
+
+
+def prefetch_us_batch(stockCodes, store: HistoryStore, metadata: MetadataCache = None, profiles=None):
+    """
+    把自选中的美股合并成批量请求：历史数据按是否已有本地数据分成两次多股票下载，
+    今日概览直接取自同一份数据；个股资料用 profiles（调用方通过抓取引擎获取的 {代码: dict 或异常}），
+    其余优先取 metadata 缓存，都没有的逐只获取
+    返回 {股票代码: {"history": DataFrame, "overview": dict, "info": dict} 或该股票失败时的异常}
+    """
+    symbols = {stockCode: stockCode[2:].upper() for stockCode in stockCodes}
+
+    # 已有本地数据的股票只需从最早的重叠日期开始下载一次
+    anchors = {}
+    for symbol in symbols.values():
+        stored = store.load("US", symbol, "")
+        if stored is not None and len(stored) >= 2:
+            anchors[symbol] = pd.to_datetime(stored["date"]).iloc[-2]
+    missing = [symbol for symbol in symbols.values() if symbol not in anchors]
+    batch = download_us_history(missing)
+    if anchors:
+        batch.update(download_us_history(list(anchors), min(anchors.values())))
+
+    def fetcher(symbol):
+        def fetch(start):
+            df = batch.get(symbol)
+            if start is None and symbol in anchors:
+                # 本地数据校验失败需要全部历史时，单独补下这一只
+                df = download_us_history([symbol]).get(symbol)
+            elif df is not None and start is not None:
+                df = df[pd.to_datetime(df["date"]) >= start].reset_index(drop=True)
+            if df is None and start is None:
+                raise ValueError(f"{symbol} 没有行情数据")
+            return df
+
+        return fetch
+
+    if metadata is None:
+        profiles = dict(profiles or {})
+        for symbol in symbols.values():
+            if symbol not in profiles:
+                try:
+                    profiles[symbol] = fetch_us_profile(symbol)
+                except Exception as e:
+                    profiles[symbol] = e
+    else:
+        profiles = cached_us_profiles(list(symbols.values()), metadata, profiles)
+
+    # 单只股票失败不影响其他股票，异常原样放进结果里，由 fetchOne 单独重试这只股票
+    results = {}
+    for stockCode, symbol in symbols.items():
+        try:
+            history = fetch_incremental(store, "US", symbol, "", "date", "close", fetcher(symbol))
+            if isinstance(profiles.get(symbol), Exception):
+                raise profiles[symbol]
+            results[stockCode] = {
+                "history": history,
+                "overview": us_overview(symbol, history),
+                "info": profiles.get(symbol, {}),
+            }
+        except Exception as e:
+            results[stockCode] = e
+    return results
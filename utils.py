@@ -1,305 +1,659 @@
-import json
+import asyncio
+import concurrent.futures
 import os
-import threading
 import time
 from datetime import datetime
+from functools import partial
 
-from pybroker.ext.data import AKShare
-from pybroker import YFinance
-import akshare as ak
-import yfinance as yf
+from compute_utils import MARKET_COLUMNS, latest_window
+from indicator_state import ohlcv_arrays, state_path
+from history_store import HistoryStore, fetch_incremental
+from price_adjust import fetch_adjust_factors, adjust_prices
+from us_batch import prefetch_us_batch, fetch_us_profile, missing_us_profiles
+from metadata_cache import MetadataCache
+from excel import generateExcel, generateTxt, WorkbookWriter, panelSnapshotPath
+from fetch_engine import AsyncFetchEngine
+from compute_pool import ComputePool
+from stock_result import StockResult, plain_record, plain_value
+from run_metrics import METRICS
+from watchlist import WatchlistStore, market_of
+from panel import Panel, fetch_universe, panel_tail, snapshot_rows, write_snapshot
+from series_store import series_path
 
+# 本地行情数据，每次运行只增量请求新的 K 线
+HISTORY_STORE = HistoryStore()
 
-from compute_utils import compute_indicators, compute_hk_indicators, compute_us_indicators
-from excel import generateExcel, generateTxt
-import concurrent.futures
+# 股票信息缓存，资料变化很慢，不必每次运行都请求
+METADATA_CACHE = MetadataCache()
+
+# 自选列表（SQLite），界面和写入阶段各自连接，可以同时修改
+WATCHLIST = WatchlistStore()
+
+# 为 True 时每只股票的结果额外写入 temp/<代码>.json 作为中间结果存档；生成文件直接使用内存中的结果
+SAVE_CHECKPOINT = False
+
+# 为 "feather" / "parquet" 时每只股票额外把每根 K 线上的指标写入 series/<代码>.<格式>（需要 pyarrow）
+# 此时在完整历史上计算一次，最新指标取最后一行，不再走增量状态
+SERIES_FORMAT = None
+
+# 为 True 时使用低内存模式：float32，临时数组复用；每只股票计算时的峰值内存记入运行指标
+LEAN_COMPUTE = False
+
+# 只计算这些指标（指标名列表），None 为全部；只计算部分指标时最新值模式不使用增量状态
+INDICATORS = None
 
 
 def startWithThread(items, onFinish, onError, output_format, crawlThreadCount):
+    summary = asyncio.run(runPipeline(items, onError, output_format, crawlThreadCount))
+    printRunSummary(summary)
+    onFinish(summary)
+    return summary
+
+
+async def runPipeline(items, onError, output_format, crawlThreadCount, engine=None, pool=None):
+    """
+    执行一次完整的抓取、计算和文件生成，返回本次运行的统计（可直接转成 JSON）
+    engine / pool 由调用方传入时在多次运行之间复用，本函数不关闭它们
+    """
     # 记录开始时间
     start_time = time.time()
+    METRICS.reset()
 
-    os.makedirs("temp", exist_ok=True)
+    if SAVE_CHECKPOINT:
+        os.makedirs("temp", exist_ok=True)
 
-    # 记录创建temp目录的时间
-    step1 = time.time()
-    try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=crawlThreadCount) as executor:
-            futures = []
-            for item in items:
-                stockCode = item.split(":")[0]
-                # 将浏览器对象传递给线程任务
-                futures.append(executor.submit(getData, stockCode, onError, 0))
-            concurrent.futures.wait(futures)
-    finally:
-        # 记录线程任务完成的时间
-        step2 = time.time()
+    # 已有名称的自选股直接用原名称生成文件
+    knownNames = {item.split(":")[0]: item.split(":")[1] for item in items if ":" in item}
+    stockCodes = [item.split(":")[0] for item in items]
+    # 还没有名称的股票先用缓存的股票信息补上名称
+    cachedNames = cachedStockNames([stockCode for stockCode in stockCodes if stockCode not in knownNames])
+    if cachedNames:
+        applyStockNames(cachedNames)
+        knownNames.update(cachedNames)
 
-    updateStockList()
-    step3 = time.time()
+    progress = {"first": None, "written": 0, "names": dict(cachedNames)}
+    errors = []
 
-    with open("stock_list.json", "r", encoding="utf-8") as f:
-        stockList = json.load(f)
-        for i in stockList:
-            if ":" not in i:
-                continue
-            if output_format == "excel":
-                generateExcel(i.split(":")[1], i.split(":")[0], onError)
-            else:
-                generateTxt(i.split(":")[1], i.split(":")[0], onError)
-    step4 = time.time()
+    def onRunError(message):
+        errors.append(message)
+        onError(message)
+
+    # 记录准备工作完成的时间
+    step1 = time.time()
+    report = await fetchAll(stockCodes, onRunError, crawlThreadCount, output_format, knownNames, progress,
+                            engine, pool)
+    # 记录全部股票抓取、计算并生成文件的时间
+    step2 = time.time()
+
+    try:
+        metrics = METRICS.save()
+    except Exception as e:
+        # 指标写不进去不影响本次结果
+        metrics = None
+        with open("error.log", "a", encoding="utf-8") as f:
+            f.write(f"运行指标保存失败：{str(e)}\n")
 
+    return {
+        "started": datetime.fromtimestamp(start_time).isoformat(timespec="seconds"),
+        "format": output_format,
+        "symbols": len(stockCodes),
+        "written": progress["written"],
+        "errors": errors,
+        # 本次运行新获得的名称（已写回自选列表），界面据此只更新这些条目
+        "names": progress["names"],
+        "fetch": report,
+        "seconds": {
+            "prepare": round(step1 - start_time, 3),
+            "first_output": None if progress["first"] is None else round(progress["first"] - step1, 3),
+            "pipeline": round(step2 - step1, 3),
+            "total": round(step2 - start_time, 3),
+        },
+        "stages": METRICS.stage_totals(),
+        "metrics": metrics,
+    }
+
+
+def printRunSummary(summary):
+    printFetchReport(summary["fetch"])
+    seconds = summary["seconds"]
+    output_format = summary["format"]
     # 计算每一步的耗时
-    print(f"创建temp目录耗时: {step1 - start_time:.2f} 秒")
-    print(f"线程任务完成耗时: {step2 - step1:.2f} 秒")
-    print(f"保存stock_list.json耗时: {step3 - step2:.2f} 秒")
-    print(f"生成{output_format}耗时: {step4 - step3:.2f} 秒")
+    print(f"准备耗时: {seconds['prepare']:.2f} 秒")
+    if seconds["first_output"] is not None:
+        print(f"首个{output_format}生成耗时: {seconds['first_output']:.2f} 秒")
+    print(f"抓取并生成{summary['written']}个{output_format}耗时: {seconds['pipeline']:.2f} 秒")
     # 完整执行时间
-    print(f"总执行时间: {step4 - start_time:.2f} 秒")
+    print(f"总执行时间: {seconds['total']:.2f} 秒")
+    # 各阶段累计耗时（多只股票并行，合计会超过总执行时间）
+    for stage, sources in summary["stages"].items():
+        print(f"{stage}: " + "，".join(f"{source} {total:.2f} 秒" for source, total in sources.items()))
 
-    onFinish()
 
+async def runPanel(markets, onError, crawlThreadCount, engine=None):
+    """
+    全市场模式：取得各市场的全部股票，只截取计算最新指标所需的尾部 K 线，
+    拼成 (K 线, 股票) 矩阵一次算出全部股票的最新指标，写入一张 CSV 快照表
+    不读写自选列表，也不为每只股票生成文件
+    """
+    start_time = time.time()
+    METRICS.reset()
+    errors = []
+
+    def onRunError(message):
+        errors.append(message)
+        onError(message)
+
+    ownEngine = engine is None
+    if ownEngine:
+        engine = AsyncFetchEngine(crawlThreadCount)
+    else:
+        engine.start_run()
+    panels = []
+    total = 0
+    try:
+        for market in markets:
+            provider = MARKET_PROVIDERS[market]
+            try:
+                with METRICS.timer("metadata_fetch", provider) as timer:
+                    universe = await engine.run_with_retry("全市场列表", provider, market, fetch_universe, market)
+                    timer.rows = len(universe)
+            except Exception as e:
+                with open("error.log", "a", encoding="utf-8") as f:
+                    f.write(f"{market} 全市场列表获取失败：{str(e)}\n")
+                onRunError(f"{market} 全市场列表获取失败")
+                continue
 
-def startGetData(items, onFinish, onError, output_format, crawlThreadCount):
-    threading.Thread(target=startWithThread,
-                     args=(items, onFinish, onError, output_format, crawlThreadCount)).start()
+            total += len(universe)
+            window = latest_window(market, indicators=INDICATORS)
+
+            async def fetchTail(stockCode, name):
+                try:
+                    tail = await engine.run_with_retry(stockCode, provider, market, fetchPanelTail, stockCode,
+                                                       window, cost=MARKET_REQUESTS[market])
+                except Exception as e:
+                    with open("error.log", "a", encoding="utf-8") as f:
+                        f.write(f"{stockCode} 错误：{str(e)}\n")
+                    onRunError(f"{stockCode} 获取数据失败")
+                    return None
+                return stockCode, name, tail
+
+            rows = [row for row in await asyncio.gather(*(fetchTail(stockCode, name) for stockCode, name in universe))
+                    if row is not None]
+            if not rows:
+                continue
+            with METRICS.timer("compute", "panel") as timer:
+                panel = Panel.from_tails(market, rows, window)
+                values = await asyncio.get_running_loop().run_in_executor(None, partial(panel.latest,
+                                                                                        lean=LEAN_COMPUTE,
+                                                                                        columns=INDICATORS))
+                timer.rows = len(rows)
+            panels.append((panel, values))
+        report = engine.report()
+    finally:
+        if ownEngine:
+            engine.shutdown()
+    step1 = time.time()
 
+    path = None
+    written = 0
+    if panels:
+        path = panelSnapshotPath(markets)
+        try:
+            with METRICS.timer("file_write", "panel") as timer:
+                written = write_snapshot(path, (row for panel, values in panels
+                                                for row in snapshot_rows(panel, values)))
+                timer.rows = written
+                timer.bytes = os.path.getsize(path)
+            print(f"✅ 全市场指标已保存到: {path}（{written} 只股票）")
+        except Exception as e:
+            path = None
+            with open("error.log", "a", encoding="utf-8") as f:
+                f.write(f"全市场指标 - {str(e)}\n")
+            onRunError("生成全市场指标失败")
+    step2 = time.time()
 
-def getData(stockCode, onError, retryTime):
     try:
-        if (stockCode.startswith("sh") or stockCode.startswith("sz") or stockCode.startswith(
-                "SZ")) or stockCode.startswith("SH") or stockCode.startswith("bj") or stockCode.startswith("BJ"):
-            # 切割前两位
-            symbol = stockCode[2:]
+        metrics = METRICS.save()
+    except Exception as e:
+        metrics = None
+        with open("error.log", "a", encoding="utf-8") as f:
+            f.write(f"运行指标保存失败：{str(e)}\n")
 
-            # 获取股票数据
-            stock_individual_info_em_df = ak.stock_individual_info_em(symbol=symbol)
-            info_dict = {row['item']: row['value'] for _, row in stock_individual_info_em_df.iterrows()}
+    return {
+        "started": datetime.fromtimestamp(start_time).isoformat(timespec="seconds"),
+        "format": "panel",
+        "symbols": total,
+        "written": written,
+        "errors": errors,
+        "names": {},
+        "path": path,
+        "fetch": report,
+        "seconds": {
+            "prepare": 0.0,
+            "first_output": None,
+            "pipeline": round(step1 - start_time, 3),
+            "total": round(step2 - start_time, 3),
+        },
+        "stages": METRICS.stage_totals(),
+        "metrics": metrics,
+    }
+
+
+def fetchPanelTail(stockCode, window):
+    """
+    全市场模式下一只股票的尾部 K 线（见 panel.panel_tail）；历史数据同样走本地增量存储
+    """
+    market = marketOf(stockCode)
+    if market == "A":
+        _, df = fetchAHistory(stockCode)
+    else:
+        df = fetchHkHistory(stockCode)
+    return panel_tail(*ohlcv_arrays(df, market), window)
 
-            today = datetime.today().strftime('%Y%m%d')
-            stock_zh_a_hist_df = ak.stock_zh_a_hist(symbol=symbol, period="daily", start_date="18000101",
-                                                    end_date=today,
-                                                    adjust="")
-            stock_zh_a_hist_df_load = json.loads(
-                stock_zh_a_hist_df.to_json(orient='records', date_format='iso', force_ascii=False))
-
-            last_record = stock_zh_a_hist_df_load[-1]
-            previous_close = stock_zh_a_hist_df_load[-2]["收盘"]
-            last_record["昨收"] = previous_close
-
-            # 获取数据
-            today = datetime.today().strftime('%m/%d/%Y')
-
-            akshare = AKShare()
-            df = akshare.query(
-                symbols=[symbol],
-                start_date='3/1/1800',
-                end_date=today,
-                adjust="qfq",  # 也可以写成 "qfq" 或 "hfq"
-                timeframe="1d",
-            )
-            df = compute_indicators(df, symbol=symbol)
-
-            df_sub = df[[
-                'MA5', 'MA10', 'MA20', 'MA30', 'MA60',
-                'VOL', 'VOL_MA5', 'VOL_MA10',
-                'RSI6', 'RSI12', 'RSI24',
-                'K', 'D', 'J',
-                'DIF', 'DEA', 'MACD',
-                'WR10', 'WR6',
-                'PDI', 'MDI', 'ADX', 'ADXR',
-                'BIAS6', 'BIAS12', 'BIAS24',
-                'OBV', 'OBV_MA',
-                'CCI',
-                'ROC', 'ROC_MA',
-                'CR', 'MA1', 'MA2', 'MA3'
-            ]]
-
-            # 转成 JSON 字符串（列表形式，每一行是一个 dict）
-            json_str = df_sub.to_json(orient='records', date_format='iso')
-            records = json.loads(json_str)
-            result = {
-                "股票信息": info_dict,
-                "今日概览": last_record,
-                "数据指标": records[0]
-            }
-            json_str = json.dumps(result, ensure_ascii=False, indent=2)
-
-            # 保存数据到文件
-            temp_dir = os.path.join("temp")
-            with open(os.path.join(temp_dir, stockCode + ".json"), "w", encoding="utf-8") as f:
-                f.write(json_str)
-
-
-        elif stockCode.startswith("HK") or stockCode.startswith("hk"):
-            # 获取数据
-            symbol = stockCode[2:]
-            stock_hk_security_profile_em_df = ak.stock_hk_security_profile_em(symbol=symbol)
-
-            # 假设你的 DataFrame 是 df
-            json_str = stock_hk_security_profile_em_df.to_json(orient='records', force_ascii=False,
-                                                               date_format='iso')  # 转成 JSON 字符串
-            info_dict = json.loads(json_str)[0]  # 转成 Python 对象（list of dict）
-
-            df = ak.stock_hk_hist(symbol=symbol,
-                                  period="daily",
-                                  start_date="19700101",
-                                  end_date="22220101",
-                                  adjust="qfq")
-            df = compute_hk_indicators(df, symbol=symbol)
-            df_sub = df[[
-                'MA5', 'MA10', 'MA20', 'MA30', 'MA60',
-                'VOL', 'VOL_MA5', 'VOL_MA10',
-                'RSI6', 'RSI12', 'RSI24',
-                'K', 'D', 'J',
-                'DIF', 'DEA', 'MACD',
-                'WR10', 'WR6',
-                'PDI', 'MDI', 'ADX', 'ADXR',
-                'BIAS6', 'BIAS12', 'BIAS24',
-                'OBV', 'OBV_MA',
-                'CCI',
-                'ROC', 'ROC_MA',
-                'CR', 'MA1', 'MA2', 'MA3',
-                'BOLL_MID', 'BOLL_STD', 'BOLL_UPPER', 'BOLL_LOWER'
-            ]]
-            # 转成 JSON 字符串（列表形式，每一行是一个 dict）
-            json_str = df_sub.to_json(orient='records', date_format='iso')
-            records = json.loads(json_str)
-            result = {
-                "股票信息": info_dict,
-                "数据指标": records[0]
-            }
-            json_str = json.dumps(result, ensure_ascii=False, indent=2)
-
-            # 保存数据到文件
-            temp_dir = os.path.join("temp")
-            with open(os.path.join(temp_dir, stockCode + ".json"), "w", encoding="utf-8") as f:
-                f.write(json_str)
-        elif stockCode.startswith("US") or stockCode.startswith("us"):
-            # 获取数据
-            symbol = stockCode[2:]
-
-            today = datetime.today().strftime('%m/%d/%Y')
-            stock_us_security_profile_em_df = YFinance().query([symbol], start_date='3/1/1800', end_date=today)
-
-            stock = yf.Ticker("AAPL")
-
-            overview = today_overview([symbol])
-            df = compute_us_indicators(stock_us_security_profile_em_df, symbol=symbol)
-            df_sub = df[[
-                'MA5', 'MA10', 'MA20', 'MA30', 'MA60',
-                'VOL', 'VOL_MA5', 'VOL_MA10',
-                'RSI6', 'RSI12', 'RSI24',
-                'K', 'D', 'J',
-                'DIF', 'DEA', 'MACD',
-                'WR10', 'WR6',
-                'PDI', 'MDI', 'ADX', 'ADXR',
-                'BIAS6', 'BIAS12', 'BIAS24',
-                'OBV', 'OBV_MA',
-                'CCI',
-                'ROC', 'ROC_MA',
-                'CR', 'MA1', 'MA2', 'MA3',
-                'BOLL_MID', 'BOLL_STD', 'BOLL_UPPER', 'BOLL_LOWER'
-            ]]
-            # 转成 JSON 字符串（列表形式，每一行是一个 dict）
-            json_str = df_sub.to_json(orient='records', date_format='iso')
-            records = json.loads(json_str)
-            result = {
-                "今日概览": overview,
-                "数据指标": records[0],
-                "股票信息": stock.info,
-            }
-            json_str = json.dumps(result, ensure_ascii=False, indent=2)
-
-            # 保存数据到文件
-            temp_dir = os.path.join("temp")
-            with open(os.path.join(temp_dir, stockCode + ".json"), "w", encoding="utf-8") as f:
-                f.write(json_str)
-        else:
-            raise ValueError(f"不支持的股票代码格式: {stockCode}")
 
+def formatStartDate(start, default, fmt):
+    # start 为 None 表示请求全部历史
+    return default if start is None else start.strftime(fmt)
+
+
+def marketOf(stockCode):
+    return market_of(stockCode)
 
-    except Exception as e:
-        if retryTime < 10:
-            print(f"{stockCode}:重试中 ({retryTime + 1}/10)")
-            time.sleep(5)
-            getData(stockCode, onError, retryTime + 1)
-            return
-        else:
-            with open("error.log", "a", encoding="utf-8") as f:
-                f.write(f"{stockCode} 错误：{str(e)}\n")
-            onError(f"{stockCode} 获取数据失败")
 
+def symbolOf(stockCode):
+    # 去掉市场前缀的代码（美股与批量请求一致用大写）
+    return stockCode[2:].upper() if marketOf(stockCode) == "US" else stockCode[2:]
 
-def updateStockList():
+
+# 各市场对应的数据源，以及每只股票向该数据源发出的请求数
+MARKET_PROVIDERS = {"A": "eastmoney", "HK": "eastmoney", "US": "yahoo"}
+MARKET_REQUESTS = {"A": 2, "HK": 1}  # 股票信息通常来自缓存，不计入
+
+# A 股资料（stock_individual_info_em）中随行情变化的字段：{字段: 乘以收盘价的股本字段，None 为收盘价本身}
+# 股票信息缓存 7 天，这些字段每次用当天的日线重新计算
+A_PRICE_FIELDS = {"最新": None, "总市值": "总股本", "流通市值": "流通股"}
+
+
+async def fetchAll(stockCodes, onError, crawlThreadCount, output_format="txt", knownNames=None, progress=None,
+                   engine=None, pool=None):
+    """
+    并发获取全部股票，返回本次运行的重试和熔断统计
+    抓取在线程池中进行，指标计算交给进程池，每只股票完成后立即交给写入阶段生成文件，三者流水线并行
+    """
+    ownEngine = engine is None
+    ownPool = pool is None
+    if ownEngine:
+        engine = AsyncFetchEngine(crawlThreadCount)
+    else:
+        engine.start_run()
+    if ownPool:
+        pool = ComputePool(min(os.cpu_count() or 1, max(len(stockCodes), 1)))
+    output = asyncio.Queue()
+    writer = asyncio.create_task(writeOutputs(output, output_format, onError, progress))
+    knownNames = knownNames or {}
+    loop = asyncio.get_running_loop()
+    revalidations = []
+
+    def revalidate(market, symbol, fetch):
+        # 在抓取线程中被调用：过期的股票信息先照常使用，刷新请求排进事件循环，与行情请求共用数据源限速
+        def schedule():
+            revalidations.append(loop.create_task(
+                engine.run(MARKET_PROVIDERS[market], METADATA_CACHE.refresh, market, symbol, fetch)))
+
+        loop.call_soon_threadsafe(schedule)
+
+    METADATA_CACHE.on_stale = revalidate
     try:
-        # 读取文件 测试
-        with open("stock_list.json", "r", encoding="utf-8") as f:
-            stockList = json.load(f)
-
-        # 处理数据
-        tempStockList = []
-        tempStockDir = os.path.join("temp")
-        dirlist = os.listdir(tempStockDir)
-
-        for stockCode in stockList:
-            tempStockCode = stockCode + ".json"
-            if tempStockCode in dirlist:
-                #     打开data.json 获取 股票名称
-                with open((os.path.join(tempStockDir, tempStockCode, )), "r", encoding="utf-8") as f:
-                    dataJson = json.load(f)
-                    stock_info = dataJson.get("股票信息", {})
-
-                    # 优先取“证券简称”，如果没有就取“股票简称”，都没有就设为 None 或 ""
-                    stockName = stock_info.get("证券简称") or stock_info.get("股票简称")or stock_info.get("displayName")  or ""
-                    if stockName is not "":
-                        tempStockList.append(stockCode + ":" + stockName)
+        usCodes = [stockCode for stockCode in stockCodes if marketOf(stockCode) == "US"]
+        tasks = [fetchOne(engine, pool, output, stockCode, onError, knownNames)
+                 for stockCode in stockCodes if stockCode not in usCodes]
+        if usCodes:
+            tasks.append(fetchUsBatch(engine, pool, output, usCodes, onError, knownNames))
+        await asyncio.gather(*tasks)
+        # 刷新失败不影响本次结果，下次运行会再次刷新
+        await asyncio.gather(*revalidations, return_exceptions=True)
+        return engine.report()
+    finally:
+        METADATA_CACHE.on_stale = None
+        await output.put(None)
+        await writer
+        if ownEngine:
+            engine.shutdown()
+        if ownPool:
+            pool.shutdown()
+
+
+async def fetchOne(engine, pool, output, stockCode, onError, knownNames, prefetched=None):
+    market = marketOf(stockCode)
+    try:
+        if market is None:
+            # 代码格式不对，重试也不会成功
+            raise ValueError(f"不支持的股票代码格式: {stockCode}")
+        if isinstance(prefetched, dict):
+            # 批量请求已带回数据，不再访问数据源
+            raw = fetchRaw(stockCode, prefetched)
+        else:
+            raw = await engine.run_with_retry(stockCode, MARKET_PROVIDERS.get(market), market, fetchRaw, stockCode,
+                                              cost=MARKET_REQUESTS.get(market, 1))
+        # 包括在进程池中排队的时间
+        with METRICS.timer("compute", "compute_pool", stockCode) as timer:
+            if SERIES_FORMAT:
+                last, latest, (seconds, size) = await pool.series(raw["history"], market,
+                                                                  series_path(stockCode, SERIES_FORMAT),
+                                                                  LEAN_COMPUTE, INDICATORS, stockCode)
             else:
-                tempStockList.append(stockCode)
+                last, latest = await pool.latest(raw["history"], market, state_path(stockCode), LEAN_COMPUTE,
+                                                 INDICATORS, stockCode)
+            timer.rows = len(raw["history"])
+        if SERIES_FORMAT:
+            METRICS.observe("file_write", "series", seconds, stockCode, rows=len(raw["history"]), size=size)
+        result = buildResult(stockCode, raw, last, latest)
+        if SAVE_CHECKPOINT:
+            await engine.run(None, saveCheckpoint, stockCode, result)
+    except Exception as e:
+        with open("error.log", "a", encoding="utf-8") as f:
+            f.write(f"{stockCode} 错误：{str(e)}\n")
+        onError(f"{stockCode} 获取数据失败")
+        return
+
+    # 没有名称的股票不生成文件（与自选列表中无名称的条目一致）
+    name = knownNames.get(stockCode) or stockName(result.info)
+    if name:
+        await output.put((stockCode, name, stockCode not in knownNames, result))
 
-        # 写回文件
-        with open("stock_list.json", "w", encoding="utf-8") as f:
-            json.dump(tempStockList, f, ensure_ascii=False, indent=4)
+
+async def fetchUsProfiles(engine, symbols):
+    """
+    缓存中没有的美股资料逐只交给抓取引擎获取（受 yahoo 的并发数和限速约束），返回 {代码: dict 或异常}
+    """
+    missing = missing_us_profiles(symbols, METADATA_CACHE)
+    fetched = await asyncio.gather(*(engine.run_with_retry("US" + symbol, "yahoo", "US", fetch_us_profile, symbol)
+                                     for symbol in missing), return_exceptions=True)
+    return dict(zip(missing, fetched))
+
+
+async def fetchUsBatch(engine, pool, output, usCodes, onError, knownNames):
+    # 美股日线合并成一次批量请求，之后每只股票只剩本地计算
+    prefetched = {}
+    try:
+        profiles = await fetchUsProfiles(engine, [symbolOf(stockCode) for stockCode in usCodes])
+        prefetched = await engine.run_with_retry("美股批量", "yahoo", "US", prefetch_us_batch, usCodes,
+                                                 HISTORY_STORE, METADATA_CACHE, profiles, cost=2)
     except Exception as e:
+        # 批量请求失败时退回到逐只获取
         with open("error.log", "a", encoding="utf-8") as f:
-            f.write(str(e) + "\n")
+            f.write(f"美股批量获取失败：{str(e)}\n")
+    await asyncio.gather(*(fetchOne(engine, pool, output, stockCode, onError, knownNames, prefetched.get(stockCode))
+                           for stockCode in usCodes))
+
+
+# 新获得的股票名称和获取时间最多每隔这么多秒写回一次自选列表
+STOCK_LIST_FLUSH_SECONDS = 1.0
+
+
+async def writeOutputs(output, output_format, onError, progress=None):
+    """
+    写入阶段：依次为完成的股票生成 TXT / Excel，并把新获得的名称和获取时间增量写回自选列表
+    在单独的线程中执行，不占用抓取线程
+    """
+    loop = asyncio.get_running_loop()
+    names = {}
+    fetched = []
+    flushed = time.time()
+    book = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        if output_format == "workbook":
+            book = await loop.run_in_executor(executor, WorkbookWriter)
+        while True:
+            item = await output.get()
+            if item is None:
+                break
+            stockCode, name, isNew, result = item
+            await loop.run_in_executor(executor, writeOutput, stockCode, name, result, output_format, onError, book)
+            if progress is not None:
+                progress["written"] += 1
+                if progress["first"] is None:
+                    progress["first"] = time.time()
+            fetched.append(stockCode)
+            if isNew:
+                names[stockCode] = name
+                if progress is not None:
+                    progress["names"][stockCode] = name
+            if time.time() - flushed >= STOCK_LIST_FLUSH_SECONDS:
+                await loop.run_in_executor(executor, applyStockNames, names, fetched)
+                names = {}
+                fetched = []
+                flushed = time.time()
+        if names or fetched:
+            await loop.run_in_executor(executor, applyStockNames, names, fetched)
+        if book is not None:
+            await loop.run_in_executor(executor, book.save, onError)
+
+
+def writeOutput(stockCode, name, result, output_format, onError, book=None):
+    if output_format == "workbook":
+        # 汇总到同一个 Excel
+        book.add(name, stockCode, onError, result)
+    elif output_format == "excel":
+        generateExcel(name, stockCode, onError, result)
+    else:
+        generateTxt(name, stockCode, onError, result)
+
+
+def printFetchReport(report):
+    for market, breaker in report["breakers"].items():
+        print(f"{market} 重试 {report['retries'].get(market, 0)} 次，失败 {report['failures'].get(market, 0)} 只，"
+              f"熔断 {breaker['trips']} 次，熔断器状态: {breaker['state']}")
+        if breaker["gave_up"]:
+            with open("error.log", "a", encoding="utf-8") as f:
+                f.write(f"{market} 数据源多次熔断，剩余股票未请求\n")
+
 
+def fetchRaw(stockCode, prefetched=None):
+    """
+    只做网络请求：返回 {"market", "symbol", "history": 用于计算指标的日线, "info": 股票信息, "overview": 今日概览}
+    失败时直接抛出异常，由 fetchOne 安排重试
+    akshare 在第一次请求 A 股或港股时才导入（各 fetch 函数内），只有美股的运行不会加载它
+    """
+    market = marketOf(stockCode)
+    if market == "A":
+        # 切割前两位
+        symbol = stockCode[2:]
+
+        # 获取股票数据
+        info_dict = METADATA_CACHE.get("A", symbol,
+                                       timedFetch("metadata_fetch", stockCode, partial(fetchAInfo, symbol)))
+
+        stock_zh_a_hist_df, df = fetchAHistory(stockCode)
+        # 只需要最后两根 K 线
+        last_record = plain_record(stock_zh_a_hist_df.iloc[-1])
+        last_record["昨收"] = plain_value(stock_zh_a_hist_df["收盘"].iloc[-2])
+        info_dict = withLatestPrice(info_dict, last_record["收盘"])
+        return {"market": "A", "symbol": symbol, "history": df, "info": info_dict, "overview": last_record}
+
+    elif market == "HK":
+        # 获取数据
+        symbol = stockCode[2:]
+        info_dict = METADATA_CACHE.get("HK", symbol,
+                                       timedFetch("metadata_fetch", stockCode, partial(fetchHkInfo, symbol)))
+
+        df = fetchHkHistory(stockCode)
+        return {"market": "HK", "symbol": symbol, "history": df, "info": info_dict, "overview": None}
+
+    elif market == "US":
+        # 获取数据（历史、今日概览和个股资料来自批量请求，单独重试时按一只股票的批次获取）
+        symbol = stockCode[2:]
+        if prefetched is None:
+            prefetched = prefetch_us_batch([stockCode], HISTORY_STORE, METADATA_CACHE)[stockCode]
+        if isinstance(prefetched, Exception):
+            raise prefetched
+        return {"market": "US", "symbol": symbol, "history": prefetched["history"], "info": prefetched["info"],
+                "overview": prefetched["overview"]}
+    else:
+        raise ValueError(f"不支持的股票代码格式: {stockCode}")
+
+
+def fetchAHistory(stockCode):
+    """
+    A 股日线（本地增量），返回 (不复权日线, 计算指标用的前复权日线)
+    """
+    import akshare as ak
+
+    symbol = stockCode[2:]
+    today = datetime.today().strftime('%Y%m%d')
+    stock_zh_a_hist_df = fetch_incremental(
+        HISTORY_STORE, "A", symbol, "", "日期", "收盘",
+        timedFetch("history_fetch", stockCode,
+                   lambda start: ak.stock_zh_a_hist(symbol=symbol, period="daily",
+                                                    start_date=formatStartDate(start, "18000101", '%Y%m%d'),
+                                                    end_date=today,
+                                                    adjust="")))
+
+    # 复权价格由不复权数据和复权因子在本地生成，不再单独下载一遍复权历史
+    factors = timedFetch("history_fetch", stockCode, fetch_adjust_factors)(stockCode)
+    return stock_zh_a_hist_df, adjust_prices(stock_zh_a_hist_df, factors, "qfq")  # 也可以写成 "qfq" 或 "hfq"
 
-def today_overview(symbol):
+
+def fetchHkHistory(stockCode):
     """
-    获取单只股票今日概览（支持 symbol 为字符串或单元素列表）
+    港股前复权日线（本地增量）
     """
-    if isinstance(symbol, list) and len(symbol) == 1:
-        symbol = symbol[0]
+    import akshare as ak
 
-    df = yf.download(symbol, period="1d", interval="1d", progress=False)
-    if df.empty:
-        return {"股票代码": symbol, "提示": "今日无交易数据"}
+    symbol = stockCode[2:]
+    return fetch_incremental(
+        HISTORY_STORE, "HK", symbol, "qfq", "日期", "收盘",
+        timedFetch("history_fetch", stockCode,
+                   lambda start: ak.stock_hk_hist(symbol=symbol,
+                                                  period="daily",
+                                                  start_date=formatStartDate(start, "19700101", '%Y%m%d'),
+                                                  end_date="22220101",
+                                                  adjust="qfq")))
 
-    row = df.iloc[-1]
 
-    def safe_float(val):
-        if hasattr(val, "iloc"):
-            val = val.iloc[0]
-        return float(val)
+def timedFetch(stage, stockCode, func):
+    """
+    包装一次网络请求：耗时、返回的行数和失败次数记入该股票所在市场的数据源
+    """
+    source = MARKET_PROVIDERS[marketOf(stockCode)]
 
-    def safe_int(val):
-        if hasattr(val, "iloc"):
-            val = val.iloc[0]
-        return int(val)
+    def call(*args):
+        with METRICS.timer(stage, source, stockCode) as timer:
+            result = func(*args)
+            timer.rows = 0 if result is None else len(result)
+        return result
 
-    open_ = safe_float(row['Open'])
-    close = safe_float(row['Close'])
-    high = safe_float(row['High'])
-    low = safe_float(row['Low'])
-    volume = safe_int(row['Volume'])
+    return call
 
-    return {
-        "股票代码": symbol,
-        "当前价格": round(close, 2),
-        "开盘": round(open_, 2),
-        "最高": round(high, 2),
-        "最低": round(low, 2),
-        "收盘": round(close, 2),
-        "成交量": volume
-    }
\ No newline at end of file
+
+def buildResult(stockCode, raw, last, latest):
+    volume = last[MARKET_COLUMNS[raw["market"]]["volume"]]
+    return StockResult.from_latest(stockCode, raw["market"], raw["info"], raw["overview"], latest, volume)
+
+
+def saveCheckpoint(stockCode, result):
+    # 保存数据到文件
+    temp_dir = os.path.join("temp")
+    with open(os.path.join(temp_dir, stockCode + ".json"), "w", encoding="utf-8") as f:
+        f.write(result.to_json())
+
+
+def fetchAInfo(symbol):
+    import akshare as ak
+
+    stock_individual_info_em_df = ak.stock_individual_info_em(symbol=symbol)
+    info = plain_record(dict(zip(stock_individual_info_em_df['item'], stock_individual_info_em_df['value'])))
+    # 随行情变化的字段不进缓存，只保留位置，由 withLatestPrice 按当天的日线填入
+    info.update({field: None for field in A_PRICE_FIELDS if field in info})
+    return info
+
+
+def withLatestPrice(info, close):
+    """
+    用最新收盘价（不复权）填入 A 股资料中随行情变化的字段，返回新的 dict
+    """
+    info = dict(info)
+    for field, shares in A_PRICE_FIELDS.items():
+        if field not in info:
+            continue
+        if shares is None:
+            info[field] = close
+        elif isinstance(info.get(shares), (int, float)):
+            info[field] = info[shares] * close
+        else:
+            info[field] = None
+    return info
+
+
+def fetchHkInfo(symbol):
+    import akshare as ak
+
+    stock_hk_security_profile_em_df = ak.stock_hk_security_profile_em(symbol=symbol)
+    return plain_record(stock_hk_security_profile_em_df.iloc[0])
+
+
+def cachedStockNames(stockCodes):
+    """
+    从股票信息缓存中取名称（不论是否过期），返回 {股票代码: 名称}
+    """
+    names = {}
+    for stockCode in stockCodes:
+        market = marketOf(stockCode)
+        if market is None:
+            continue
+        info, status = METADATA_CACHE.lookup(market, symbolOf(stockCode))
+        name = stockName(info) if info else ""
+        if name:
+            names[stockCode] = name
+    return names
+
+
+def warmMetadata(items, crawlThreadCount, force=False):
+    """
+    批量预热股票信息缓存：获取缓存中没有或已过期的股票（force 为 True 时全部重新获取）
+    """
+    allCodes = [item.split(":")[0] for item in items]
+    stockCodes = [stockCode for stockCode in allCodes if marketOf(stockCode) is not None
+                  and (force or METADATA_CACHE.lookup(marketOf(stockCode), symbolOf(stockCode))[1] != "fresh")]
+    print(f"需要获取股票信息: {len(stockCodes)} 只")
+    asyncio.run(warmAll(stockCodes, crawlThreadCount))
+    # 自选列表中还没有名称的股票顺便补上名称
+    applyStockNames(cachedStockNames([item for item in items if ":" not in item]))
+
+
+async def warmAll(stockCodes, crawlThreadCount):
+    fetchers = {"A": fetchAInfo, "HK": fetchHkInfo, "US": fetch_us_profile}
+    engine = AsyncFetchEngine(crawlThreadCount)
+
+    async def warmOne(stockCode):
+        market = marketOf(stockCode)
+        try:
+            symbol = symbolOf(stockCode)
+            await engine.run_with_retry(stockCode, MARKET_PROVIDERS[market], market, METADATA_CACHE.refresh,
+                                        market, symbol, partial(fetchers[market], symbol))
+        except Exception as e:
+            with open("error.log", "a", encoding="utf-8") as f:
+                f.write(f"{stockCode} 获取股票信息失败：{str(e)}\n")
+
+    try:
+        await asyncio.gather(*(warmOne(stockCode) for stockCode in stockCodes))
+        printFetchReport(engine.report())
+    finally:
+        engine.shutdown()
+
+
+def stockName(stock_info):
+    # 优先取“证券简称”，如果没有就取“股票简称”，都没有就设为 ""
+    return stock_info.get("证券简称") or stock_info.get("股票简称") or stock_info.get("displayName") or ""
+
+
+def applyStockNames(names, fetched=()):
+    """
+    把 {股票代码: 名称} 写回自选列表中还没有名称的条目，并记录 fetched 中股票的获取时间；
+    不在自选列表中的代码（如命令行直接指定的）忽略
+    """
+    try:
+        WATCHLIST.update(names, fetched)
+    except Exception as e:
+        with open("error.log", "a", encoding="utf-8") as f:
+            f.write(str(e) + "\n")
@@ -0,0 +1,210 @@
+import json
+import os
+import sqlite3
+import time
+
+# 自选列表数据库：每只股票一行，以代码为主键
+WATCHLIST_DB = "watchlist.db"
+
+# 旧版的自选列表文件（["代码" 或 "代码:名称", ...]），数据库不存在时自动导入一次
+LEGACY_JSON = "stock_list.json"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    market TEXT,
+    position INTEGER NOT NULL,
+    added_at REAL NOT NULL,
+    fetched_at REAL
+);
+CREATE INDEX IF NOT EXISTS watchlist_position ON watchlist (position);
+"""
+
+
+def code_of(item):
+    # 自选列表条目为 "代码" 或 "代码:名称"
+    return item.split(":")[0]
+
+
+def name_of(item):
+    return item.split(":", 1)[1] if ":" in item else ""
+
+
+def market_of(code):
+    code = code.upper()
+    if code.startswith(("SH", "SZ", "BJ")):
+        return "A"
+    if code.startswith("HK"):
+        return "HK"
+    if code.startswith("US"):
+        return "US"
+    return None
+
+
+class WatchlistStore:
+    """
+    SQLite 自选列表：按代码去重，每次增删改都是一个事务，界面线程和写入阶段可以同时修改；
+    每次操作单独连接，不跨线程共享连接
+    items() 返回与旧版 stock_list.json 相同的 ["代码" 或 "代码:名称", ...]，新添加的在最前面
+    """
+
+    def __init__(self, path=WATCHLIST_DB, legacy_path=LEGACY_JSON):
+        self.path = path
+        self.legacy_path = legacy_path
+
+    def connect(self):
+        migrate = not os.path.exists(self.path)
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL 模式下读不阻塞写，多个线程同时运行时不会互相卡住
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        if migrate and self.legacy_path and os.path.exists(self.legacy_path):
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                self._insert(conn, json.load(f))
+        return conn
+
+    def _insert(self, conn, items, top=False):
+        """
+        在事务中批量添加，已存在的代码跳过；返回实际添加的条数
+        top 为 True 时添加到最前面（保持 items 自身的顺序），否则追加到末尾
+        """
+        with conn:
+            low, high = conn.execute("SELECT MIN(position), MAX(position) FROM watchlist").fetchone()
+            start = ((low or 0) - len(items)) if top else ((high if high is not None else -1) + 1)
+            now = time.time()
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO watchlist (code, name, market, position, added_at) VALUES (?, ?, ?, ?, ?)",
+                [(code_of(item), name_of(item), market_of(code_of(item)), start + i, now)
+                 for i, item in enumerate(items)])
+            return conn.total_changes - before
+
+    def items(self):
+        conn = self.connect()
+        try:
+            rows = conn.execute("SELECT code, name FROM watchlist ORDER BY position").fetchall()
+        finally:
+            conn.close()
+        return [f"{code}:{name}" if name else code for code, name in rows]
+
+    def add(self, item):
+        """
+        添加到最前面；代码已存在时返回 False
+        """
+        conn = self.connect()
+        try:
+            return self._insert(conn, [item], top=True) == 1
+        finally:
+            conn.close()
+
+    def remove(self, code):
+        conn = self.connect()
+        try:
+            with conn:
+                return conn.execute("DELETE FROM watchlist WHERE code = ?", (code,)).rowcount == 1
+        finally:
+            conn.close()
+
+    def update(self, names=None, fetched=()):
+        """
+        names：{股票代码: 名称}，只写入还没有名称的条目；fetched：本次成功获取的股票，记录获取时间
+        """
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany("UPDATE watchlist SET name = ? WHERE code = ? AND name = ''",
+                                 [(name, code) for code, name in (names or {}).items()])
+                now = time.time()
+                conn.executemany("UPDATE watchlist SET fetched_at = ? WHERE code = ?",
+                                 [(now, code) for code in fetched])
+        finally:
+            conn.close()
+
+    def add_all(self, items):
+        """
+        批量追加到末尾（一个事务），已存在的代码跳过；返回添加的条数
+        """
+        conn = self.connect()
+        try:
+            return self._insert(conn, items)
+        finally:
+            conn.close()
+
+    def import_json(self, path):
+        # 旧版格式的 JSON 文件
+        with open(path, "r", encoding="utf-8") as f:
+            return self.add_all(json.load(f))
+
+    def export_json(self, path):
+        # 先写临时文件再替换
+        items = self.items()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False, indent=4)
+        os.replace(path + ".tmp", path)
+        return len(items)
+
+
+class WatchlistModel:
+    """
+    自选列表的内存模型：增删改只修改受影响的条目，并以 (操作, 位置, 条目) 通知监听者，
+    操作为 "insert" / "remove" / "update"；持久化交给 WatchlistStore，不整表重新读取
+    """
+
+    def __init__(self, store: WatchlistStore):
+        self.store = store
+        self.items = store.items()
+        self.listeners = []
+
+    def bind(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, op, index, item):
+        for listener in self.listeners:
+            listener(op, index, item)
+
+    def index(self, code):
+        for i, item in enumerate(self.items):
+            if code_of(item) == code:
+                return i
+        return -1
+
+    def add(self, text):
+        """
+        添加到最前面；代码已存在时返回 False（由数据库主键判断）
+        """
+        if not self.store.add(text):
+            return False
+        self.items.insert(0, text)
+        self.notify("insert", 0, text)
+        return True
+
+    def remove(self, code):
+        self.store.remove(code)
+        index = self.index(code)
+        if index >= 0:
+            item = self.items.pop(index)
+            self.notify("remove", index, item)
+
+    def apply_names(self, names):
+        """
+        一次运行结束后补上新获得的名称（数据库已由写入阶段更新），只通知名称有变化的条目
+        """
+        for i, item in enumerate(self.items):
+            if ":" not in item and item in names:
+                self.items[i] = f"{item}:{names[item]}"
+                self.notify("update", i, self.items[i])
+
+
+if __name__ == "__main__":
+    # 与旧版 JSON 格式互相转换：python watchlist.py import|export 文件路径
+    import sys
+
+    command, path = sys.argv[1], sys.argv[2]
+    store = WatchlistStore()
+    if command == "import":
+        print(f"导入 {store.import_json(path)} 只股票")
+    elif command == "export":
+        print(f"导出 {store.export_json(path)} 只股票到 {path}")
+    else:
+        print("用法: python watchlist.py import|export 文件路径")